@@ -1,9 +1,9 @@
 # Copyright 2017-2023, Valerian Hall-Chen and the Scotty contributors
 # SPDX-License-Identifier: GPL-3.0
 
-from .beam_me_up import beam_me_up
+from .beam_me_up import beam_me_up, beam_me_up_batch
 from .init_bruv import get_parameters_for_Scotty
 from ._version import __version__
 
 
-__all__ = ["beam_me_up", "get_parameters_for_Scotty", "__version__"]
+__all__ = ["beam_me_up", "beam_me_up_batch", "get_parameters_for_Scotty", "__version__"]
@@ -63,6 +63,8 @@ from scipy import integrate as integrate
 from scipy import constants as constants
 import matplotlib.pyplot as plt
 import time
+from dataclasses import replace
+from functools import partial
 import json
 import pathlib
 
@@ -75,20 +77,23 @@ from scotty.fun_general import (
     freq_GHz_to_angular_frequency,
     angular_frequency_to_wavenumber,
     find_Psi_3D_lab,
+    K_magnitude,
 )
 from scotty.fun_general import find_q_lab_Cartesian, find_Psi_3D_lab_Cartesian
 from scotty.fun_general import find_normalised_plasma_freq, find_normalised_gyro_freq
 from scotty.fun_general import find_epsilon_para, find_epsilon_perp, find_epsilon_g
-from scotty.fun_general import find_dbhat_dR, find_dbhat_dZ
 from scotty.fun_general import find_H_Cardano, find_D
 from scotty.fun_evolution import (
+    BeamEvolution,
     beam_evolution_fun,
+    linearised_beam_evolution_fun,
+    linearised_to_beam_parameters,
     pack_beam_parameters,
+    pack_linearised_parameters,
     unpack_beam_parameters,
 )
 
 # For find_B if using efit files directly
-from scotty.fun_CFD import find_dpolflux_dR, find_dpolflux_dZ
 from scotty.density_fit import density_fit, DensityFitLike
 from scotty.geometry import (
     MagneticField,
@@ -98,10 +103,27 @@ from scotty.geometry import (
     CurvySlabField,
     EFITField,
 )
+from scotty.ensemble import METHODS, solve_ensemble
+from scotty.stiff import STIFF_METHODS, solve_switching
+from scotty.sweep import FirstStep, WarmStart
 from scotty.hamiltonian import Hamiltonian, hessians
-from scotty.launch import launch_beam
+from scotty.numba_backend import CompiledHamiltonian, make_hamiltonian
+from scotty.launch import launch_beam, launch_beams, launch_rays
 from scotty.torbeam import Torbeam
-from scotty.ray_solver import propagate_ray
+from scotty.trajectory import BeamTrajectory
+from scotty.ray_solver import (
+    K_cutoff_data,
+    RayEvolution,
+    check_solver_status,
+    handle_no_resonance,
+    make_beam_solver_events,
+    make_ensemble_solver_events,
+    make_solver_events,
+    propagate_beam,
+    propagate_ray,
+    quick_K_cutoffs,
+    ray_tau_points,
+)
 from scotty._version import __version__
 
 # Checks
@@ -109,8 +131,8 @@ from scotty.check_input import check_input
 from scotty.check_output import check_output
 
 # Type hints
-from typing import Optional, Union, Sequence, cast
-from scotty.typing import PathLike, FloatArray
+from typing import Any, Dict, List, Optional, Tuple, Union, Sequence, cast
+from scotty.typing import ArrayLike, PathLike, FloatArray
 
 
 def beam_me_up(
@@ -136,6 +158,17 @@ def beam_me_up(
     delta_K_R: float = 0.1,  # in the same units as K_R
     delta_K_zeta: float = 0.1,  # in the same units as K_zeta
     delta_K_Z: float = 0.1,  # in the same units as K_z
+    derivative_method: str = "finite-difference",
+    backend: str = "numpy",
+    integrator: str = "solve_ivp",
+    single_pass: bool = False,
+    save_trajectory: bool = False,
+    output_sampling: str = "uniform",
+    output_tolerance: Optional[float] = None,
+    Psi_formulation: str = "riccati",
+    warm_start: Optional[WarmStart] = None,
+    localisation_tolerance: Optional[float] = None,
+    max_step: float = 50,
     interp_order=5,  # For the 2D interpolation functions
     len_tau: int = 102,
     rtol: float = 1e-3,  # for solve_ivp of the beam solver
@@ -234,6 +267,82 @@ def beam_me_up(
         Finite difference spacing to use for ``K_zeta``
     delta_K_Z: float
         Finite difference spacing to use for ``K_Z``
+    derivative_method: str
+        How to compute the derivatives of the Hamiltonian, one of
+        ``"finite-difference"`` (using the ``delta_*`` spacings above),
+        ``"analytic"`` or ``"autodiff"``. See `Hamiltonian` for details
+    backend: str
+        Either ``"numpy"`` or ``"numba"``. The latter evaluates the
+        Hamiltonian and beam evolution equations with the compiled
+        kernels in `scotty.numba_backend`, falling back to NumPy with
+        a warning if this isn't possible
+    integrator: str
+        How to integrate the beam equations: either ``"solve_ivp"``,
+        using `scipy.integrate.solve_ivp` with the ``"RK45"`` method,
+        or one of `scotty.ensemble.METHODS` (``"RK45"`` or
+        ``"DOP853"``), using `scotty.ensemble.solve_ensemble`, which
+        keeps its state and stages in preallocated arrays. With the
+        NumPy backend, the latter also evaluates the beam equations
+        with `scotty.fun_evolution.BeamEvolution`. For stiff beams,
+        one of `scotty.stiff.STIFF_METHODS` (``"Radau"``, ``"BDF"``
+        or ``"LSODA"``) uses the implicit solvers of
+        `scipy.integrate.solve_ivp` with the Jacobian from
+        `scotty.fun_evolution.BeamEvolution.jacobian`, and ``"auto"``
+        starts with RK45, switching to ``"Radau"`` if the beam becomes
+        stiff (see `scotty.stiff.solve_switching`)
+    single_pass: bool
+        If ``True``, integrate the beam in one pass, which stops on
+        the same events as the ray solver (leaving the plasma or
+        crossing a resonance) and finds the cut-off itself, instead of
+        tracing a ray first to find where the beam leaves the plasma.
+        See `scotty.ray_solver.propagate_beam`. Requires
+        ``integrator="solve_ivp"``. Not used for ``quick_run``
+    save_trajectory: bool
+        If ``True``, keep the dense output of the beam solver and save
+        it to ``beam_trajectory<output_filename_suffix>.npz``, from
+        which `scotty.trajectory.BeamTrajectory.load` can resample the
+        beam at any ``tau``, arc length or poloidal flux without
+        rerunning the solver. Requires ``integrator="solve_ivp"``
+    output_sampling: str
+        How the output points are placed along the beam: either
+        ``"uniform"`` in ``tau``, or ``"adaptive"``, concentrated
+        around the cut-off and where the localisation and the
+        wavevector vary quickly (see
+        `scotty.trajectory.BeamTrajectory.sample_tau`). For
+        ``"adaptive"``, ``len_tau`` is the budget of points. Requires
+        ``integrator="solve_ivp"``
+    output_tolerance: Optional[float]
+        Relative tolerance for ``output_sampling="adaptive"``. If
+        given, the number of points is chosen to meet it, up to
+        ``len_tau``
+    Psi_formulation: str
+        Either ``"riccati"``, integrating the Riccati equation for
+        ``Psi`` directly, or ``"linearised"``, integrating linear
+        equations for ``P`` and ``Q`` such that ``Psi = P Q^{-1}``
+        (see `scotty.fun_evolution.linearised_beam_evolution_fun`),
+        which stay smooth where ``Psi`` varies rapidly. ``Psi`` is
+        reconstructed for the output. Requires
+        ``integrator="solve_ivp"``, and cannot be combined with
+        ``single_pass``, ``save_trajectory`` or adaptive
+        ``output_sampling``
+    warm_start: Optional[WarmStart]
+        What a previous run with similar launch parameters found out
+        about its beam, as returned by that run, for example from
+        `scotty.sweep.SweepContinuation.nearest`. The solvers start
+        with its step sizes, and the cut-off is found without solving
+        for the ray again (see `scotty.ray_solver.propagate_ray`)
+    localisation_tolerance: Optional[float]
+        If given, stop the beam solver once the localisation has
+        decayed past the cut-off to this fraction of its peak (see
+        `scotty.ray_solver.make_localisation_event`), rather than
+        following the beam all the way out of the plasma. The output
+        points are spread over the shorter beam. Requires
+        ``integrator="solve_ivp"``, and cannot be combined with
+        ``Psi_formulation="linearised"``
+    max_step: float
+        Largest step of the ray solver, and of the beam solver with
+        ``single_pass``. Larger steps are cheaper, but rays which only
+        graze the LCFS may step over it
     find_B_method:
         See `create_magnetic_geometry` for more information.
 
@@ -299,6 +408,13 @@ def beam_me_up(
         If true, then run only the ray tracer and get an analytic
         estimate of the :math:`K` cut-off location
 
+    Returns
+    -------
+    WarmStart
+        What the solvers found out about this beam, to pass as
+        ``warm_start`` to a run with similar launch parameters, or,
+        for ``quick_run``, the `scotty.ray_solver.K_cutoff_data`
+
     """
 
     # major_radius = 0.9
@@ -359,7 +475,7 @@ def beam_me_up(
         delta_Z,
     )
 
-    hamiltonian = Hamiltonian(
+    hamiltonian = make_hamiltonian(
         field,
         launch_angular_frequency,
         mode_flag,
@@ -369,10 +485,48 @@ def beam_me_up(
         delta_K_R,
         delta_K_zeta,
         delta_K_Z,
+        derivative_method=derivative_method,
+        backend=backend,
     )
 
     # Checking input data
     check_input(mode_flag, poloidal_flux_enter, launch_position, field)
+    integrators = ("solve_ivp",) + tuple(METHODS) + tuple(STIFF_METHODS) + ("auto",)
+    if integrator not in integrators:
+        raise ValueError(
+            f"Unknown integrator '{integrator}'. Expected one of {integrators}"
+        )
+    if output_sampling not in ("uniform", "adaptive"):
+        raise ValueError(
+            f"Unknown output_sampling '{output_sampling}'. "
+            "Expected one of ('uniform', 'adaptive')"
+        )
+    if Psi_formulation not in ("riccati", "linearised"):
+        raise ValueError(
+            f"Unknown Psi_formulation '{Psi_formulation}'. "
+            "Expected one of ('riccati', 'linearised')"
+        )
+    if Psi_formulation == "linearised" and (
+        single_pass
+        or save_trajectory
+        or output_sampling == "adaptive"
+        or localisation_tolerance is not None
+    ):
+        raise ValueError(
+            "Psi_formulation='linearised' cannot be combined with single_pass, "
+            "save_trajectory, output_sampling='adaptive' or localisation_tolerance"
+        )
+    for flag, value in (
+        ("Psi_formulation='linearised'", Psi_formulation == "linearised"),
+        ("single_pass=True", single_pass),
+        ("save_trajectory=True", save_trajectory),
+        ("output_sampling='adaptive'", output_sampling == "adaptive"),
+        ("localisation_tolerance", localisation_tolerance is not None),
+    ):
+        if value and integrator != "solve_ivp":
+            raise ValueError(
+                f"{flag} requires integrator='solve_ivp', not '{integrator}'"
+            )
 
     # -------------------
     # Launch parameters
@@ -426,22 +580,28 @@ def beam_me_up(
     # Propagate the ray
 
     print("Starting the solvers")
-    ray_solver_output = propagate_ray(
-        poloidal_flux_enter,
-        launch_angular_frequency,
-        field,
-        initial_position,
-        K_initial,
-        hamiltonian,
-        rtol,
-        atol,
-        quick_run,
-        len_tau,
-    )
-    if quick_run:
-        return ray_solver_output
+    # Updated with what the solvers find out about this beam
+    next_warm_start = WarmStart() if warm_start is None else replace(warm_start)
+    if quick_run or not single_pass:
+        ray_solver_output = propagate_ray(
+            poloidal_flux_enter,
+            launch_angular_frequency,
+            field,
+            initial_position,
+            K_initial,
+            hamiltonian,
+            rtol,
+            atol,
+            quick_run,
+            len_tau,
+            warm_start=next_warm_start,
+            max_step=max_step,
+            cutoff_from_events=warm_start is not None,
+        )
+        if quick_run:
+            return ray_solver_output
 
-    tau_leave, tau_points = cast(tuple, ray_solver_output)
+        tau_leave, tau_points = cast(tuple, ray_solver_output)
 
     # -------------------
     # Propagate the beam
@@ -456,33 +616,208 @@ def beam_me_up(
         Psi_3D_lab_initial,
     )
 
+    if isinstance(hamiltonian, CompiledHamiltonian):
+        evolution_fun = hamiltonian.beam_evolution_fun
+        evolution_args: tuple = (K_zeta_initial,)
+    elif integrator == "solve_ivp":
+        evolution_fun = beam_evolution_fun
+        evolution_args = (K_zeta_initial, hamiltonian)
+    else:
+        evolution_fun = BeamEvolution(hamiltonian, K_zeta_initial)
+        evolution_args = ()
+
     solver_start_time = time.time()
 
-    solver_beam_output = integrate.solve_ivp(
-        beam_evolution_fun,
-        [0, tau_leave],
-        beam_parameters_initial,
-        method="RK45",
-        t_eval=tau_points,
-        dense_output=False,
-        events=None,
-        vectorized=False,
-        args=(K_zeta_initial, hamiltonian),
-        rtol=rtol,
-        atol=atol,
-    )
+    if single_pass:
+        solver_beam_output = propagate_beam(
+            poloidal_flux_enter,
+            launch_angular_frequency,
+            field,
+            beam_parameters_initial,
+            K_zeta_initial,
+            hamiltonian,
+            evolution_fun,
+            evolution_args,
+            rtol,
+            atol,
+            len_tau,
+            first_step=next_warm_start.beam_first_step,
+            localisation_tolerance=localisation_tolerance,
+            max_step=max_step,
+        )
+        beam_parameters = solver_beam_output.y
+        tau_array = solver_beam_output.t
+        solver_status = solver_beam_output.status
+        number_of_evaluations = solver_beam_output.nfev
+    elif integrator == "solve_ivp" and Psi_formulation == "linearised":
+        solver_beam_output = integrate.solve_ivp(
+            linearised_beam_evolution_fun,
+            [0, tau_leave],
+            pack_linearised_parameters(
+                initial_position[0],
+                initial_position[1],
+                initial_position[2],
+                K_R_initial,
+                K_Z_initial,
+                Psi_3D_lab_initial,
+                np.eye(3),
+            ),
+            method="RK45",
+            t_eval=tau_points,
+            args=(K_zeta_initial, hamiltonian),
+            rtol=rtol,
+            atol=atol,
+        )
+        beam_parameters = linearised_to_beam_parameters(solver_beam_output.y)
+        tau_array = solver_beam_output.t
+        solver_status = solver_beam_output.status
+        number_of_evaluations = solver_beam_output.nfev
+    elif integrator == "solve_ivp":
+        first_step = FirstStep()
+        solver_beam_events: list = [first_step]
+        if localisation_tolerance is not None:
+            solver_beam_events.insert(
+                0,
+                make_beam_solver_events(
+                    poloidal_flux_enter,
+                    launch_angular_frequency,
+                    field,
+                    K_zeta_initial,
+                    hamiltonian,
+                    localisation_tolerance,
+                )["localisation_converged"],
+            )
+        solver_beam_output = integrate.solve_ivp(
+            evolution_fun,
+            [0, tau_leave],
+            beam_parameters_initial,
+            method="RK45",
+            t_eval=tau_points,
+            dense_output=(
+                save_trajectory
+                or output_sampling == "adaptive"
+                or localisation_tolerance is not None
+            ),
+            events=solver_beam_events,
+            vectorized=False,
+            args=evolution_args,
+            rtol=rtol,
+            atol=atol,
+            first_step=next_warm_start.beam_first_step,
+        )
+        next_warm_start.beam_first_step = first_step.step
+        if localisation_tolerance is not None and len(solver_beam_output.t_events[0]):
+            tau_leave = solver_beam_output.t_events[0][0]
+            print(f"Localisation converged at tau = {tau_leave}")
+            # Spread the output points over the shorter beam
+            tau_points = np.linspace(0, tau_leave, len_tau - 1, endpoint=False)
+            tau_cutoff = next_warm_start.tau_cutoff
+            if tau_cutoff is not None and tau_cutoff < tau_leave:
+                tau_points = np.sort(np.append(tau_points, tau_cutoff))
+            solver_beam_output.t = tau_points
+            solver_beam_output.y = solver_beam_output.sol(tau_points)
+        beam_parameters = solver_beam_output.y
+        tau_array = solver_beam_output.t
+        solver_status = solver_beam_output.status
+        number_of_evaluations = solver_beam_output.nfev
+    elif integrator in STIFF_METHODS or integrator == "auto":
+        jacobian = BeamEvolution(hamiltonian, K_zeta_initial).jacobian
+
+        def beam_jacobian(tau, beam_parameters, *args):
+            return jacobian(tau, beam_parameters)
+
+        if integrator == "auto":
+            solver_beam_output = solve_switching(
+                evolution_fun,
+                [0, tau_leave],
+                beam_parameters_initial,
+                t_eval=tau_points,
+                jac=beam_jacobian,
+                args=evolution_args,
+                rtol=rtol,
+                atol=atol,
+            )
+            if solver_beam_output.t_switch is not None:
+                print(
+                    f"Beam became stiff, switched to Radau at tau = {solver_beam_output.t_switch}"
+                )
+        else:
+            solver_beam_output = integrate.solve_ivp(
+                evolution_fun,
+                [0, tau_leave],
+                beam_parameters_initial,
+                method=integrator,
+                t_eval=tau_points,
+                jac=beam_jacobian,
+                args=evolution_args,
+                rtol=rtol,
+                atol=atol,
+            )
+        beam_parameters = solver_beam_output.y
+        tau_array = solver_beam_output.t
+        solver_status = solver_beam_output.status
+        number_of_evaluations = solver_beam_output.nfev
+    else:
+        ensemble_fun = evolution_fun
+        if isinstance(hamiltonian, CompiledHamiltonian):
+            # The compiled kernel only takes a single beam
+
+            def ensemble_fun(tau, beam_parameters, index, out=None):
+                if out is None:
+                    out = np.empty_like(beam_parameters)
+                out[:, 0] = evolution_fun(
+                    tau[0], beam_parameters[:, 0], *evolution_args
+                )
+                return out
+
+        ensemble_output = solve_ensemble(
+            ensemble_fun,
+            0.0,
+            tau_leave,
+            beam_parameters_initial[:, np.newaxis],
+            t_eval=[tau_points],
+            rtol=rtol,
+            atol=atol,
+            method=integrator,
+        )
+        beam_parameters = ensemble_output.y[0]
+        tau_array = ensemble_output.t[0]
+        solver_status = ensemble_output.status[0]
+        number_of_evaluations = ensemble_output.nfev
 
     solver_end_time = time.time()
     solver_time = solver_end_time - solver_start_time
     print(f"Time taken (beam solver) {solver_time}s")
-    print(f"Number of beam evolution evaluations: {solver_beam_output.nfev}")
-    print(
-        f"Time per beam evolution evaluation: {solver_time / solver_beam_output.nfev}"
-    )
-
-    beam_parameters = solver_beam_output.y
-    tau_array = solver_beam_output.t
-    solver_status = solver_beam_output.status
+    if single_pass:
+        next_warm_start.beam_first_step = float(
+            np.diff(solver_beam_output.sol.ts[:2])[0]
+        )
+    if save_trajectory or output_sampling == "adaptive":
+        trajectory = BeamTrajectory.from_ode_solution(
+            solver_beam_output.sol,
+            K_zeta_initial,
+            solver_beam_output.tau_leave if single_pass else tau_leave,
+        )
+    if output_sampling == "adaptive":
+        # Keep the cut-off point found by the ray or beam solver
+        tau_cutoff = tau_array[
+            np.argmin(
+                K_magnitude(
+                    beam_parameters[3],
+                    K_zeta_initial,
+                    beam_parameters[4],
+                    beam_parameters[0],
+                )
+            )
+        ]
+        tau_array = np.union1d(
+            trajectory.sample_tau(len_tau - 1, output_tolerance), tau_cutoff
+        )
+        beam_parameters = trajectory(tau_array)
+    if save_trajectory:
+        trajectory.save(output_path / f"beam_trajectory{output_filename_suffix}")
+    print(f"Number of beam evolution evaluations: {number_of_evaluations}")
+    print(f"Time per beam evolution evaluation: {solver_time / number_of_evaluations}")
 
     numberOfDataPoints = len(tau_array)
 
@@ -548,8 +883,13 @@ def beam_me_up(
     # Generates additional data along the path of the beam
     # -------------------
 
-    # Calculate various properties along the ray
-    poloidal_flux_output = field.poloidal_flux(q_R_array, q_Z_array)
+    # Calculate various properties along the ray. The equilibrium is
+    # evaluated along the ray and either side of it in R and Z, for the
+    # finite difference gradients below, all in one go
+    offsets_R = np.array([0.0, delta_R, -delta_R, 0.0, 0.0])[:, np.newaxis]
+    offsets_Z = np.array([0.0, 0.0, 0.0, delta_Z, -delta_Z])[:, np.newaxis]
+    field_output = field.evaluate(q_R_array + offsets_R, q_Z_array + offsets_Z)
+    poloidal_flux_output = field_output["polflux"][0]
     electron_density_output = np.asfarray(find_density_1D(poloidal_flux_output))
 
     dH = hamiltonian.derivatives(
@@ -574,21 +914,18 @@ def beam_me_up(
 
     # Calculates b_hat and grad_b_hat
     b_hat_output = np.zeros([numberOfDataPoints, 3])
-    B_R_output = field.B_R(q_R_array, q_Z_array)
-    B_T_output = field.B_T(q_R_array, q_Z_array)
-    B_Z_output = field.B_Z(q_R_array, q_Z_array)
-    B_magnitude = np.sqrt(B_R_output**2 + B_T_output**2 + B_Z_output**2)
+    B_vectors = np.array([field_output[name] for name in ("B_R", "B_T", "B_Z")])
+    B_R_output, B_T_output, B_Z_output = B_vectors[:, 0]
+    B_magnitudes = np.sqrt(B_vectors[0] ** 2 + B_vectors[1] ** 2 + B_vectors[2] ** 2)
+    B_magnitude = B_magnitudes[0]
     b_hat_output[:, 0] = B_R_output / B_magnitude
     b_hat_output[:, 1] = B_T_output / B_magnitude
     b_hat_output[:, 2] = B_Z_output / B_magnitude
 
     grad_bhat_output = np.zeros([numberOfDataPoints, 3, 3])
-    dbhat_dR = find_dbhat_dR(
-        q_R_array, q_Z_array, delta_R, field.B_R, field.B_T, field.B_Z
-    )
-    dbhat_dZ = find_dbhat_dZ(
-        q_R_array, q_Z_array, delta_Z, field.B_R, field.B_T, field.B_Z
-    )
+    b_hat_offsets = B_vectors / B_magnitudes
+    dbhat_dR = (b_hat_offsets[:, 1] - b_hat_offsets[:, 2]) / (2 * delta_R)
+    dbhat_dZ = (b_hat_offsets[:, 3] - b_hat_offsets[:, 4]) / (2 * delta_Z)
     # Transpose dbhat_dR so that it has the right shape
     grad_bhat_output[:, 0, :] = dbhat_dR.T
     grad_bhat_output[:, 2, :] = dbhat_dZ.T
@@ -623,27 +960,17 @@ def beam_me_up(
     # But good for checking whether things are working properly
     # -------------------
     #
-    H_output = hamiltonian(q_R_array, q_Z_array, K_R_array, K_zeta_initial, K_Z_array)
-    # Create and immediately evaluate a Hamiltonian with the opposite mode
-    H_other = Hamiltonian(
-        field,
-        launch_angular_frequency,
-        -mode_flag,
-        find_density_1D,
-        delta_R,
-        delta_Z,
-        delta_K_R,
-        delta_K_zeta,
-        delta_K_Z,
-    )(q_R_array, q_Z_array, K_R_array, K_zeta_initial, K_Z_array)
+    # Both mode branches from a single evaluation of the equilibrium
+    H_branches = hamiltonian.mode_branches(
+        q_R_array, q_Z_array, K_R_array, K_zeta_initial, K_Z_array
+    )
+    H_output = H_branches["H"]
+    H_other = H_branches["H_other"]
 
     # Gradients of poloidal flux along the ray
-    dpolflux_dR_debugging = find_dpolflux_dR(
-        q_R_array, q_Z_array, delta_R, field.poloidal_flux
-    )
-    dpolflux_dZ_debugging = find_dpolflux_dZ(
-        q_R_array, q_Z_array, delta_Z, field.poloidal_flux
-    )
+    polflux_offsets = field_output["polflux"]
+    dpolflux_dR_debugging = (polflux_offsets[1] - polflux_offsets[2]) / (2 * delta_R)
+    dpolflux_dZ_debugging = (polflux_offsets[3] - polflux_offsets[4]) / (2 * delta_Z)
 
     # -------------------
     # This saves the data generated by the main loop and the input data
@@ -1929,7 +2256,506 @@ def beam_me_up(
         print("Figures have been saved")
     # -------------------
 
-    return None
+    return next_warm_start
+
+
+def beam_me_up_batch(
+    poloidal_launch_angle_Torbeam: ArrayLike,
+    toroidal_launch_angle_Torbeam: ArrayLike,
+    launch_freq_GHz: ArrayLike,
+    mode_flag: ArrayLike,
+    launch_beam_width: ArrayLike,
+    launch_beam_curvature: ArrayLike,
+    launch_position: FloatArray,
+    # keyword arguments begin
+    find_B_method: Union[str, MagneticField] = "torbeam",
+    density_fit_parameters: Optional[Sequence] = None,
+    shot=None,
+    equil_time=None,
+    vacuum_propagation_flag: bool = False,
+    Psi_BC_flag: bool = False,
+    poloidal_flux_enter: float = 1.0,
+    # Finite-difference and solver parameters
+    delta_R: float = -0.0001,
+    delta_Z: float = 0.0001,
+    delta_K_R: float = 0.1,
+    delta_K_zeta: float = 0.1,
+    delta_K_Z: float = 0.1,
+    derivative_method: str = "finite-difference",
+    integrator: str = "RK45",
+    interp_order=5,
+    len_tau: int = 102,
+    rtol: float = 1e-3,
+    atol: float = 1e-6,
+    max_step: float = 50,
+    interp_smoothing=0,
+    # Input settings
+    ne_data_path=pathlib.Path("."),
+    magnetic_data_path=pathlib.Path("."),
+    input_filename_suffix="",
+    density_fit_method: Optional[Union[str, DensityFitLike]] = None,
+    # For circular flux surfaces
+    B_T_axis=None,
+    B_p_a=None,
+    R_axis=None,
+    minor_radius_a=None,
+) -> List[Dict[str, Any]]:
+    r"""Trace a batch of beams launched from vacuum, integrating all
+    of them together
+
+    The launch parameters are broadcast against each other, with
+    ``launch_position`` having the ``R, zeta, Z`` components along its
+    last axis, so that for example a sweep over poloidal angles and
+    frequencies can be done by passing those as arrays of shapes
+    ``(n, 1)`` and ``(m,)``. The beams are launched, and their rays
+    traced together to find where each leaves the plasma, as in
+    `beam_me_up`. The beams are then integrated simultaneously with
+    `scotty.ensemble.solve_ensemble`, which evaluates the beam
+    equations for all of them in one vectorised call per stage, while
+    keeping the adaptive step size and end point of each beam separate.
+
+    This only runs the solvers, without the analysis, output files or
+    figures of `beam_me_up`. The keyword arguments have the same
+    meaning as there, except that ``integrator`` must be one of
+    `scotty.ensemble.METHODS`. Only the NumPy backend is used, as the
+    compiled one is limited to a single frequency and mode.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        For each beam, in the order of the flattened broadcast launch
+        parameters, its launch parameters and the same solver output
+        as `beam_me_up` saves in ``solver_output.npz``, along with
+        ``K_zeta_initial``
+
+    """
+
+    launch_position = np.asfarray(launch_position)
+    launch_parameters = np.broadcast_arrays(
+        poloidal_launch_angle_Torbeam,
+        toroidal_launch_angle_Torbeam,
+        launch_freq_GHz,
+        mode_flag,
+        launch_beam_width,
+        launch_beam_curvature,
+        launch_position[..., 0],
+    )
+    shape = launch_parameters[0].shape
+    (
+        poloidal_angles,
+        toroidal_angles,
+        frequencies_GHz,
+        mode_flags,
+        beam_widths,
+        beam_curvatures,
+    ) = [np.ravel(parameter) for parameter in launch_parameters[:-1]]
+    launch_positions = np.broadcast_to(launch_position, shape + (3,)).reshape(-1, 3)
+    mode_flags = mode_flags.astype(int)
+    launch_angular_frequencies = freq_GHz_to_angular_frequency(frequencies_GHz)
+    n_beams = len(poloidal_angles)
+
+    field, hamiltonian = _make_batch_hamiltonian(
+        launch_angular_frequencies,
+        mode_flags,
+        find_B_method,
+        density_fit_parameters,
+        shot,
+        equil_time,
+        poloidal_flux_enter,
+        delta_R,
+        delta_Z,
+        delta_K_R,
+        delta_K_zeta,
+        delta_K_Z,
+        derivative_method,
+        interp_order,
+        interp_smoothing,
+        ne_data_path,
+        magnetic_data_path,
+        input_filename_suffix,
+        density_fit_method,
+        B_T_axis,
+        B_p_a,
+        R_axis,
+        minor_radius_a,
+    )
+
+    # -------------------
+    # Launch all the beams together, and find where each leaves the
+    # plasma
+    for beam in range(n_beams):
+        check_input(
+            mode_flags[beam], poloidal_flux_enter, launch_positions[beam], field
+        )
+    K_initial, initial_position, *_, Psi_3D_lab_initial = launch_beams(
+        toroidal_launch_angle_Torbeam=toroidal_angles,
+        poloidal_launch_angle_Torbeam=poloidal_angles,
+        launch_beam_width=beam_widths,
+        launch_beam_curvature=beam_curvatures,
+        launch_position=launch_positions,
+        launch_angular_frequency=launch_angular_frequencies,
+        field=field,
+        hamiltonian=hamiltonian,
+        vacuum_propagation_flag=vacuum_propagation_flag,
+        Psi_BC_flag=Psi_BC_flag,
+        poloidal_flux_enter=poloidal_flux_enter,
+        delta_R=delta_R,
+        delta_Z=delta_Z,
+    )[:4]
+    K_R_initial, K_zeta_initial, K_Z_initial = K_initial
+    beam_parameters_initial = pack_beam_parameters(
+        initial_position[0],
+        initial_position[1],
+        initial_position[2],
+        K_R_initial,
+        K_Z_initial,
+        Psi_3D_lab_initial,
+    )
+
+    # Trace all the rays together, as in `scan_cutoffs`, keeping the
+    # steps for the beams that need the cut-off finder
+    ray_events = make_ensemble_solver_events(
+        poloidal_flux_enter,
+        launch_angular_frequencies,
+        field,
+        K_zeta_initial,
+        hamiltonian,
+    )
+    solver_start_time = time.time()
+    ray_solution = solve_ensemble(
+        RayEvolution(hamiltonian, K_zeta_initial),
+        0.0,
+        1e5,
+        np.array([initial_position[0], initial_position[2], K_R_initial, K_Z_initial]),
+        events=list(ray_events.values()),
+        rtol=rtol,
+        atol=atol,
+        max_step=max_step,
+        method=integrator,
+    )
+    print(f"Time taken (ray solver, {n_beams} rays) {time.time() - solver_start_time}s")
+
+    tau_leave = np.empty(n_beams)
+    tau_points = []
+    for beam in range(n_beams):
+        check_solver_status(ray_solution.status[beam])
+        tau_leave[beam], beam_tau_points, _ = ray_tau_points(
+            dict(zip(ray_events, ray_solution.t_events[beam])),
+            dict(zip(ray_events, ray_solution.y_events[beam])),
+            K_zeta_initial[beam],
+            len_tau,
+            partial(
+                handle_no_resonance,
+                ray_solution.t[beam],
+                ray_solution.y[beam],
+                K_zeta=K_zeta_initial[beam],
+                solver_arguments=(K_zeta_initial[beam], hamiltonian.select(beam)),
+                event_leave_plasma=make_solver_events(
+                    poloidal_flux_enter, launch_angular_frequencies[beam], field
+                )["leave_plasma"],
+            ),
+        )
+        tau_points.append(beam_tau_points)
+
+    # -------------------
+    # Propagate all the beams together
+
+    solver_start_time = time.time()
+    solution = solve_ensemble(
+        BeamEvolution(hamiltonian, K_zeta_initial),
+        0.0,
+        tau_leave,
+        beam_parameters_initial,
+        t_eval=tau_points,
+        rtol=rtol,
+        atol=atol,
+        method=integrator,
+    )
+    solver_time = time.time() - solver_start_time
+    print(f"Time taken (beam solver, {n_beams} beams) {solver_time}s")
+    print(f"Number of ensemble evolution evaluations: {solution.nfev}")
+
+    output = []
+    for beam in range(n_beams):
+        (
+            q_R_array,
+            q_zeta_array,
+            q_Z_array,
+            K_R_array,
+            K_Z_array,
+            Psi_3D_output,
+        ) = unpack_beam_parameters(solution.y[beam])
+        output.append(
+            {
+                "poloidal_launch_angle_Torbeam": poloidal_angles[beam],
+                "toroidal_launch_angle_Torbeam": toroidal_angles[beam],
+                "launch_freq_GHz": frequencies_GHz[beam],
+                "mode_flag": mode_flags[beam],
+                "launch_beam_width": beam_widths[beam],
+                "launch_beam_curvature": beam_curvatures[beam],
+                "launch_position": launch_positions[beam],
+                "solver_status": solution.status[beam],
+                "tau_array": solution.t[beam],
+                "q_R_array": q_R_array,
+                "q_zeta_array": q_zeta_array,
+                "q_Z_array": q_Z_array,
+                "K_R_array": K_R_array,
+                "K_Z_array": K_Z_array,
+                "K_zeta_initial": K_zeta_initial[beam],
+                "Psi_3D_output": Psi_3D_output,
+            }
+        )
+    return output
+
+
+def _make_batch_hamiltonian(
+    launch_angular_frequencies: FloatArray,
+    mode_flags: np.ndarray,
+    find_B_method: Union[str, MagneticField],
+    density_fit_parameters: Optional[Sequence],
+    shot,
+    equil_time,
+    poloidal_flux_enter: float,
+    delta_R: float,
+    delta_Z: float,
+    delta_K_R: float,
+    delta_K_zeta: float,
+    delta_K_Z: float,
+    derivative_method: str,
+    interp_order,
+    interp_smoothing,
+    ne_data_path,
+    magnetic_data_path,
+    input_filename_suffix,
+    density_fit_method: Optional[Union[str, DensityFitLike]],
+    B_T_axis,
+    B_p_a,
+    R_axis,
+    minor_radius_a,
+) -> Tuple[MagneticField, Hamiltonian]:
+    """The magnetic field, and a Hamiltonian for a batch of
+    frequencies and modes, from the arguments of `beam_me_up_batch`"""
+
+    ne_data_path = pathlib.Path(ne_data_path)
+    magnetic_data_path = pathlib.Path(magnetic_data_path)
+
+    if density_fit_parameters is None and (
+        density_fit_method in [None, "smoothing-spline-file"]
+    ):
+        ne_filename = ne_data_path / f"ne{input_filename_suffix}.dat"
+        density_fit_parameters = [ne_filename, interp_order, interp_smoothing]
+    else:
+        ne_filename = None
+
+    find_density_1D = make_density_fit(
+        density_fit_method, poloidal_flux_enter, density_fit_parameters, ne_filename
+    )
+
+    field = create_magnetic_geometry(
+        find_B_method,
+        magnetic_data_path,
+        input_filename_suffix,
+        interp_order,
+        interp_smoothing,
+        B_T_axis,
+        R_axis,
+        minor_radius_a,
+        B_p_a,
+        shot,
+        equil_time,
+        delta_R,
+        delta_Z,
+    )
+
+    hamiltonian = Hamiltonian(
+        field,
+        launch_angular_frequencies,
+        mode_flags,
+        find_density_1D,
+        delta_R,
+        delta_Z,
+        delta_K_R,
+        delta_K_zeta,
+        delta_K_Z,
+        derivative_method=derivative_method,
+    )
+    return field, hamiltonian
+
+
+def scan_cutoffs(
+    poloidal_launch_angle_Torbeam: ArrayLike,
+    toroidal_launch_angle_Torbeam: ArrayLike,
+    launch_freq_GHz: ArrayLike,
+    mode_flag: ArrayLike,
+    launch_position: FloatArray,
+    # keyword arguments begin
+    find_B_method: Union[str, MagneticField] = "torbeam",
+    density_fit_parameters: Optional[Sequence] = None,
+    shot=None,
+    equil_time=None,
+    poloidal_flux_enter: float = 1.0,
+    # Finite-difference and solver parameters
+    delta_R: float = -0.0001,
+    delta_Z: float = 0.0001,
+    delta_K_R: float = 0.1,
+    delta_K_zeta: float = 0.1,
+    delta_K_Z: float = 0.1,
+    derivative_method: str = "finite-difference",
+    integrator: str = "RK45",
+    interp_order=5,
+    rtol: float = 1e-3,
+    atol: float = 1e-6,
+    max_step: float = 50,
+    interp_smoothing=0,
+    # Input settings
+    ne_data_path=pathlib.Path("."),
+    magnetic_data_path=pathlib.Path("."),
+    input_filename_suffix="",
+    density_fit_method: Optional[Union[str, DensityFitLike]] = None,
+    # For circular flux surfaces
+    B_T_axis=None,
+    B_p_a=None,
+    R_axis=None,
+    minor_radius_a=None,
+) -> K_cutoff_data:
+    r"""Estimate the cut-off of rays launched from vacuum over a grid of
+    launch parameters, as ``beam_me_up(..., quick_run=True)`` does for
+    a single one, integrating all the rays together.
+
+    The launch parameters are broadcast against each other, as in
+    `beam_me_up_batch`. The rays are launched with
+    `scotty.launch.launch_rays`, and integrated simultaneously with
+    `scotty.ensemble.solve_ensemble`, each until it leaves the plasma
+    or simulation, or crosses a resonance, using the same events as
+    `scotty.ray_solver.propagate_ray`. The cut-off of each ray is
+    then its turning point of :math:`|K|` with the smallest
+    :math:`|K|`, as in `scotty.ray_solver.quick_K_cutoff`.
+
+    The keyword arguments have the same meaning as for
+    `beam_me_up_batch`, with ``max_step`` as for `beam_me_up`.
+
+    Returns
+    -------
+    K_cutoff_data
+        With an array of each quantity, of the broadcast shape of the
+        launch parameters. Rays which miss the plasma, don't reach a
+        cut-off, or for which the solver fails, are NaN
+
+    """
+
+    launch_position = np.asfarray(launch_position)
+    launch_parameters = np.broadcast_arrays(
+        poloidal_launch_angle_Torbeam,
+        toroidal_launch_angle_Torbeam,
+        launch_freq_GHz,
+        mode_flag,
+        launch_position[..., 0],
+    )
+    shape = launch_parameters[0].shape
+    poloidal_angles, toroidal_angles, frequencies_GHz, mode_flags = [
+        np.ravel(parameter) for parameter in launch_parameters[:-1]
+    ]
+    launch_positions = np.broadcast_to(launch_position, shape + (3,)).reshape(-1, 3)
+    mode_flags = mode_flags.astype(int)
+    launch_angular_frequencies = freq_GHz_to_angular_frequency(frequencies_GHz)
+
+    field, hamiltonian = _make_batch_hamiltonian(
+        launch_angular_frequencies,
+        mode_flags,
+        find_B_method,
+        density_fit_parameters,
+        shot,
+        equil_time,
+        poloidal_flux_enter,
+        delta_R,
+        delta_Z,
+        delta_K_R,
+        delta_K_zeta,
+        delta_K_Z,
+        derivative_method,
+        interp_order,
+        interp_smoothing,
+        ne_data_path,
+        magnetic_data_path,
+        input_filename_suffix,
+        density_fit_method,
+        B_T_axis,
+        B_p_a,
+        R_axis,
+        minor_radius_a,
+    )
+    for mode, *position in np.unique(
+        np.column_stack((mode_flags, launch_positions)), axis=0
+    ):
+        check_input(int(mode), poloidal_flux_enter, np.array(position), field)
+
+    launch_start_time = time.time()
+    K_initial, initial_position, hits_plasma = launch_rays(
+        toroidal_angles,
+        poloidal_angles,
+        launch_positions,
+        launch_angular_frequencies,
+        field,
+        poloidal_flux_enter,
+    )
+    print(
+        f"Time taken (launch, {len(poloidal_angles)} rays) {time.time() - launch_start_time}s"
+    )
+
+    # Only the rays which enter the plasma are integrated
+    rays = np.flatnonzero(hits_plasma)
+    K_zeta_initial = K_initial[1, rays]
+    ray_hamiltonian = hamiltonian.select(rays)
+    ray_events = make_ensemble_solver_events(
+        poloidal_flux_enter,
+        launch_angular_frequencies[rays],
+        field,
+        K_zeta_initial,
+        ray_hamiltonian,
+    )
+
+    solver_start_time = time.time()
+    solution = solve_ensemble(
+        RayEvolution(ray_hamiltonian, K_zeta_initial),
+        0.0,
+        1e5,
+        np.array(
+            [
+                initial_position[0, rays],
+                initial_position[2, rays],
+                K_initial[0, rays],
+                K_initial[2, rays],
+            ]
+        ),
+        # Only the events are needed, not the rays themselves
+        t_eval=[np.empty(0)] * len(rays),
+        events=list(ray_events.values()),
+        rtol=rtol,
+        atol=atol,
+        max_step=max_step,
+        method=integrator,
+    )
+    print(
+        f"Time taken (ray solver, {len(rays)} rays) {time.time() - solver_start_time}s"
+    )
+    print(f"Number of ensemble evolution evaluations: {solution.nfev}")
+
+    reach_K_min = list(ray_events).index("reach_K_min")
+    cutoffs = quick_K_cutoffs(
+        [y_events[reach_K_min] for y_events in solution.y_events],
+        K_zeta_initial,
+        field,
+    )
+
+    # Rays whose integration failed are treated like those that miss
+    solved = solution.status != -1
+
+    def per_launch(value):
+        result = np.full(len(poloidal_angles), np.nan)
+        result[rays[solved]] = value[solved]
+        return result.reshape(shape)
+
+    return K_cutoff_data(*(per_launch(value) for value in vars(cutoffs).values()))
 
 
 def make_density_fit(
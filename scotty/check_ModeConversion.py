@@ -20,6 +20,7 @@ from scotty.fun_general import (
     make_unit_vector_from_cross_product,
     find_vec_lab_Cartesian,
 )
+from scotty.hamiltonian import refractive_index_squared
 import math
 from scipy import constants, integrate
 import sys
@@ -82,24 +83,6 @@ def plot(suffix=""):
     )
     numberOfDataPoints = np.size(q_R_array)
 
-    def find_N(Booker_alpha, Booker_beta, Booker_gamma, mode_flag):
-        N = np.sqrt(
-            -(
-                Booker_beta
-                - mode_flag
-                * np.sqrt(
-                    np.maximum(
-                        np.zeros_like(Booker_beta),
-                        (Booker_beta**2 - 4 * Booker_alpha * Booker_gamma),
-                    )
-                )
-                # np.sqrt(Booker_beta**2 - 4*Booker_alpha*Booker_gamma)
-            )
-            / (2 * Booker_alpha)
-        )
-
-        return N
-
     # ---
     sin_theta_m_sq = (np.sin(theta_m_output)) ** 2
     Booker_alpha = epsilon_para_output * sin_theta_m_sq + epsilon_perp_output * (
@@ -112,8 +95,15 @@ def plot(suffix=""):
         epsilon_perp_output**2 - epsilon_g_output**2
     )
 
-    N_X = find_N(Booker_alpha, Booker_beta, Booker_gamma, -1)
-    N_O = find_N(Booker_alpha, Booker_beta, Booker_gamma, 1)
+    # Due to numerical errors, sometimes the discriminant ends up being
+    # a very small negative number
+    H_discriminant = np.maximum(0, Booker_beta**2 - 4 * Booker_alpha * Booker_gamma)
+    N_X = np.sqrt(
+        refractive_index_squared(Booker_alpha, Booker_beta, H_discriminant, -1)
+    )
+    N_O = np.sqrt(
+        refractive_index_squared(Booker_alpha, Booker_beta, H_discriminant, 1)
+    )
     # ---
 
     # ---
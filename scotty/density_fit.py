@@ -5,6 +5,8 @@ from __future__ import annotations
 from typing import Callable, Optional, List, Dict, Union, Sequence
 from warnings import warn
 
+from scotty.autodiff import apply_univariate
+from scotty.fun_CFD import cfd_gradient
 from scotty.typing import PathLike, ArrayLike
 
 import numpy as np
@@ -14,6 +16,10 @@ from scipy.interpolate import UnivariateSpline
 DensityFitLike = Callable[[ArrayLike], ArrayLike]
 """A callable that can parameterise density in 1D"""
 
+DERIVATIVE_DELTA_POLFLUX = 1e-4
+"""Finite difference spacing in poloidal flux for fits without analytic
+derivatives"""
+
 
 class DensityFit:
     """Base class for density parameterisations.
@@ -21,7 +27,9 @@ class DensityFit:
     Subclasses should implement ``_fit_impl`` which takes a 1D array
     of the poloidal flux and returns the density at those points. This
     base class will handle setting the density to zero outside the
-    plasma.
+    plasma. Subclasses may also implement ``_derivative_impl`` to
+    give analytic derivatives of the fit, otherwise `derivative` uses
+    finite differences.
 
     Parameters
     ==========
@@ -44,6 +52,24 @@ class DensityFit:
     def _fit_impl(self, poloidal_flux: ArrayLike) -> ArrayLike:
         raise NotImplementedError
 
+    def derivative(self, poloidal_flux: ArrayLike, order: int = 1) -> ArrayLike:
+        """Returns the ``order``-th derivative of the density with respect
+        to the poloidal flux at ``poloidal_flux`` points. This is zero
+        outside the plasma"""
+        poloidal_flux = np.asfarray(poloidal_flux)
+        derivative = np.asfarray(self._derivative_impl(poloidal_flux, order))
+        is_inside = poloidal_flux <= self.poloidal_flux_enter
+        return is_inside * derivative
+
+    def _derivative_impl(self, poloidal_flux: ArrayLike, order: int) -> ArrayLike:
+        return cfd_gradient(
+            self._fit_impl,
+            poloidal_flux=poloidal_flux,
+            directions="poloidal_flux",
+            dx=DERIVATIVE_DELTA_POLFLUX,
+            d_order=order,
+        )
+
 
 class QuadraticFit(DensityFit):
     r"""Quadratic fit
@@ -90,6 +116,11 @@ class QuadraticFit(DensityFit):
         poloidal_flux = np.asfarray(poloidal_flux)
         return self.ne_0 - ((self.ne_0 / self.poloidal_flux_enter) * poloidal_flux**2)
 
+    def _derivative_impl(self, poloidal_flux: ArrayLike, order: int) -> ArrayLike:
+        poloidal_flux = np.asfarray(poloidal_flux)
+        coefficients = [-self.ne_0 / self.poloidal_flux_enter, 0.0, self.ne_0]
+        return np.polyval(np.polyder(coefficients, order), poloidal_flux)
+
     def __repr__(self):
         return f"QuadraticFit({self.poloidal_flux_enter}, ne_0={self.ne_0})"
 
@@ -145,6 +176,16 @@ class TanhFit(DensityFit):
             self.ne_1 * (poloidal_flux - self.poloidal_flux_enter)
         )
 
+    def _derivative_impl(self, poloidal_flux: ArrayLike, order: int) -> ArrayLike:
+        poloidal_flux = np.asfarray(poloidal_flux)
+        tanh = np.tanh(self.ne_1 * (poloidal_flux - self.poloidal_flux_enter))
+        sech_2 = 1 - tanh**2
+        if order == 1:
+            return self.ne_0 * self.ne_1 * sech_2
+        if order == 2:
+            return -2 * self.ne_0 * self.ne_1**2 * tanh * sech_2
+        return super()._derivative_impl(poloidal_flux, order)
+
     def __repr__(self):
         return (
             f"TanhFit({self.poloidal_flux_enter}, ne_0={self.ne_0}, ne_1={self.ne_1})"
@@ -177,6 +218,10 @@ class PolynomialFit(DensityFit):
         poloidal_flux = np.asfarray(poloidal_flux)
         return np.polyval(self.coefficients, poloidal_flux)
 
+    def _derivative_impl(self, poloidal_flux: ArrayLike, order: int) -> ArrayLike:
+        poloidal_flux = np.asfarray(poloidal_flux)
+        return np.polyval(np.polyder(self.coefficients, order), poloidal_flux)
+
     def __repr__(self):
         return (
             f"PolynomialFit({self.poloidal_flux_enter}, {', '.join(self.coefficients)})"
@@ -324,7 +369,10 @@ class SmoothingSplineFit(DensityFit):
         )
 
     def _fit_impl(self, poloidal_flux):
-        return self.spline(poloidal_flux)
+        return apply_univariate(lambda x, nu: self.spline(x, nu=nu), poloidal_flux)
+
+    def _derivative_impl(self, poloidal_flux: ArrayLike, order: int) -> ArrayLike:
+        return self.spline(poloidal_flux, nu=order)
 
 
 ##################################################
@@ -0,0 +1,615 @@
+"""Vectorised integration of an ensemble of independent initial value
+problems, such as a batch of beams launched with different parameters.
+
+`solve_ensemble` advances every member of the ensemble together, so
+that the right-hand side is evaluated once per stage for the whole
+batch, rather than once per stage per member. Each member still has
+its own adaptive step size, integration limit, output points and
+events, and the steps it takes are the same as those of
+``scipy.integrate.solve_ivp(method="RK45")`` on that member alone.
+
+"""
+
+# Copyright 2023, Valerian Hall-Chen and Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+from dataclasses import dataclass
+import inspect
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from scipy.integrate import DOP853, RK45
+
+from scotty.typing import ArrayLike, FloatArray
+
+
+# Same step size control as `scipy.integrate.RK45` and `scipy.integrate.DOP853`
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10
+
+METHODS = {"RK45": RK45, "DOP853": DOP853}
+"""Explicit Runge-Kutta methods available in `solve_ensemble`, using
+the coefficients of the corresponding `scipy.integrate` solvers"""
+
+FAILED = -1
+FINISHED = 0
+TERMINATED = 1
+
+EnsembleFun = Callable[[FloatArray, FloatArray, np.ndarray], FloatArray]
+"""Right-hand side of the ensemble: called as ``fun(t, y, index)``
+with ``t`` of shape ``(k,)`` and ``y`` of shape ``(n, k)`` for the
+``k`` members of the ensemble in the integer array ``index``, and
+returning an array of the same shape as ``y``. If it also takes an
+``out`` argument, the stages of each step are written into that
+instead, so that no new arrays are allocated for them"""
+
+
+def _in_place(fun: EnsembleFun) -> Callable:
+    """``fun`` as a function that writes its result into ``out``,
+    copying it there if ``fun`` can't do that itself"""
+    try:
+        if "out" in inspect.signature(fun).parameters:
+            return fun
+    except (TypeError, ValueError):
+        pass
+
+    def in_place(t, y, index, out):
+        out[...] = fun(t, y, index)
+        return out
+
+    return in_place
+
+
+@dataclass
+class EnsembleSolution:
+    """Solution of each member of an ensemble from `solve_ensemble`
+
+    Attributes
+    ----------
+    t
+        Output times for each member
+    y
+        Solution for each member at ``t``, with shape ``(n, len(t))``
+    t_events
+        For each member, a list of the times each event occurred at
+    y_events
+        For each member, a list of the solution at ``t_events``
+    status
+        For each member, ``-1`` if the integration failed, ``0`` if
+        it reached the end of its interval, or ``1`` if it was stopped
+        by a terminal event
+    nfev
+        Number of evaluations of the right-hand side, each of which
+        is for several members at once
+    n_steps
+        Number of accepted steps for each member
+
+    """
+
+    t: List[FloatArray]
+    y: List[FloatArray]
+    t_events: List[List[FloatArray]]
+    y_events: List[List[FloatArray]]
+    status: np.ndarray
+    nfev: int
+    n_steps: np.ndarray
+
+
+def _rms_norm(x: FloatArray) -> FloatArray:
+    """Root-mean-square norm of each column"""
+    return np.sqrt(np.mean(x**2, axis=0))
+
+
+def _select_initial_step(
+    fun: EnsembleFun,
+    t0: FloatArray,
+    y0: FloatArray,
+    f0: FloatArray,
+    direction: FloatArray,
+    rtol: float,
+    atol: float,
+    index: np.ndarray,
+    order: int,
+) -> FloatArray:
+    """Vectorised version of ``scipy.integrate._ivp.common.select_initial_step``"""
+    scale = atol + np.abs(y0) * rtol
+    d0 = _rms_norm(y0 / scale)
+    d1 = _rms_norm(f0 / scale)
+
+    h0 = np.full_like(d0, 1e-6)
+    large = (d0 >= 1e-5) & (d1 >= 1e-5)
+    h0[large] = 0.01 * d0[large] / d1[large]
+
+    y1 = y0 + h0 * direction * f0
+    f1 = fun(t0 + h0 * direction, y1, index)
+    d2 = _rms_norm((f1 - f0) / scale) / h0
+
+    h1 = np.maximum(1e-6, h0 * 1e-3)
+    d_max = np.maximum(d1, d2)
+    varying = d_max > 1e-15
+    h1[varying] = (0.01 / d_max[varying]) ** (1 / (order + 1))
+
+    return np.minimum(100 * h0, h1)
+
+
+def _error_norm(
+    method: type, K: FloatArray, h: FloatArray, scale: FloatArray
+) -> FloatArray:
+    """Norm of the local error estimate of each member, relative to
+    ``scale``, as in ``_estimate_error_norm`` of the scipy solvers"""
+    if method is DOP853:
+        n_equations = scale.shape[0]
+        error_5 = np.sum((np.tensordot(DOP853.E5, K, axes=1) / scale) ** 2, axis=0)
+        error_3 = np.sum((np.tensordot(DOP853.E3, K, axes=1) / scale) ** 2, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            norm = (
+                np.abs(h) * error_5 / np.sqrt((error_5 + 0.01 * error_3) * n_equations)
+            )
+        return np.where((error_5 == 0) & (error_3 == 0), 0.0, norm)
+    return _rms_norm(h * np.tensordot(method.E, K, axes=1) / scale)
+
+
+def _dense_coefficients(
+    method: type,
+    fun: EnsembleFun,
+    K: FloatArray,
+    t_old: FloatArray,
+    h: FloatArray,
+    y_old: FloatArray,
+    y_new: FloatArray,
+    f_new: FloatArray,
+    index: np.ndarray,
+) -> FloatArray:
+    """Coefficients of the interpolating polynomial over the last step
+    of each member in ``index``, with the member along the first axis.
+    For `DOP853`, this needs another three stages"""
+    if method is not DOP853:
+        return np.einsum("snk,sj->knj", K, method.P)
+
+    n_stages = DOP853.n_stages
+    K_extended = np.empty((DOP853.A_EXTRA.shape[1],) + K.shape[1:])
+    K_extended[: n_stages + 1] = K
+    for stage, (a, c) in enumerate(
+        zip(DOP853.A_EXTRA, DOP853.C_EXTRA), start=n_stages + 1
+    ):
+        dy = np.tensordot(a[:stage], K_extended[:stage], axes=1) * h
+        K_extended[stage] = fun(t_old + c * h, y_old + dy, index)
+
+    delta_y = y_new - y_old
+    F = np.empty((len(DOP853.D) + 3,) + y_old.shape)
+    F[0] = delta_y
+    F[1] = h * K[0] - delta_y
+    F[2] = 2 * delta_y - h * (f_new + K[0])
+    F[3:] = h * np.tensordot(DOP853.D, K_extended, axes=1)
+    return np.moveaxis(F, -1, 0)
+
+
+def _dense_output(
+    method: type,
+    t_old: float,
+    h: float,
+    y_old: FloatArray,
+    coefficients: FloatArray,
+    t: FloatArray,
+) -> FloatArray:
+    """Evaluate the interpolant of one step of one member at ``t``"""
+    x = (np.asfarray(t) - t_old) / h
+    if method is DOP853:
+        y = np.zeros((len(y_old), x.size))
+        for i, F in enumerate(coefficients[::-1]):
+            y += F[:, np.newaxis]
+            y *= x if i % 2 == 0 else 1 - x
+        return y + y_old[:, np.newaxis]
+
+    powers = np.cumprod(np.tile(x, (coefficients.shape[1], 1)), axis=0)
+    return y_old[:, np.newaxis] + h * (coefficients @ powers)
+
+
+def _dense_output_members(
+    method: type,
+    t_old: FloatArray,
+    h: FloatArray,
+    y_old: FloatArray,
+    coefficients: FloatArray,
+    t: FloatArray,
+) -> FloatArray:
+    """Evaluate the interpolants of the last steps of several members,
+    each at one time in ``t``, with ``coefficients`` for each member
+    stacked along the first axis"""
+    x = (t - t_old) / h
+    if method is DOP853:
+        y = np.zeros_like(y_old)
+        for i in range(coefficients.shape[1]):
+            y += coefficients[:, -1 - i].T
+            y *= x if i % 2 == 0 else 1 - x
+        return y + y_old
+
+    powers = np.cumprod(np.tile(x, (coefficients.shape[2], 1)), axis=0)
+    return y_old + h * np.einsum("knp,pk->nk", coefficients, powers)
+
+
+def _find_roots(
+    event: Callable,
+    solution: Callable[[FloatArray], FloatArray],
+    members: np.ndarray,
+    t_lower: FloatArray,
+    t_upper: FloatArray,
+    g_lower: FloatArray,
+    g_upper: FloatArray,
+    max_iterations: int = 100,
+) -> FloatArray:
+    """Locate a zero of ``event`` between ``t_lower`` and ``t_upper``
+    for each of ``members`` at once, with the Illinois variant of
+    regula falsi, to the same tolerance as `scipy.integrate.solve_ivp`
+    uses for `scipy.optimize.brentq`. ``solution(t)`` evaluates the
+    state of each member at its own time in ``t``"""
+    a, b = np.array(t_lower, dtype=float), np.array(t_upper, dtype=float)
+    g_a, g_b = np.array(g_lower, dtype=float), np.array(g_upper, dtype=float)
+    # The end of the step is taken if it is a root itself
+    roots = np.where(g_b == 0, b, a)
+    active = np.flatnonzero((g_a != 0) & (g_b != 0))
+    tolerance = 4 * np.finfo(float).eps
+
+    for _ in range(max_iterations):
+        if active.size == 0:
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = b[active] - g_b[active] * (b[active] - a[active]) / (
+                g_b[active] - g_a[active]
+            )
+        # Bisect where the secant doesn't land inside the bracket
+        low = np.minimum(a[active], b[active])
+        high = np.maximum(a[active], b[active])
+        outside = ~((c > low) & (c < high))
+        c[outside] = 0.5 * (low[outside] + high[outside])
+
+        g_c = np.reshape(event(c, solution(c, active), members[active]), -1)
+        opposite = np.sign(g_c) != np.sign(g_b[active])
+        a[active] = np.where(opposite, b[active], a[active])
+        g_a[active] = np.where(opposite, g_b[active], 0.5 * g_a[active])
+        b[active], g_b[active] = c, g_c
+
+        converged = (g_c == 0) | (
+            np.abs(b[active] - a[active]) <= tolerance * (1 + np.abs(c))
+        )
+        roots[active[converged]] = c[converged]
+        active = active[~converged]
+
+    roots[active] = b[active]
+    return roots
+
+
+def solve_ensemble(
+    fun: EnsembleFun,
+    t0: ArrayLike,
+    t_bound: ArrayLike,
+    y0: FloatArray,
+    t_eval: Optional[Sequence[FloatArray]] = None,
+    events: Sequence[Callable] = (),
+    rtol: float = 1e-3,
+    atol: float = 1e-6,
+    max_step: float = np.inf,
+    method: str = "RK45",
+) -> EnsembleSolution:
+    """Integrate an ensemble of independent systems of ODEs with an
+    explicit Runge-Kutta method: either of order 5(4) (Dormand-Prince,
+    ``"RK45"``) or of order 8 (``"DOP853"``).
+
+    All the members that are still running are advanced together:
+    each right-hand side evaluation is a single vectorised call for
+    all of them. Steps are accepted or rejected, and step sizes are
+    adapted, for each member separately, in the same way as
+    ``scipy.integrate.solve_ivp`` with the same ``method``. Members
+    that have finished are dropped from later evaluations. The state
+    and the stages of each step are kept in arrays allocated once at
+    the start, and the dense output is only computed for steps that
+    contain output times or events.
+
+    Parameters
+    ----------
+    fun
+        Right-hand side of the ensemble, see `EnsembleFun`
+    t0
+        Initial time for each member, or a single one for all of them
+    t_bound
+        Final time for each member, or a single one for all of them
+    y0
+        Initial state, with shape ``(n, n_members)``
+    t_eval
+        Times at which to store the solution of each member, sorted
+        in the direction of integration. If ``None``, the solution is
+        stored after every accepted step
+    events
+        Functions of ``(t, y, index)`` (with the same meaning as for
+        ``fun``) returning one value per member, whose zeros are
+        located by root finding on the dense output. As for
+        `scipy.integrate.solve_ivp`, they may have ``terminal`` and
+        ``direction`` attributes; a terminal event stops only the
+        member it occurs for
+    rtol
+        Relative tolerance
+    atol
+        Absolute tolerance
+    max_step
+        Largest allowed step size
+    method
+        One of `METHODS`
+
+    Returns
+    -------
+    EnsembleSolution
+
+    """
+    if method not in METHODS:
+        raise ValueError(
+            f"Unknown integration method '{method}'. Expected one of {tuple(METHODS)}"
+        )
+    solver = METHODS[method]
+    n_stages = solver.n_stages
+    error_exponent = -1 / (solver.error_estimator_order + 1)
+
+    y = np.array(y0, dtype=float)
+    if y.ndim != 2:
+        raise ValueError(f"Expected y0 with shape (n, n_members), got {y.shape}")
+    n_equations, n_members = y.shape
+    everyone = np.arange(n_members)
+
+    t = np.array(np.broadcast_to(t0, (n_members,)), dtype=float)
+    t_bound = np.array(np.broadcast_to(t_bound, (n_members,)), dtype=float)
+    direction = np.where(t_bound >= t, 1.0, -1.0)
+
+    status = np.full(n_members, FINISHED)
+    running = t != t_bound
+    rejected = np.zeros(n_members, dtype=bool)
+    n_steps = np.zeros(n_members, dtype=int)
+
+    # Either the solution after every step, or the output times still
+    # to come for each member, along with the next one of them
+    if t_eval is None:
+        history = [(everyone, t.copy(), y.copy())]
+        next_output = direction * np.inf
+    else:
+        if len(t_eval) != n_members:
+            raise ValueError(
+                f"Expected t_eval for each of the {n_members} members, got {len(t_eval)}"
+            )
+        pending = [
+            np.asfarray(times)[d * (np.asfarray(times) - start) >= 0]
+            for times, start, d in zip(t_eval, t, direction)
+        ]
+        next_output = np.array(
+            [
+                times[0] if times.size else d * np.inf
+                for times, d in zip(pending, direction)
+            ]
+        )
+        t_out: List[List[FloatArray]] = [[] for _ in everyone]
+        y_out: List[List[FloatArray]] = [[] for _ in everyone]
+
+    terminal = np.array([int(getattr(event, "terminal", False)) for event in events])
+    max_events = np.where(terminal > 0, terminal, np.inf)
+    event_direction = np.array(
+        [float(getattr(event, "direction", 0.0)) for event in events]
+    )[:, np.newaxis]
+    event_count = np.zeros((len(events), n_members))
+    g = np.array([event(t, y, everyone) for event in events]).reshape(-1, n_members)
+    t_events: List[List[List[float]]] = [[[] for _ in events] for _ in everyone]
+    y_events: List[List[List[FloatArray]]] = [[[] for _ in events] for _ in everyone]
+
+    f = fun(t, y, everyone)
+    h_abs = _select_initial_step(
+        fun, t, y, f, direction, rtol, atol, everyone, solver.error_estimator_order
+    )
+    nfev = 2
+
+    # Work arrays for the stages and the new state of the running
+    # members, which the stages are written straight into
+    fun_in_place = _in_place(fun)
+    K_buffer = np.empty((n_stages + 1, n_equations, n_members))
+    y_buffer = np.empty((n_equations, n_members))
+
+    while np.any(running):
+        index = np.flatnonzero(running)
+        t_i = t[index]
+        d_i = direction[index]
+        min_step = 10 * np.abs(np.nextafter(t_i, d_i * np.inf) - t_i)
+        h_i = h_abs[index]
+        # Like scipy, clip the step size at the start of each new step,
+        # but give up if it gets too small after rejected attempts
+        h_i = np.where(rejected[index], h_i, np.clip(h_i, min_step, max_step))
+        too_small = h_i < min_step
+        if np.any(too_small):
+            status[index[too_small]] = FAILED
+            running[index[too_small]] = False
+            keep = ~too_small
+            index, t_i, d_i, h_i = index[keep], t_i[keep], d_i[keep], h_i[keep]
+            if index.size == 0:
+                continue
+
+        t_new = t_i + h_i * d_i
+        t_new = np.where(d_i * (t_new - t_bound[index]) > 0, t_bound[index], t_new)
+        h = t_new - t_i
+        y_i = y[:, index]
+
+        K = K_buffer[..., : index.size]
+        y_stage = y_buffer[:, : index.size]
+        K[0] = f[:, index]
+        for stage in range(1, n_stages):
+            np.einsum("s,snk->nk", solver.A[stage, :stage], K[:stage], out=y_stage)
+            y_stage *= h
+            y_stage += y_i
+            fun_in_place(t_i + solver.C[stage] * h, y_stage, index, out=K[stage])
+        np.einsum("s,snk->nk", solver.B, K[:-1], out=y_stage)
+        y_stage *= h
+        y_stage += y_i
+        y_new = y_stage
+        fun_in_place(t_new, y_new, index, out=K[-1])
+        nfev += n_stages
+
+        scale = atol + np.maximum(np.abs(y_i), np.abs(y_new)) * rtol
+        error_norm = _error_norm(solver, K, h, scale)
+        accepted = error_norm < 1
+        with np.errstate(divide="ignore"):
+            factor = SAFETY * error_norm**error_exponent
+        # fmin/fmax so that NaNs shrink the step, as in scipy
+        factor = np.where(
+            accepted,
+            np.fmin(np.where(rejected[index], 1, MAX_FACTOR), factor),
+            np.fmax(MIN_FACTOR, factor),
+        )
+        h_abs[index] = np.abs(h) * factor
+        rejected[index] = ~accepted
+        if not np.any(accepted):
+            continue
+
+        members = index[accepted]
+        t_old = t_i[accepted]
+        y_old = y_i[:, accepted]
+        h = h[accepted]
+        t[members] = t_new[accepted]
+        y[:, members] = y_new[:, accepted]
+        f[:, members] = K[-1][:, accepted]
+        n_steps[members] += 1
+        finished = direction[members] * (t[members] - t_bound[members]) >= 0
+        status[members[finished]] = FINISHED
+        running[members[finished]] = False
+
+        if events:
+            g_new = np.array(
+                [event(t[members], y[:, members], members) for event in events]
+            )
+            g_old = g[:, members]
+            up = (g_old <= 0) & (g_new >= 0)
+            down = (g_old >= 0) & (g_new <= 0)
+            crossed = (
+                (up & (event_direction > 0))
+                | (down & (event_direction < 0))
+                | ((up | down) & (event_direction == 0))
+            )
+            g[:, members] = g_new
+            has_event = np.any(crossed, axis=0)
+        else:
+            has_event = np.zeros(members.size, dtype=bool)
+        has_output = direction[members] * (next_output[members] - t[members]) <= 0
+
+        dense = np.flatnonzero(has_event | has_output)
+        if dense.size == 0:
+            if t_eval is None:
+                history.append((members, t[members], y[:, members]))
+            continue
+        selected = np.flatnonzero(accepted)[dense]
+        coefficients = np.empty((n_members,), dtype=object)
+        coefficients[members[dense]] = list(
+            _dense_coefficients(
+                solver,
+                fun,
+                K[..., selected],
+                t_old[dense],
+                h[dense],
+                y_old[:, dense],
+                y_new[:, selected],
+                K[-1][:, selected],
+                members[dense],
+            )
+        )
+        if solver is DOP853:
+            nfev += 3
+
+        # Each event is located for all the members it occurred for at
+        # once, so that it is evaluated for all of them together
+        event_roots = np.empty((len(events), members.size))
+        for e in np.flatnonzero(np.any(crossed, axis=1)) if events else ():
+            js = np.flatnonzero(crossed[e])
+            stacked = np.stack(list(coefficients[members[js]]))
+
+            def solutions(time, subset, js=js, stacked=stacked):
+                k = js[subset]
+                return _dense_output_members(
+                    solver, t_old[k], h[k], y_old[:, k], stacked[subset], time
+                )
+
+            event_roots[e, js] = _find_roots(
+                events[e],
+                solutions,
+                members[js],
+                t_old[js],
+                t[members[js]],
+                g_old[e, js],
+                g_new[e, js],
+            )
+
+        for j in np.flatnonzero(has_event):
+            member = members[j]
+
+            def solution(time, j=j):
+                return _dense_output(
+                    solver, t_old[j], h[j], y_old[:, j], coefficients[members[j]], time
+                )
+
+            active = np.flatnonzero(crossed[:, j])
+            roots = event_roots[active, j]
+            order = np.argsort(direction[member] * roots)
+            active, roots = active[order], roots[order]
+            event_count[active, member] += 1
+            stop = np.flatnonzero(event_count[active, member] >= max_events[active])
+            if stop.size:
+                active, roots = active[: stop[0] + 1], roots[: stop[0] + 1]
+            for e, root in zip(active, roots):
+                t_events[member][e].append(root)
+                y_events[member][e].append(solution([root])[:, 0])
+            if stop.size:
+                t[member] = roots[-1]
+                y[:, member] = solution([roots[-1]])[:, 0]
+                status[member] = TERMINATED
+                running[member] = False
+
+        if t_eval is None:
+            history.append((members, t[members], y[:, members]))
+            continue
+
+        for j in np.flatnonzero(has_output):
+            member = members[j]
+            times = pending[member]
+            d = direction[member]
+            n_due = np.searchsorted(d * times, d * t[member], side="right")
+            if n_due == 0:
+                continue
+            t_out[member].append(times[:n_due])
+            y_out[member].append(
+                _dense_output(
+                    solver,
+                    t_old[j],
+                    h[j],
+                    y_old[:, j],
+                    coefficients[member],
+                    times[:n_due],
+                )
+            )
+            pending[member] = times[n_due:]
+            next_output[member] = (
+                pending[member][0] if n_due < times.size else d * np.inf
+            )
+
+    if t_eval is None:
+        all_members = np.concatenate([step[0] for step in history])
+        all_t = np.concatenate([step[1] for step in history])
+        all_y = np.concatenate([step[2] for step in history], axis=1)
+        ts = [all_t[all_members == member] for member in everyone]
+        ys = [all_y[:, all_members == member] for member in everyone]
+    else:
+        ts = [np.concatenate(times) if times else np.empty(0) for times in t_out]
+        ys = [
+            np.concatenate(values, axis=1) if values else np.empty((n_equations, 0))
+            for values in y_out
+        ]
+
+    return EnsembleSolution(
+        t=ts,
+        y=ys,
+        t_events=[[np.asarray(times) for times in member] for member in t_events],
+        y_events=[[np.asarray(values) for values in member] for member in y_events],
+        status=status,
+        nfev=nfev,
+        n_steps=n_steps,
+    )
@@ -7,7 +7,7 @@ I've separated this from scotty.fun_general to prevent circular importing
 
 """
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 
@@ -23,12 +23,22 @@ def pack_beam_parameters(
     K_Z: ArrayLike,
     Psi: FloatArray,
 ) -> FloatArray:
-    """Pack coordinates and Psi matrix into single flat array for"""
+    """Pack coordinates and Psi matrix into single flat array for the
+    solver. For several beams at once, the coordinates are arrays and
+    ``Psi`` has shape ``(..., 3, 3)``, giving shape ``(17, ...)``"""
 
     # This used to be complex, with a length of 11, but the solver
     # throws a warning saying that something is casted to real It
     # seems to be fine, bu
-    beam_parameters = np.zeros(17)
+    shape = np.broadcast_shapes(
+        np.shape(q_R),
+        np.shape(q_zeta),
+        np.shape(q_Z),
+        np.shape(K_R),
+        np.shape(K_Z),
+        np.shape(Psi)[:-2],
+    )
+    beam_parameters = np.zeros((17,) + shape)
 
     beam_parameters[0] = q_R
     beam_parameters[1] = q_zeta
@@ -37,19 +47,19 @@ def pack_beam_parameters(
     beam_parameters[3] = K_R
     beam_parameters[4] = K_Z
 
-    beam_parameters[5] = np.real(Psi[0, 0])
-    beam_parameters[6] = np.real(Psi[1, 1])
-    beam_parameters[7] = np.real(Psi[2, 2])
-    beam_parameters[8] = np.real(Psi[0, 1])
-    beam_parameters[9] = np.real(Psi[0, 2])
-    beam_parameters[10] = np.real(Psi[1, 2])
-
-    beam_parameters[11] = np.imag(Psi[0, 0])
-    beam_parameters[12] = np.imag(Psi[1, 1])
-    beam_parameters[13] = np.imag(Psi[2, 2])
-    beam_parameters[14] = np.imag(Psi[0, 1])
-    beam_parameters[15] = np.imag(Psi[0, 2])
-    beam_parameters[16] = np.imag(Psi[1, 2])
+    beam_parameters[5] = np.real(Psi[..., 0, 0])
+    beam_parameters[6] = np.real(Psi[..., 1, 1])
+    beam_parameters[7] = np.real(Psi[..., 2, 2])
+    beam_parameters[8] = np.real(Psi[..., 0, 1])
+    beam_parameters[9] = np.real(Psi[..., 0, 2])
+    beam_parameters[10] = np.real(Psi[..., 1, 2])
+
+    beam_parameters[11] = np.imag(Psi[..., 0, 0])
+    beam_parameters[12] = np.imag(Psi[..., 1, 1])
+    beam_parameters[13] = np.imag(Psi[..., 2, 2])
+    beam_parameters[14] = np.imag(Psi[..., 0, 1])
+    beam_parameters[15] = np.imag(Psi[..., 0, 2])
+    beam_parameters[16] = np.imag(Psi[..., 1, 2])
     return beam_parameters
 
 
@@ -110,7 +120,7 @@ def beam_evolution_fun(tau, beam_parameters, K_zeta, hamiltonian: Hamiltonian):
     dH = hamiltonian.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
 
     grad_grad_H, gradK_grad_H, gradK_gradK_H = hessians(dH)
-    grad_gradK_H = np.transpose(gradK_grad_H)
+    grad_gradK_H = np.swapaxes(gradK_grad_H, -1, -2)
 
     dH_dR = dH["dH_dR"]
     dH_dZ = dH["dH_dZ"]
@@ -126,3 +136,302 @@ def beam_evolution_fun(tau, beam_parameters, K_zeta, hamiltonian: Hamiltonian):
     )
 
     return pack_beam_parameters(dH_dKR, dH_dKzeta, dH_dKZ, -dH_dR, -dH_dZ, d_Psi_d_tau)
+
+
+def pack_linearised_parameters(
+    q_R: ArrayLike,
+    q_zeta: ArrayLike,
+    q_Z: ArrayLike,
+    K_R: ArrayLike,
+    K_Z: ArrayLike,
+    P: FloatArray,
+    Q: FloatArray,
+) -> FloatArray:
+    r"""Pack coordinates and the matrices :math:`P` and :math:`Q`, where
+    :math:`\Psi = P Q^{-1}`, into a single flat array for the solver,
+    with shape ``(41, ...)``: the coordinates as in
+    `pack_beam_parameters`, then the real and imaginary parts of
+    :math:`P` and of :math:`Q` in row-major order"""
+    shape = np.broadcast_shapes(
+        np.shape(q_R),
+        np.shape(q_zeta),
+        np.shape(q_Z),
+        np.shape(K_R),
+        np.shape(K_Z),
+        np.shape(P)[:-2],
+        np.shape(Q)[:-2],
+    )
+    parameters = np.zeros((41,) + shape)
+    parameters[0] = q_R
+    parameters[1] = q_zeta
+    parameters[2] = q_Z
+    parameters[3] = K_R
+    parameters[4] = K_Z
+    for start, matrix in ((5, P), (23, Q)):
+        elements = np.moveaxis(np.reshape(matrix, np.shape(matrix)[:-2] + (9,)), -1, 0)
+        parameters[start : start + 9] = np.real(elements)
+        parameters[start + 9 : start + 18] = np.imag(elements)
+    return parameters
+
+
+def unpack_linearised_parameters(
+    parameters: FloatArray,
+) -> Tuple[
+    ArrayLike, ArrayLike, ArrayLike, ArrayLike, ArrayLike, FloatArray, FloatArray
+]:
+    """Unpack the output of `pack_linearised_parameters`, with ``P``
+    and ``Q`` of shape ``(..., 3, 3)``"""
+    P, Q = (
+        np.moveaxis(
+            parameters[start : start + 9] + 1j * parameters[start + 9 : start + 18],
+            0,
+            -1,
+        ).reshape(parameters.shape[1:] + (3, 3))
+        for start in (5, 23)
+    )
+    return (
+        parameters[0],
+        parameters[1],
+        parameters[2],
+        parameters[3],
+        parameters[4],
+        P,
+        Q,
+    )
+
+
+def linearised_to_beam_parameters(parameters: FloatArray) -> FloatArray:
+    r"""Convert from `pack_linearised_parameters` to
+    `pack_beam_parameters`, reconstructing :math:`\Psi = P Q^{-1}`"""
+    q_R, q_zeta, q_Z, K_R, K_Z, P, Q = unpack_linearised_parameters(parameters)
+    # Psi is symmetric, so Psi = Psi^T = Q^{-T} P^T
+    Psi = np.linalg.solve(np.swapaxes(Q, -1, -2), np.swapaxes(P, -1, -2))
+    Psi = 0.5 * (Psi + np.swapaxes(Psi, -1, -2))
+    return pack_beam_parameters(q_R, q_zeta, q_Z, K_R, K_Z, Psi)
+
+
+def linearised_beam_evolution_fun(
+    tau, parameters, K_zeta, hamiltonian: Hamiltonian
+) -> FloatArray:
+    r"""Right-hand side of the beam equations with :math:`\Psi`
+    written as :math:`P Q^{-1}`, in the packing of
+    `pack_linearised_parameters`.
+
+    The Riccati equation for :math:`\Psi` in `beam_evolution_fun` is
+    then equivalent to the linear equations
+
+    .. math::
+
+        \frac{dQ}{d\tau} = \nabla_K \nabla H \, Q + \nabla_K \nabla_K H \, P
+
+        \frac{dP}{d\tau} = -\nabla \nabla H \, Q - \nabla \nabla_K H \, P
+
+    whose solutions stay smooth where :math:`\Psi` varies rapidly, as
+    near caustics and the cut-off, allowing larger steps. Starting
+    from :math:`Q = 1` and :math:`P = \Psi`, see
+    `linearised_to_beam_parameters` to recover :math:`\Psi`.
+
+    """
+    q_R, _, q_Z, K_R, K_Z, P, Q = unpack_linearised_parameters(parameters)
+
+    dH = hamiltonian.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+    grad_grad_H, gradK_grad_H, gradK_gradK_H = hessians(dH)
+    grad_gradK_H = np.swapaxes(gradK_grad_H, -1, -2)
+
+    d_Q_d_tau = np.matmul(gradK_grad_H, Q) + np.matmul(gradK_gradK_H, P)
+    d_P_d_tau = -np.matmul(grad_grad_H, Q) - np.matmul(grad_gradK_H, P)
+
+    return pack_linearised_parameters(
+        dH["dH_dKR"],
+        dH["dH_dKzeta"],
+        dH["dH_dKZ"],
+        -dH["dH_dR"],
+        -dH["dH_dZ"],
+        d_P_d_tau,
+        d_Q_d_tau,
+    )
+
+
+# Positions of the real and imaginary parts of each element of the
+# upper triangle of Psi in the packed beam parameters
+PSI_INDICES = (
+    (0, 0, 5, 11),
+    (1, 1, 6, 12),
+    (2, 2, 7, 13),
+    (0, 1, 8, 14),
+    (0, 2, 9, 15),
+    (1, 2, 10, 16),
+)
+
+
+class BeamEvolution:
+    """Right-hand side of the beam equations, equivalent to
+    `beam_evolution_fun`, but reusing the same work arrays for
+    :math:`\\Psi`, the Hessians of :math:`H` and their products on
+    every call, instead of creating new ones.
+
+    Can be called with a single beam (``beam_parameters`` of shape
+    ``(17,)``), for example by `scipy.integrate.solve_ivp`, or with a
+    batch of them (shape ``(17, n)``), optionally with ``index``
+    selecting their frequencies, modes and ``K_zeta`` from those of
+    the whole ensemble, as in `scotty.ensemble.solve_ensemble`.
+
+    Parameters
+    ----------
+    hamiltonian
+        The Hamiltonian of the beam(s)
+    K_zeta
+        Toroidal wavevector of the beam(s), which is conserved
+
+    """
+
+    def __init__(self, hamiltonian: Hamiltonian, K_zeta: ArrayLike):
+        self.hamiltonian = hamiltonian
+        self.K_zeta = np.asfarray(K_zeta) if np.ndim(K_zeta) else K_zeta
+        self._allocate(1)
+
+    def _allocate(self, n_points: int):
+        self._size = n_points
+        shape = (n_points, 3, 3)
+        self._Psi = np.empty(shape, dtype=complex)
+        # Elements which are always zero are never overwritten
+        self._grad_grad_H = np.zeros(shape)
+        self._gradK_grad_H = np.zeros(shape)
+        self._gradK_gradK_H = np.empty(shape)
+        self._product = np.empty(shape, dtype=complex)
+        self._triple_product = np.empty(shape, dtype=complex)
+        self._d_Psi_d_tau = np.empty(shape, dtype=complex)
+
+    def __call__(
+        self,
+        tau: ArrayLike,
+        beam_parameters: FloatArray,
+        index: Optional[np.ndarray] = None,
+        out: Optional[FloatArray] = None,
+    ) -> FloatArray:
+        state = np.reshape(beam_parameters, (17, -1))
+        n_points = state.shape[1]
+        if n_points > self._size:
+            self._allocate(n_points)
+
+        hamiltonian = self.hamiltonian
+        K_zeta = self.K_zeta
+        if index is not None:
+            hamiltonian = hamiltonian.select(index)
+            if np.ndim(K_zeta):
+                K_zeta = K_zeta[index]
+
+        Psi = self._Psi[:n_points]
+        for i, j, real, imag in PSI_INDICES:
+            Psi.real[:, i, j] = state[real]
+            Psi.imag[:, i, j] = state[imag]
+            Psi[:, j, i] = Psi[:, i, j]
+
+        dH = hamiltonian.derivatives(
+            state[0], state[2], state[3], K_zeta, state[4], second_order=True
+        )
+
+        grad_grad_H = self._grad_grad_H[:n_points]
+        grad_grad_H[:, 0, 0] = dH["d2H_dR2"]
+        grad_grad_H[:, 2, 2] = dH["d2H_dZ2"]
+        grad_grad_H[:, 0, 2] = grad_grad_H[:, 2, 0] = dH["d2H_dR_dZ"]
+
+        gradK_grad_H = self._gradK_grad_H[:n_points]
+        gradK_grad_H[:, 0, 0] = dH["d2H_dR_dKR"]
+        gradK_grad_H[:, 0, 2] = dH["d2H_dZ_dKR"]
+        gradK_grad_H[:, 1, 0] = dH["d2H_dR_dKzeta"]
+        gradK_grad_H[:, 1, 2] = dH["d2H_dZ_dKzeta"]
+        gradK_grad_H[:, 2, 0] = dH["d2H_dR_dKZ"]
+        gradK_grad_H[:, 2, 2] = dH["d2H_dZ_dKZ"]
+
+        gradK_gradK_H = self._gradK_gradK_H[:n_points]
+        gradK_gradK_H[:, 0, 0] = dH["d2H_dKR2"]
+        gradK_gradK_H[:, 1, 1] = dH["d2H_dKzeta2"]
+        gradK_gradK_H[:, 2, 2] = dH["d2H_dKZ2"]
+        gradK_gradK_H[:, 0, 1] = gradK_gradK_H[:, 1, 0] = dH["d2H_dKR_dKzeta"]
+        gradK_gradK_H[:, 0, 2] = gradK_gradK_H[:, 2, 0] = dH["d2H_dKR_dKZ"]
+        gradK_gradK_H[:, 1, 2] = gradK_gradK_H[:, 2, 1] = dH["d2H_dKzeta_dKZ"]
+
+        product = self._product[:n_points]
+        triple_product = self._triple_product[:n_points]
+        d_Psi_d_tau = self._d_Psi_d_tau[:n_points]
+        np.negative(grad_grad_H, out=d_Psi_d_tau)
+        d_Psi_d_tau -= np.matmul(Psi, gradK_grad_H, out=product)
+        d_Psi_d_tau -= np.matmul(np.swapaxes(gradK_grad_H, 1, 2), Psi, out=product)
+        np.matmul(Psi, gradK_gradK_H, out=product)
+        d_Psi_d_tau -= np.matmul(product, Psi, out=triple_product)
+
+        if out is None:
+            out = np.empty(np.shape(beam_parameters))
+        result = np.reshape(out, (17, -1))
+        result[0] = dH["dH_dKR"]
+        result[1] = dH["dH_dKzeta"]
+        result[2] = dH["dH_dKZ"]
+        result[3] = -dH["dH_dR"]
+        result[4] = -dH["dH_dZ"]
+        for i, j, real, imag in PSI_INDICES:
+            result[real] = d_Psi_d_tau.real[:, i, j]
+            result[imag] = d_Psi_d_tau.imag[:, i, j]
+        return out
+
+    def jacobian(self, tau: float, beam_parameters: FloatArray) -> FloatArray:
+        r"""Jacobian of the beam equations for a single beam, with
+        shape ``(17, 17)``, for the implicit solvers of
+        `scipy.integrate.solve_ivp`.
+
+        Most of it is known from the second derivatives of :math:`H`
+        already needed for the right-hand side:
+
+        - the ray equations depend only on :math:`q_R, q_Z, K_R, K_Z`,
+          through the Hessians of :math:`H`
+        - :math:`d\Psi/d\tau` is linear in :math:`\delta\Psi` through
+          :math:`-\delta\Psi M - M^T \delta\Psi`, with
+          :math:`M = \nabla_K \nabla H + \nabla_K \nabla_K H \Psi`
+
+        Only the dependence of :math:`d\Psi/d\tau` on the four ray
+        coordinates needs third derivatives of :math:`H`, which are
+        found by forward differences of one batched call, using the
+        same spacings as the Hamiltonian.
+
+        """
+        state = np.asfarray(beam_parameters)
+        q_R, _, q_Z, K_R, K_Z, Psi = unpack_beam_parameters(state)
+        dH = self.hamiltonian.derivatives(
+            q_R, q_Z, K_R, self.K_zeta, K_Z, second_order=True
+        )
+        grad_grad_H, gradK_grad_H, gradK_gradK_H = (
+            np.reshape(hessian, (3, 3)) for hessian in hessians(dH)
+        )
+
+        jacobian = np.zeros((17, 17))
+        ray_columns = [0, 2, 3, 4]
+        R_Z = [0, 2]
+        ray_jacobian = jacobian[:5]
+        ray_jacobian[:3, R_Z] = gradK_grad_H[:, R_Z]
+        ray_jacobian[:3, 3:5] = gradK_gradK_H[:, R_Z]
+        ray_jacobian[3:5, R_Z] = -grad_grad_H[np.ix_(R_Z, R_Z)]
+        ray_jacobian[3:5, 3:5] = -gradK_grad_H[np.ix_(R_Z, R_Z)].T
+
+        M = gradK_grad_H + gradK_gradK_H @ Psi
+        unit = np.zeros((6, 3, 3))
+        for k, (i, j, _, _) in enumerate(PSI_INDICES):
+            unit[k, i, j] = unit[k, j, i] = 1.0
+        d_Psi = -(unit @ M) - (M.T @ unit)
+        rows = [i for i, _, _, _ in PSI_INDICES]
+        columns = [j for _, j, _, _ in PSI_INDICES]
+        Psi_jacobian = d_Psi[:, rows, columns].T
+        real = [real for _, _, real, _ in PSI_INDICES]
+        imag = [imag for _, _, _, imag in PSI_INDICES]
+        jacobian[np.ix_(real, real)] = jacobian[np.ix_(imag, imag)] = Psi_jacobian.real
+        jacobian[np.ix_(imag, real)] = Psi_jacobian.imag
+        jacobian[np.ix_(real, imag)] = -Psi_jacobian.imag
+
+        spacings = self.hamiltonian.spacings
+        steps = np.array(
+            [spacings["q_R"], spacings["q_Z"], spacings["K_R"], spacings["K_Z"]]
+        )
+        perturbed = np.repeat(state[:, np.newaxis], 5, axis=1)
+        perturbed[ray_columns, np.arange(1, 5)] += steps
+        evolution = self(tau, perturbed)
+        jacobian[5:, ray_columns] = (evolution[5:, 1:] - evolution[5:, :1]) / steps
+        return jacobian
@@ -111,13 +111,17 @@ def make_unit_vector_from_cross_product(vector_a, vector_b):
 
 
 def find_inverse_2D(matrix_2D):
-    # Finds the inverse of a 2x2 matrix
-    matrix_2D_inverse = np.zeros([2, 2], dtype="complex128")
-    determinant = matrix_2D[0, 0] * matrix_2D[1, 1] - matrix_2D[0, 1] * matrix_2D[1, 0]
-    matrix_2D_inverse[0, 0] = matrix_2D[1, 1] / determinant
-    matrix_2D_inverse[1, 1] = matrix_2D[0, 0] / determinant
-    matrix_2D_inverse[0, 1] = -matrix_2D[0, 1] / determinant
-    matrix_2D_inverse[1, 0] = -matrix_2D[1, 0] / determinant
+    # Finds the inverse of a 2x2 matrix, or of a stack of them with
+    # shape (..., 2, 2)
+    matrix_2D_inverse = np.zeros(np.shape(matrix_2D), dtype="complex128")
+    determinant = (
+        matrix_2D[..., 0, 0] * matrix_2D[..., 1, 1]
+        - matrix_2D[..., 0, 1] * matrix_2D[..., 1, 0]
+    )
+    matrix_2D_inverse[..., 0, 0] = matrix_2D[..., 1, 1] / determinant
+    matrix_2D_inverse[..., 1, 1] = matrix_2D[..., 0, 0] / determinant
+    matrix_2D_inverse[..., 0, 1] = -matrix_2D[..., 0, 1] / determinant
+    matrix_2D_inverse[..., 1, 0] = -matrix_2D[..., 1, 0] / determinant
     return matrix_2D_inverse
 
 
@@ -263,7 +267,7 @@ def find_K_lab_Cartesian(K_lab, q_lab):
     q_R = q_lab[0]
     q_zeta = q_lab[1]
 
-    K_lab_Cartesian = np.zeros(3)
+    K_lab_Cartesian = np.zeros(np.shape(K_lab))
     K_lab_Cartesian[0] = K_R * np.cos(q_zeta) - K_zeta * np.sin(q_zeta) / q_R  # K_X
     K_lab_Cartesian[1] = K_R * np.sin(q_zeta) + K_zeta * np.cos(q_zeta) / q_R  # K_Y
     K_lab_Cartesian[2] = K_Z
@@ -277,7 +281,7 @@ def find_K_lab(K_lab_Cartesian, q_lab_Cartesian):
 
     [q_R, q_zeta, q_Z] = find_q_lab(q_lab_Cartesian)
 
-    K_lab = np.zeros(3)
+    K_lab = np.zeros(np.shape(K_lab_Cartesian))
     K_lab[0] = K_X * np.cos(q_zeta) + K_Y * np.sin(q_zeta)  # K_R
     K_lab[1] = (-K_X * np.sin(q_zeta) + K_Y * np.cos(q_zeta)) * q_R  # K_zeta
     K_lab[2] = K_Z
@@ -287,42 +291,52 @@ def find_K_lab(K_lab_Cartesian, q_lab_Cartesian):
 def find_Psi_3D_lab(Psi_3D_lab_Cartesian, q_R, q_zeta, K_R, K_zeta):
     """
     Converts Psi_3D from Cartesian to cylindrical coordinates, both in the lab frame (not the beam frame)
+
+    For several beams at once, ``Psi_3D_lab_Cartesian`` has shape ``(..., 3, 3)``
+    and the coordinates are arrays broadcastable against ``...``
     """
     cos_zeta = np.cos(q_zeta)
     sin_zeta = np.sin(q_zeta)
 
-    Psi_XX = Psi_3D_lab_Cartesian[0][0]
-    Psi_YY = Psi_3D_lab_Cartesian[1][1]
-    Psi_ZZ = Psi_3D_lab_Cartesian[2][2]
-    Psi_XY = Psi_3D_lab_Cartesian[0][1]
-    Psi_XZ = Psi_3D_lab_Cartesian[0][2]
-    Psi_YZ = Psi_3D_lab_Cartesian[1][2]
-
-    Psi_3D_lab = np.zeros([3, 3], dtype="complex128")
+    Psi_XX = Psi_3D_lab_Cartesian[..., 0, 0]
+    Psi_YY = Psi_3D_lab_Cartesian[..., 1, 1]
+    Psi_ZZ = Psi_3D_lab_Cartesian[..., 2, 2]
+    Psi_XY = Psi_3D_lab_Cartesian[..., 0, 1]
+    Psi_XZ = Psi_3D_lab_Cartesian[..., 0, 2]
+    Psi_YZ = Psi_3D_lab_Cartesian[..., 1, 2]
+
+    shape = np.broadcast_shapes(
+        np.shape(Psi_3D_lab_Cartesian)[:-2],
+        np.shape(q_R),
+        np.shape(q_zeta),
+        np.shape(K_R),
+        np.shape(K_zeta),
+    )
+    Psi_3D_lab = np.zeros(shape + (3, 3), dtype="complex128")
 
-    Psi_3D_lab[0][0] = (
+    Psi_3D_lab[..., 0, 0] = (
         Psi_XX * cos_zeta**2
         + 2 * Psi_XY * sin_zeta * cos_zeta
         + Psi_YY * sin_zeta**2
     )  # Psi_RR
-    Psi_3D_lab[1][1] = (
+    Psi_3D_lab[..., 1, 1] = (
         Psi_XX * sin_zeta**2
         - 2 * Psi_XY * sin_zeta * cos_zeta
         + Psi_YY * cos_zeta**2
     ) * q_R**2 - K_R * q_R  # Psi_zetazeta
-    Psi_3D_lab[2][2] = Psi_ZZ  # Psi_ZZ
+    Psi_3D_lab[..., 2, 2] = Psi_ZZ  # Psi_ZZ
 
-    Psi_3D_lab[0][1] = (
+    Psi_3D_lab[..., 0, 1] = (
         -Psi_XX * sin_zeta * cos_zeta
         + Psi_XY * (cos_zeta**2 - sin_zeta**2)
         + Psi_YY * sin_zeta * cos_zeta
     ) * q_R + K_zeta / q_R  # Psi_Rzeta
-    Psi_3D_lab[1][0] = Psi_3D_lab[0][1]
+    Psi_3D_lab[..., 1, 0] = Psi_3D_lab[..., 0, 1]
 
-    Psi_3D_lab[0][2] = Psi_XZ * cos_zeta + Psi_YZ * sin_zeta  # Psi_RZ
-    Psi_3D_lab[2][0] = Psi_3D_lab[0][2]
-    Psi_3D_lab[1][2] = (-Psi_XZ * sin_zeta + Psi_YZ * cos_zeta) * q_R  # Psi_zetaZ
-    Psi_3D_lab[2][1] = Psi_3D_lab[1][2]
+    Psi_3D_lab[..., 0, 2] = Psi_XZ * cos_zeta + Psi_YZ * sin_zeta  # Psi_RZ
+    Psi_3D_lab[..., 2, 0] = Psi_3D_lab[..., 0, 2]
+    Psi_3D_lab[..., 1, 2] = (-Psi_XZ * sin_zeta + Psi_YZ * cos_zeta) * q_R  # Psi_zetaZ
+    Psi_3D_lab[..., 2, 1] = Psi_3D_lab[..., 1, 2]
     return Psi_3D_lab
 
 
@@ -507,39 +521,22 @@ def find_H_numba(
     launch_angular_frequency,
     mode_flag,
 ):
-    # For use with the numba package (parallelisation)
-    # As such, doesn't take any functions as arguments
-    # Still in development
-
-    wavenumber_K0 = launch_angular_frequency / constants.c
-
-    Booker_alpha = find_Booker_alpha(
-        electron_density, B_Total, sin_theta_m_sq, launch_angular_frequency
-    )
-    Booker_beta = find_Booker_beta(
-        electron_density, B_Total, sin_theta_m_sq, launch_angular_frequency
-    )
-    Booker_gamma = find_Booker_gamma(
-        electron_density, B_Total, launch_angular_frequency
+    """Evaluate the Hamiltonian from the local plasma parameters, using
+    the compiled kernel in `scotty.numba_backend`. As such, doesn't
+    take any functions as arguments. Without Numba installed, this
+    runs the same kernel as plain Python"""
+    # Imported here to avoid circular imports
+    from scotty.numba_backend import find_H
+
+    return find_H(
+        K_magnitude,
+        electron_density,
+        B_Total,
+        sin_theta_m_sq,
+        launch_angular_frequency,
+        mode_flag,
     )
 
-    # Due to numerical errors, sometimes H_discriminant ends up being a very small negative number
-    # That's why we take max(0, H_discriminant) in the sqrt
-
-    H = (K_magnitude / wavenumber_K0) ** 2 + (
-        Booker_beta
-        - mode_flag
-        * np.sqrt(
-            np.maximum(
-                np.zeros_like(Booker_beta),
-                (Booker_beta**2 - 4 * Booker_alpha * Booker_gamma),
-            )
-        )
-        # np.sqrt(Booker_beta**2 - 4*Booker_alpha*Booker_gamma)
-    ) / (2 * Booker_alpha)
-
-    return H
-
 
 # ----------------------------------
 
@@ -578,35 +575,60 @@ def find_Psi_3D_plasma(
     d_poloidal_flux_d_R,
     d_poloidal_flux_d_Z,
 ):
-    # When beam is entering plasma from vacuum
-    Psi_v_R_R = Psi_vacuum_3D[0, 0]
-    Psi_v_zeta_zeta = Psi_vacuum_3D[1, 1]
-    Psi_v_Z_Z = Psi_vacuum_3D[2, 2]
-    Psi_v_R_zeta = Psi_vacuum_3D[0, 1]
-    Psi_v_R_Z = Psi_vacuum_3D[0, 2]
-    Psi_v_zeta_Z = Psi_vacuum_3D[1, 2]
-
-    interface_matrix = np.zeros([6, 6])
-    interface_matrix[0][5] = 1
-    interface_matrix[1][0] = d_poloidal_flux_d_Z**2
-    interface_matrix[1][1] = -2 * d_poloidal_flux_d_R * d_poloidal_flux_d_Z
-    interface_matrix[1][3] = d_poloidal_flux_d_R**2
-    interface_matrix[2][2] = -d_poloidal_flux_d_Z
-    interface_matrix[2][4] = d_poloidal_flux_d_R
-    interface_matrix[3][0] = dH_dKR
-    interface_matrix[3][1] = dH_dKZ
-    interface_matrix[3][2] = dH_dKzeta
-    interface_matrix[4][1] = dH_dKR
-    interface_matrix[4][3] = dH_dKZ
-    interface_matrix[4][4] = dH_dKzeta
-    interface_matrix[5][2] = dH_dKR
-    interface_matrix[5][4] = dH_dKZ
-    interface_matrix[5][5] = dH_dKzeta
+    # When beam is entering plasma from vacuum. For several beams at
+    # once, Psi_vacuum_3D has shape (..., 3, 3) and the derivatives
+    # are arrays broadcastable against ...
+    Psi_v_R_R = Psi_vacuum_3D[..., 0, 0]
+    Psi_v_zeta_zeta = Psi_vacuum_3D[..., 1, 1]
+    Psi_v_Z_Z = Psi_vacuum_3D[..., 2, 2]
+    Psi_v_R_zeta = Psi_vacuum_3D[..., 0, 1]
+    Psi_v_R_Z = Psi_vacuum_3D[..., 0, 2]
+    Psi_v_zeta_Z = Psi_vacuum_3D[..., 1, 2]
+
+    shape = np.broadcast_shapes(
+        np.shape(Psi_vacuum_3D)[:-2],
+        np.shape(dH_dKR),
+        np.shape(dH_dKzeta),
+        np.shape(dH_dKZ),
+        np.shape(dH_dR),
+        np.shape(dH_dZ),
+        np.shape(d_poloidal_flux_d_R),
+        np.shape(d_poloidal_flux_d_Z),
+    )
+    interface_matrix = np.zeros(shape + (6, 6))
+    interface_matrix[..., 0, 5] = 1
+    interface_matrix[..., 1, 0] = d_poloidal_flux_d_Z**2
+    interface_matrix[..., 1, 1] = -2 * d_poloidal_flux_d_R * d_poloidal_flux_d_Z
+    interface_matrix[..., 1, 3] = d_poloidal_flux_d_R**2
+    interface_matrix[..., 2, 2] = -d_poloidal_flux_d_Z
+    interface_matrix[..., 2, 4] = d_poloidal_flux_d_R
+    interface_matrix[..., 3, 0] = dH_dKR
+    interface_matrix[..., 3, 1] = dH_dKZ
+    interface_matrix[..., 3, 2] = dH_dKzeta
+    interface_matrix[..., 4, 1] = dH_dKR
+    interface_matrix[..., 4, 3] = dH_dKZ
+    interface_matrix[..., 4, 4] = dH_dKzeta
+    interface_matrix[..., 5, 2] = dH_dKR
+    interface_matrix[..., 5, 4] = dH_dKZ
+    interface_matrix[..., 5, 5] = dH_dKzeta
 
     # interface_matrix will be singular if one tries to transition while still in vacuum (and there's no plasma at all)
     # at least that's what happens, in my experience
     interface_matrix_inverse = np.linalg.inv(interface_matrix)
 
+    boundary_conditions = np.zeros(shape + (6,), dtype="complex128")
+    boundary_conditions[..., 0] = Psi_v_zeta_zeta
+    boundary_conditions[..., 1] = (
+        Psi_v_R_R * d_poloidal_flux_d_Z**2
+        - 2 * Psi_v_R_Z * d_poloidal_flux_d_R * d_poloidal_flux_d_Z
+        + Psi_v_Z_Z * d_poloidal_flux_d_R**2
+    )
+    boundary_conditions[..., 2] = (
+        -Psi_v_R_zeta * d_poloidal_flux_d_Z + Psi_v_zeta_Z * d_poloidal_flux_d_R
+    )
+    boundary_conditions[..., 3] = -dH_dR
+    boundary_conditions[..., 4] = -dH_dZ
+
     [
         Psi_p_R_R,
         Psi_p_R_Z,
@@ -614,30 +636,24 @@ def find_Psi_3D_plasma(
         Psi_p_Z_Z,
         Psi_p_Z_zeta,
         Psi_p_zeta_zeta,
-    ] = np.matmul(
-        interface_matrix_inverse,
-        [
-            Psi_v_zeta_zeta,
-            Psi_v_R_R * d_poloidal_flux_d_Z**2
-            - 2 * Psi_v_R_Z * d_poloidal_flux_d_R * d_poloidal_flux_d_Z
-            + Psi_v_Z_Z * d_poloidal_flux_d_R**2,
-            -Psi_v_R_zeta * d_poloidal_flux_d_Z + Psi_v_zeta_Z * d_poloidal_flux_d_R,
-            -dH_dR,
-            -dH_dZ,
-            0,
+    ] = np.moveaxis(
+        np.matmul(interface_matrix_inverse, boundary_conditions[..., np.newaxis])[
+            ..., 0
         ],
+        -1,
+        0,
     )
 
-    Psi_3D_plasma = np.zeros([3, 3], dtype="complex128")
-    Psi_3D_plasma[0, 0] = Psi_p_R_R
-    Psi_3D_plasma[1, 1] = Psi_p_zeta_zeta
-    Psi_3D_plasma[2, 2] = Psi_p_Z_Z
-    Psi_3D_plasma[0, 1] = Psi_p_R_zeta
-    Psi_3D_plasma[1, 0] = Psi_3D_plasma[0, 1]
-    Psi_3D_plasma[0, 2] = Psi_p_R_Z
-    Psi_3D_plasma[2, 0] = Psi_3D_plasma[0, 2]
-    Psi_3D_plasma[1, 2] = Psi_p_Z_zeta
-    Psi_3D_plasma[2, 1] = Psi_3D_plasma[1, 2]
+    Psi_3D_plasma = np.zeros(shape + (3, 3), dtype="complex128")
+    Psi_3D_plasma[..., 0, 0] = Psi_p_R_R
+    Psi_3D_plasma[..., 1, 1] = Psi_p_zeta_zeta
+    Psi_3D_plasma[..., 2, 2] = Psi_p_Z_Z
+    Psi_3D_plasma[..., 0, 1] = Psi_p_R_zeta
+    Psi_3D_plasma[..., 1, 0] = Psi_3D_plasma[..., 0, 1]
+    Psi_3D_plasma[..., 0, 2] = Psi_p_R_Z
+    Psi_3D_plasma[..., 2, 0] = Psi_3D_plasma[..., 0, 2]
+    Psi_3D_plasma[..., 1, 2] = Psi_p_Z_zeta
+    Psi_3D_plasma[..., 2, 1] = Psi_3D_plasma[..., 1, 2]
 
     return Psi_3D_plasma
 
@@ -5,13 +5,14 @@ from __future__ import annotations
 
 from abc import ABC
 import pathlib
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional, Sequence, Tuple
 
 from netCDF4 import Dataset
 import numpy as np
 from scipy.interpolate import RectBivariateSpline, UnivariateSpline
 
-from scotty.fun_CFD import find_dpolflux_dR, find_dpolflux_dZ
+from scotty.autodiff import Jet, apply_bivariate, apply_univariate
+from scotty.fun_CFD import cfd_gradient, find_dpolflux_dR, find_dpolflux_dZ
 from scotty.fun_general import find_nearest
 from scotty.typing import ArrayLike, FloatArray
 
@@ -25,6 +26,10 @@ class MagneticField(ABC):
     Z_coord: FloatArray
     #: Value of the poloidal magnetic flux, :math:`\psi`, on ``(R_coord, Z_coord)``
     poloidalFlux_grid: FloatArray
+    #: Finite difference spacing in ``R`` used by the default `derivatives`
+    delta_R: float = 1e-4
+    #: Finite difference spacing in ``Z`` used by the default `derivatives`
+    delta_Z: float = 1e-4
 
     def B_R(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         raise NotImplementedError
@@ -38,6 +43,91 @@ class MagneticField(ABC):
     def poloidal_flux(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         raise NotImplementedError
 
+    def evaluate(
+        self, q_R: ArrayLike, q_Z: ArrayLike, derivatives: int = 0
+    ) -> Dict[str, FloatArray]:
+        """The poloidal flux and the components of the magnetic field,
+        and optionally their partial derivatives, in one call.
+
+        Parameters
+        ----------
+        q_R:
+        q_Z:
+            Coordinates to evaluate the field at
+        derivatives:
+            Highest order of partial derivatives to include: 0 for just
+            the values, 1 to add the gradients, and 2 to also add the
+            second derivatives
+
+        Returns
+        -------
+        Dict[str, FloatArray]
+            The values under each ``name`` in `FIELD_QUANTITIES`, and
+            the derivatives under the same keys as `derivatives`, up
+            to the requested order
+
+        The default implementation calls each of the methods in turn.
+        Subclasses that can share work between the quantities, such as
+        `InterpolatedField`, should override this.
+        """
+        _check_derivative_order(derivatives)
+        methods = (self.poloidal_flux, self.B_R, self.B_T, self.B_Z)
+        result = {
+            name: method(q_R, q_Z) for name, method in zip(FIELD_QUANTITIES, methods)
+        }
+        if derivatives > 0:
+            result.update(
+                (key, value)
+                for key, value in self.derivatives(q_R, q_Z).items()
+                if _derivative_order(key) <= derivatives
+            )
+        return result
+
+    def derivatives(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, FloatArray]:
+        """First and second partial derivatives in ``R`` and ``Z`` of the
+        poloidal flux and the components of the magnetic field.
+
+        Keys are of the form ``"d{name}_dR"``, ``"d{name}_dZ"``,
+        ``"d2{name}_dR2"``, ``"d2{name}_dZ2"``, and ``"d2{name}_dR_dZ"``
+        for each ``name`` in `FIELD_QUANTITIES`.
+
+        The default implementation uses central finite differences
+        with spacings `delta_R` and `delta_Z`. Subclasses that can do
+        better, for example by differentiating their splines, should
+        override this.
+        """
+        q_R, q_Z = np.asfarray(q_R), np.asfarray(q_Z)
+        dx = (self.delta_R, self.delta_Z)
+        result = {}
+        methods = (self.poloidal_flux, self.B_R, self.B_T, self.B_Z)
+        for name, method in zip(FIELD_QUANTITIES, methods):
+            result[f"d{name}_dR"] = cfd_gradient(
+                method, q_R=q_R, q_Z=q_Z, directions="q_R", dx=dx[0]
+            )
+            result[f"d{name}_dZ"] = cfd_gradient(
+                method, q_R=q_R, q_Z=q_Z, directions="q_Z", dx=dx[1]
+            )
+            result[f"d2{name}_dR2"] = cfd_gradient(
+                method, q_R=q_R, q_Z=q_Z, directions="q_R", dx=dx[0], d_order=2
+            )
+            result[f"d2{name}_dZ2"] = cfd_gradient(
+                method, q_R=q_R, q_Z=q_Z, directions="q_Z", dx=dx[1], d_order=2
+            )
+            result[f"d2{name}_dR_dZ"] = cfd_gradient(
+                method,
+                q_R=q_R,
+                q_Z=q_Z,
+                directions=("q_R", "q_Z"),
+                dx=np.array(dx),
+                d_order=2,
+            )
+        return result
+
+
+FIELD_QUANTITIES = ("polflux", "B_R", "B_T", "B_Z")
+"""Names of the quantities returned by `MagneticField.evaluate` and
+`MagneticField.derivatives`"""
+
 
 class CircularCrossSectionField(MagneticField):
     """Simple circular cross-section magnetic geometry
@@ -105,6 +195,20 @@ class CircularCrossSectionField(MagneticField):
         q_R, q_Z = np.asfarray(q_R), np.asfarray(q_Z)
         return self.rho(q_R, q_Z) / self.minor_radius_a
 
+    def derivatives(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, FloatArray]:
+        """Exact partial derivatives, see `MagneticField.derivatives`"""
+        q_R, q_Z = np.broadcast_arrays(np.asfarray(q_R), np.asfarray(q_Z))
+        rho, z_over_rho, x_over_rho = _circular_partials(q_R - self.R_axis, q_Z)
+        B_p_factor = self.B_p_a / self.minor_radius_a
+        return {
+            **_named_partials("polflux", rho, 1 / self.minor_radius_a),
+            **_over_R_derivatives("B_R", z_over_rho, q_R, B_p_factor),
+            **_over_R_derivatives(
+                "B_T", _toroidal_partials(q_R), q_R, self.B_T_axis * self.R_axis
+            ),
+            **_over_R_derivatives("B_Z", x_over_rho, q_R, -B_p_factor),
+        }
+
 
 class ConstantCurrentDensityField(MagneticField):
     """Circular cross-section magnetic geometry with constant current density
@@ -172,6 +276,19 @@ class ConstantCurrentDensityField(MagneticField):
         q_R, q_Z = np.asfarray(q_R), np.asfarray(q_Z)
         return self.rho(q_R, q_Z) / self.minor_radius_a
 
+    def derivatives(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, FloatArray]:
+        """Exact partial derivatives, see `MagneticField.derivatives`"""
+        q_R, q_Z = np.broadcast_arrays(np.asfarray(q_R), np.asfarray(q_Z))
+        rho, z_over_rho, x_over_rho = _circular_partials(q_R - self.R_axis, q_Z)
+        return {
+            **_named_partials("polflux", rho, 1 / self.minor_radius_a),
+            **_named_partials("B_R", z_over_rho, self.B_p_a),
+            **_over_R_derivatives(
+                "B_T", _toroidal_partials(q_R), q_R, self.B_T_axis * self.R_axis
+            ),
+            **_named_partials("B_Z", x_over_rho, -self.B_p_a),
+        }
+
 
 class CurvySlabField(MagneticField):
     """Analytical curvy slab geometry"""
@@ -205,7 +322,254 @@ def _make_rect_spline(
         ky=interp_order,
         s=interp_smoothing,
     )
-    return lambda q_R, q_Z: spline(q_R, q_Z, grid=False)
+
+    def interpolate(q_R, q_Z, dx=0, dy=0):
+        return apply_bivariate(
+            lambda R, Z, nx, ny: spline(R, Z, dx=dx + nx, dy=dy + ny, grid=False),
+            q_R,
+            q_Z,
+        )
+
+    # Keep the spline itself around for its knots and coefficients
+    interpolate.spline = spline  # type: ignore[attr-defined]
+    return interpolate
+
+
+SPATIAL_DERIVATIVE_ORDERS = {
+    "d{}_dR": (1, 0),
+    "d{}_dZ": (0, 1),
+    "d2{}_dR2": (2, 0),
+    "d2{}_dZ2": (0, 2),
+    "d2{}_dR_dZ": (1, 1),
+}
+"""Orders in ``(R, Z)`` of each of the derivatives in `MagneticField.derivatives`"""
+
+
+def _derivative_order(key: str) -> int:
+    """Total order of a derivative key from `MagneticField.derivatives`"""
+    return 2 if key.startswith("d2") else 1
+
+
+def _check_derivative_order(derivatives: int):
+    if derivatives not in (0, 1, 2):
+        raise ValueError(
+            f"Can only evaluate up to second derivatives, got derivatives={derivatives}"
+        )
+
+
+def _knot_span(t: FloatArray, k: int, x: FloatArray) -> Tuple[FloatArray, FloatArray]:
+    """Clamp ``x`` to the knots, like FITPACK, and find the index ``l``
+    of the knot interval ``t[l] <= x < t[l + 1]``"""
+    x = np.clip(x, t[k], t[len(t) - k - 1])
+    span = np.clip(np.searchsorted(t, x, side="right") - 1, k, len(t) - k - 2)
+    return x, span
+
+
+def _bspline_basis(
+    t: FloatArray, k: int, x: FloatArray, span: FloatArray, derivatives: int
+) -> FloatArray:
+    """The ``k + 1`` non-zero B-splines of degree ``k`` at each ``x`` in
+    the knot interval ``span``, and their derivatives up to order
+    `derivatives`, from the Cox-de Boor recursion vectorised over the
+    points.
+
+    Returns an array of shape ``(derivatives + 1, k + 1, len(x))``,
+    where ``[n, r]`` is the ``n``-th derivative of the B-spline
+    ``span - k + r``
+    """
+    offsets = np.arange(k)[:, np.newaxis]
+    # Distances to the knots on either side, t[span + 1 + i] - x and
+    # x - t[span - i]
+    right = t[span + 1 + offsets] - x
+    left = x - t[span - offsets]
+
+    # B-splines of each degree j up to k, and the reciprocals of the
+    # knot spans used to raise them from degree j - 1
+    tables = [np.ones((1, len(x)))]
+    scales = [None]
+    for j in range(1, k + 1):
+        scale = 1 / (right[:j] + left[j - 1 :: -1])
+        temp = tables[-1] * scale
+        basis = np.zeros((j + 1, len(x)))
+        basis[:-1] += right[:j] * temp
+        basis[1:] += left[j - 1 :: -1] * temp
+        tables.append(basis)
+        scales.append(scale)
+
+    # The derivative of a degree j B-spline is a difference of two of
+    # degree j - 1, so the n-th derivative comes from degree k - n
+    result = np.empty((derivatives + 1, k + 1, len(x)))
+    result[0] = tables[k]
+    for n in range(1, derivatives + 1):
+        basis = tables[k - n]
+        for j in range(k - n + 1, k + 1):
+            temp = j * basis * scales[j]
+            basis = np.zeros((j + 1, len(x)))
+            basis[:-1] -= temp
+            basis[1:] += temp
+        result[n] = basis
+    return result
+
+
+class _StackedSplines:
+    """Bivariate splines of several quantities sharing the same knots,
+    evaluated together so that the knot intervals and B-splines are
+    only found once for all of them"""
+
+    def __init__(self, splines: Sequence[RectBivariateSpline]):
+        self.tx, self.ty, _ = splines[0].tck
+        self.kx, self.ky = splines[0].degrees
+        shape = (len(self.tx) - self.kx - 1, len(self.ty) - self.ky - 1)
+        coefficients = np.stack(
+            [np.reshape(spline.get_coeffs(), shape) for spline in splines], axis=1
+        )
+        # View of the (kx + 1, ky + 1) patch of coefficients for each
+        # pair of knot intervals, with shape
+        # (x intervals, quantities, y intervals, kx + 1, ky + 1)
+        self.patches = np.lib.stride_tricks.sliding_window_view(
+            coefficients, (self.kx + 1, self.ky + 1), axis=(0, 2)
+        )
+
+    @classmethod
+    def from_splines(
+        cls, splines: Sequence[RectBivariateSpline]
+    ) -> Optional[_StackedSplines]:
+        """Stack the splines if they can be, or ``None`` if they have
+        different knots, as happens with smoothing"""
+        tx, ty, _ = splines[0].tck
+        for spline in splines[1:]:
+            other_tx, other_ty, _ = spline.tck
+            if (
+                spline.degrees != splines[0].degrees
+                or not np.array_equal(other_tx, tx)
+                or not np.array_equal(other_ty, ty)
+            ):
+                return None
+        return cls(splines)
+
+    def _basis(
+        self, x: FloatArray, y: FloatArray, derivatives: int
+    ) -> Tuple[FloatArray, FloatArray, FloatArray, FloatArray]:
+        """Knot intervals and B-splines in each direction. With equal
+        degrees, both directions go through the recursion together"""
+        x, span_x = _knot_span(self.tx, self.kx, x)
+        y, span_y = _knot_span(self.ty, self.ky, y)
+        if self.kx != self.ky:
+            return (
+                span_x,
+                span_y,
+                _bspline_basis(self.tx, self.kx, x, span_x, derivatives),
+                _bspline_basis(self.ty, self.ky, y, span_y, derivatives),
+            )
+        basis = _bspline_basis(
+            np.concatenate((self.tx, self.ty)),
+            self.kx,
+            np.concatenate((x, y)),
+            np.concatenate((span_x, span_y + len(self.tx))),
+            derivatives,
+        )
+        return span_x, span_y, basis[..., : len(x)], basis[..., len(x) :]
+
+    def __call__(
+        self, x: ArrayLike, y: ArrayLike, derivatives: int = 0
+    ) -> Dict[Tuple[int, int], FloatArray]:
+        """Partial derivatives of every quantity, keyed by their orders
+        in ``(x, y)`` and with the quantities along the first axis"""
+        x, y = np.broadcast_arrays(np.asfarray(x), np.asfarray(y))
+        shape = x.shape
+        span_x, span_y, basis_x, basis_y = self._basis(
+            x.ravel(), y.ravel(), derivatives
+        )
+
+        # Coefficients of the non-zero B-splines at each point, with
+        # shape (points, quantities, kx + 1, ky + 1)
+        coefficients = self.patches[span_x - self.kx, :, span_y - self.ky]
+
+        # Contract with the B-splines (and their derivatives) in y and
+        # then in x, for all of the orders at once, giving shape
+        # (points, quantities, x orders, y orders)
+        basis_x = np.moveaxis(basis_x, -1, 0)[:, np.newaxis]
+        basis_y = np.moveaxis(basis_y, -1, 0).swapaxes(1, 2)[:, np.newaxis]
+        values = basis_x @ (coefficients @ basis_y)
+
+        return {
+            (nx, ny): np.reshape(values[:, :, nx, ny].T, (-1,) + shape)
+            for nx in range(derivatives + 1)
+            for ny in range(derivatives + 1 - nx)
+        }
+
+
+def _over_R_derivatives(
+    name: str, partials: Dict[tuple, FloatArray], q_R: FloatArray, factor: float
+) -> Dict[str, FloatArray]:
+    r"""Derivatives of :math:`f = c p(R, Z) / R`, given the partial
+    derivatives of :math:`p` up to the orders needed, keyed by the
+    ``(R, Z)`` orders"""
+    return {
+        f"d{name}_dR": factor * (partials[1, 0] / q_R - partials[0, 0] / q_R**2),
+        f"d{name}_dZ": factor * partials[0, 1] / q_R,
+        f"d2{name}_dR2": factor
+        * (
+            partials[2, 0] / q_R
+            - 2 * partials[1, 0] / q_R**2
+            + 2 * partials[0, 0] / q_R**3
+        ),
+        f"d2{name}_dZ2": factor * partials[0, 2] / q_R,
+        f"d2{name}_dR_dZ": factor * (partials[1, 1] / q_R - partials[0, 1] / q_R**2),
+    }
+
+
+def _named_partials(
+    name: str, partials: Dict[tuple, FloatArray], factor: float
+) -> Dict[str, FloatArray]:
+    """Derivatives of :math:`f = c p(R, Z)` given the partial derivatives
+    of :math:`p`, keyed by the ``(R, Z)`` orders"""
+    return {
+        key.format(name): factor * partials[orders]
+        for key, orders in SPATIAL_DERIVATIVE_ORDERS.items()
+    }
+
+
+def _toroidal_partials(q_R: FloatArray) -> Dict[tuple, FloatArray]:
+    r"""Partial derivatives of a constant, for fields :math:`\propto 1/R`"""
+    zeros = np.zeros_like(q_R)
+    partials = {orders: zeros for orders in SPATIAL_DERIVATIVE_ORDERS.values()}
+    partials[0, 0] = np.ones_like(q_R)
+    return partials
+
+
+def _circular_partials(x: FloatArray, z: FloatArray):
+    r"""Partial derivatives in ``(R, Z)`` of :math:`\rho`, :math:`z/\rho`
+    and :math:`x/\rho`, where :math:`x = R - R_\mathrm{axis}` and
+    :math:`\rho = \sqrt{x^2 + z^2}`"""
+    rho = np.sqrt(x**2 + z**2)
+    rho_3 = rho**3
+    rho_5 = rho**5
+    rho_partials = {
+        (0, 0): rho,
+        (1, 0): x / rho,
+        (0, 1): z / rho,
+        (2, 0): z**2 / rho_3,
+        (0, 2): x**2 / rho_3,
+        (1, 1): -x * z / rho_3,
+    }
+    z_over_rho = {
+        (0, 0): z / rho,
+        (1, 0): -x * z / rho_3,
+        (0, 1): x**2 / rho_3,
+        (2, 0): z * (3 * x**2 - rho**2) / rho_5,
+        (0, 2): -3 * x**2 * z / rho_5,
+        (1, 1): x * (3 * z**2 - rho**2) / rho_5,
+    }
+    x_over_rho = {
+        (0, 0): x / rho,
+        (1, 0): z**2 / rho_3,
+        (0, 1): -x * z / rho_3,
+        (2, 0): -3 * z**2 * x / rho_5,
+        (0, 2): x * (3 * z**2 - rho**2) / rho_5,
+        (1, 1): z * (3 * x**2 - rho**2) / rho_5,
+    }
+    return rho_partials, z_over_rho, x_over_rho
 
 
 class InterpolatedField(MagneticField):
@@ -254,6 +618,17 @@ class InterpolatedField(MagneticField):
         self._interp_poloidal_flux = _make_rect_spline(
             R_grid, Z_grid, psi, interp_order, interp_smoothing
         )
+        self._stacked = _StackedSplines.from_splines(
+            [
+                interpolator.spline  # type: ignore[attr-defined]
+                for interpolator in (
+                    self._interp_poloidal_flux,
+                    self._interp_B_R,
+                    self._interp_B_T,
+                    self._interp_B_Z,
+                )
+            ]
+        )
 
         self.R_coord = R_grid
         self.Z_coord = Z_grid
@@ -271,6 +646,63 @@ class InterpolatedField(MagneticField):
     def poloidal_flux(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         return self._interp_poloidal_flux(q_R, q_Z)
 
+    def _can_stack(self, q_R: ArrayLike, q_Z: ArrayLike) -> bool:
+        """The stacked splines can only be used on plain arrays, and
+        only if all of the splines share the same knots"""
+        return (
+            self._stacked is not None
+            and not isinstance(q_R, Jet)
+            and not isinstance(q_Z, Jet)
+        )
+
+    def evaluate(
+        self, q_R: ArrayLike, q_Z: ArrayLike, derivatives: int = 0
+    ) -> Dict[str, FloatArray]:
+        """All of the interpolating splines at once, sharing the knot
+        interval search and B-splines between them, see
+        `MagneticField.evaluate`.
+
+        For the values alone, FITPACK evaluating each spline in turn is
+        already cheaper than a vectorised pass through the recursion,
+        so the splines are only stacked when derivatives are needed
+        """
+        _check_derivative_order(derivatives)
+        if derivatives == 0 or not self._can_stack(q_R, q_Z):
+            return super().evaluate(q_R, q_Z, derivatives)
+
+        partials = self._stacked(q_R, q_Z, derivatives)
+        result = dict(zip(FIELD_QUANTITIES, partials[0, 0]))
+        for key, orders in SPATIAL_DERIVATIVE_ORDERS.items():
+            if sum(orders) <= derivatives:
+                result.update(
+                    (key.format(name), value)
+                    for name, value in zip(FIELD_QUANTITIES, partials[orders])
+                )
+        return result
+
+    def derivatives(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, FloatArray]:
+        """Partial derivatives of the interpolating splines, see
+        `MagneticField.derivatives`"""
+        if self._can_stack(q_R, q_Z):
+            result = self.evaluate(q_R, q_Z, derivatives=2)
+            return {
+                key: value
+                for key, value in result.items()
+                if key not in FIELD_QUANTITIES
+            }
+
+        splines = (
+            self._interp_poloidal_flux,
+            self._interp_B_R,
+            self._interp_B_T,
+            self._interp_B_Z,
+        )
+        return {
+            key.format(name): spline(q_R, q_Z, *orders)
+            for name, spline in zip(FIELD_QUANTITIES, splines)
+            for key, orders in SPATIAL_DERIVATIVE_ORDERS.items()
+        }
+
 
 class EFITField(MagneticField):
     def __init__(
@@ -293,6 +725,7 @@ class EFITField(MagneticField):
 
         self.delta_R = delta_R
         self.delta_Z = delta_Z
+        self.interp_order = interp_order
 
         self._interp_poloidal_flux = _make_rect_spline(
             R_grid, Z_grid, psi_norm_2D, interp_order, interp_smoothing
@@ -321,7 +754,8 @@ class EFITField(MagneticField):
 
     def B_T(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         polflux = self._interp_poloidal_flux(q_R, q_Z)
-        return self._interp_rBphi(polflux) / q_R
+        rBphi = apply_univariate(lambda x, nu: self._interp_rBphi(x, nu=nu), polflux)
+        return rBphi / q_R
 
     def B_Z(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         dpolflux_dR = find_dpolflux_dR(
@@ -332,6 +766,52 @@ class EFITField(MagneticField):
     def poloidal_flux(self, q_R: ArrayLike, q_Z: ArrayLike) -> FloatArray:
         return self._interp_poloidal_flux(q_R, q_Z)
 
+    def derivatives(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, FloatArray]:
+        """Partial derivatives from the poloidal flux and ``rBphi``
+        splines, see `MagneticField.derivatives`.
+
+        As ``B_R`` and ``B_Z`` are themselves derivatives of the flux,
+        their second derivatives need the third derivatives of the
+        flux spline. Below quartic interpolation these don't exist,
+        and we fall back to finite differences
+        """
+        if self.interp_order < 4:
+            return super().derivatives(q_R, q_Z)
+
+        q_R, q_Z = np.asfarray(q_R), np.asfarray(q_Z)
+        psi = {
+            (dx, dy): self._interp_poloidal_flux(q_R, q_Z, dx, dy)
+            for dx in range(4)
+            for dy in range(4 - dx)
+        }
+        result = {
+            key.format("polflux"): psi[orders]
+            for key, orders in SPATIAL_DERIVATIVE_ORDERS.items()
+        }
+
+        # B_R = -psi_Z * gradient / R and B_Z = psi_R * gradient / R
+        dpsi_dZ = {(dx, dy): psi[dx, dy + 1] for dx in range(3) for dy in range(3 - dx)}
+        dpsi_dR = {(dx, dy): psi[dx + 1, dy] for dx in range(3) for dy in range(3 - dx)}
+        result.update(
+            _over_R_derivatives("B_R", dpsi_dZ, q_R, -self.poloidal_flux_gradient)
+        )
+        result.update(
+            _over_R_derivatives("B_Z", dpsi_dR, q_R, self.poloidal_flux_gradient)
+        )
+
+        # B_T = rBphi(psi) / R
+        rBphi = [self._interp_rBphi(psi[0, 0], nu=nu) for nu in range(3)]
+        rBphi_partials = {
+            (0, 0): rBphi[0],
+            (1, 0): rBphi[1] * psi[1, 0],
+            (0, 1): rBphi[1] * psi[0, 1],
+            (2, 0): rBphi[2] * psi[1, 0] ** 2 + rBphi[1] * psi[2, 0],
+            (0, 2): rBphi[2] * psi[0, 1] ** 2 + rBphi[1] * psi[0, 2],
+            (1, 1): rBphi[2] * psi[1, 0] * psi[0, 1] + rBphi[1] * psi[1, 1],
+        }
+        result.update(_over_R_derivatives("B_T", rBphi_partials, q_R, 1.0))
+        return result
+
     @classmethod
     def from_EFITpp(
         cls,
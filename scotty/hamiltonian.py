@@ -1,20 +1,21 @@
 # Copyright 2023 - 2023, Valerian Hall-Chen and the Scotty contributors
 # SPDX-License-Identifier: GPL-3.0
 
-from scotty.geometry import MagneticField
-from scotty.density_fit import DensityFitLike
+from scotty.autodiff import Jet, variables
+from scotty.geometry import FIELD_QUANTITIES, MagneticField
+from scotty.density_fit import DERIVATIVE_DELTA_POLFLUX, DensityFit, DensityFitLike
+from scotty.fun_CFD import cfd_gradient
 from scotty.fun_general import (
     angular_frequency_to_wavenumber,
     find_normalised_gyro_freq,
     find_normalised_plasma_freq,
-    contract_special,
 )
 from scotty.typing import ArrayLike, FloatArray
 
 
-from dataclasses import dataclass, asdict
+from copy import copy
 import numpy as np
-from typing import Dict, Tuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
 
 
 class DielectricTensor:
@@ -53,7 +54,8 @@ class DielectricTensor:
     electron_density:
         Electron number density
     angular_frequency:
-        Angular frequency of the beam
+        Angular frequency of the beam. This may be an array, which is
+        broadcast against ``electron_density`` and ``B_total``
     B_total:
         Magnitude of the magnetic field
 
@@ -62,7 +64,7 @@ class DielectricTensor:
     def __init__(
         self,
         electron_density: ArrayLike,
-        angular_frequency: float,
+        angular_frequency: ArrayLike,
         B_total: ArrayLike,
     ):
         _plasma_freq_2 = (
@@ -132,6 +134,244 @@ CFD_CFD_stencil: Stencil = {
 }
 """Stencil for the mixed second central-difference"""
 
+COORDINATES = ("q_R", "q_Z", "K_R", "K_zeta", "K_Z")
+"""Names of the coordinates the Hamiltonian depends on, in argument order"""
+
+FIRST_ORDER_DERIVATIVES = (
+    ("dH_dR", ("q_R",), FFD1_stencil),
+    ("dH_dZ", ("q_Z",), FFD1_stencil),
+    ("dH_dKR", ("K_R",), CFD1_stencil),
+    ("dH_dKzeta", ("K_zeta",), CFD1_stencil),
+    ("dH_dKZ", ("K_Z",), CFD1_stencil),
+)
+"""Names, directions and stencils of the first derivatives of :math:`H`"""
+
+SECOND_ORDER_DERIVATIVES = (
+    ("d2H_dR2", ("q_R", "q_R"), FFD2_stencil),
+    ("d2H_dZ2", ("q_Z", "q_Z"), FFD2_stencil),
+    ("d2H_dKR2", ("K_R", "K_R"), CFD2_stencil),
+    ("d2H_dKzeta2", ("K_zeta", "K_zeta"), CFD2_stencil),
+    ("d2H_dKZ2", ("K_Z", "K_Z"), CFD2_stencil),
+    ("d2H_dR_dZ", ("q_R", "q_Z"), FFD_FFD_stencil),
+    ("d2H_dR_dKR", ("q_R", "K_R"), FFD_CFD_stencil),
+    ("d2H_dR_dKzeta", ("q_R", "K_zeta"), FFD_CFD_stencil),
+    ("d2H_dR_dKZ", ("q_R", "K_Z"), FFD_CFD_stencil),
+    ("d2H_dZ_dKR", ("q_Z", "K_R"), FFD_CFD_stencil),
+    ("d2H_dZ_dKzeta", ("q_Z", "K_zeta"), FFD_CFD_stencil),
+    ("d2H_dZ_dKZ", ("q_Z", "K_Z"), FFD_CFD_stencil),
+    ("d2H_dKR_dKZ", ("K_R", "K_Z"), CFD_CFD_stencil),
+    ("d2H_dKR_dKzeta", ("K_R", "K_zeta"), CFD_CFD_stencil),
+    ("d2H_dKzeta_dKZ", ("K_zeta", "K_Z"), CFD_CFD_stencil),
+)
+"""Names, directions and stencils of the second derivatives of :math:`H`"""
+
+
+class StencilPlan:
+    r"""Precompiled set of finite difference stencils for evaluating a
+    number of derivatives of a function of the five coordinates
+    ``(q_R, q_Z, K_R, K_zeta, K_Z)`` at once.
+
+    All of the stencils are merged into a single table of unique
+    evaluation points, stored as an integer matrix of offsets in each
+    of the directions in `COORDINATES`. Each derivative is then a row
+    of a weights matrix over these points, already divided through by
+    the relevant spacings. Applying the plan to the function values
+    sums each stencil over its own points in a fixed order, so that
+    every point of a batch gives the same derivatives as it does on
+    its own, which a matrix product doesn't guarantee.
+
+    Parameters
+    ----------
+    derivatives
+        Sequence of ``(name, directions, stencil)``, as in
+        `FIRST_ORDER_DERIVATIVES`
+    spacings
+        Finite difference spacing in each direction
+
+    """
+
+    def __init__(
+        self,
+        derivatives: Sequence[Tuple[str, Tuple[str, ...], Stencil]],
+        spacings: Dict[str, float],
+    ):
+        self.names = tuple(name for name, _, _ in derivatives)
+        self.spacings = np.array([spacings[dim] for dim in COORDINATES])
+
+        # Map each unique offset to a column of the weights matrix,
+        # so that points shared between stencils are only evaluated
+        # once
+        offset_index: Dict[Tuple[int, ...], int] = {}
+        rows = []
+        for _, dims, stencil in derivatives:
+            scale = np.prod([spacings[dim] for dim in dims])
+            # For second order derivatives, remove repeated dimensions
+            if len(dims) == 2 and dims[1] == dims[0]:
+                dims = (dims[0],)
+
+            row = {}
+            for stencil_offsets, weight in stencil.items():
+                offsets = dict(zip(dims, stencil_offsets))
+                coord_offset = tuple(offsets.get(dim, 0) for dim in COORDINATES)
+                index = offset_index.setdefault(coord_offset, len(offset_index))
+                row[index] = weight / scale
+            rows.append(row)
+
+        #: Integer offsets of each evaluation point, shape ``(points, 5)``
+        self.offsets = np.array(list(offset_index.keys()), dtype=int)
+        #: Absolute displacement of each evaluation point
+        self.displacements = self.offsets * self.spacings
+        #: Unique offsets in ``(q_R, q_Z)``, shape ``(spatial points, 2)``
+        self.spatial_offsets, self.spatial_index = np.unique(
+            self.offsets[:, :2], axis=0, return_inverse=True
+        )
+        self.spatial_index = self.spatial_index.ravel()
+        self.spatial_displacements = self.spatial_offsets * self.spacings[:2]
+        #: Weights of each evaluation point, shape ``(derivatives, points)``
+        self.weights = np.zeros((len(rows), len(offset_index)))
+        for derivative_index, row in enumerate(rows):
+            for index, weight in row.items():
+                self.weights[derivative_index, index] = weight
+
+        # The same, as the points and weights of each stencil, padded to
+        # the longest one with zero weights on one of its own points,
+        # shape ``(stencil points, derivatives)``
+        width = max(len(row) for row in rows)
+        self._stencil_points = np.array(
+            [list(row) + [next(iter(row))] * (width - len(row)) for row in rows]
+        ).T
+        self._stencil_weights = np.array(
+            [list(row.values()) + [0.0] * (width - len(row)) for row in rows]
+        ).T
+
+    def points(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+    ) -> Tuple[List[FloatArray], Tuple[int, ...]]:
+        """Coordinates of all the evaluation points around the given
+        point(s), flattened with the stencil offsets along the first
+        axis. Also returns the broadcast shape of the input points"""
+        starts = np.broadcast_arrays(q_R, q_Z, K_R, K_zeta, K_Z)
+        shape = starts[0].shape
+        displacements = self.displacements.reshape(
+            self.displacements.shape + (1,) * len(shape)
+        )
+        coords = [
+            (start[np.newaxis, ...] + displacement).ravel()
+            for start, displacement in zip(starts, np.moveaxis(displacements, 1, 0))
+        ]
+        return coords, shape
+
+    def spatial_points(
+        self, q_R: ArrayLike, q_Z: ArrayLike, shape: Tuple[int, ...]
+    ) -> Tuple[FloatArray, FloatArray]:
+        """Coordinates of the unique positions among the evaluation points
+        around the given point(s), flattened as in `points`. Several
+        evaluation points that only differ in ``K`` share each of
+        these positions"""
+        displacements = self.spatial_displacements.reshape(
+            self.spatial_displacements.shape + (1,) * len(shape)
+        )
+        q_R, q_Z = np.broadcast_to(q_R, shape), np.broadcast_to(q_Z, shape)
+        return (
+            (q_R[np.newaxis, ...] + displacements[:, 0]).ravel(),
+            (q_Z[np.newaxis, ...] + displacements[:, 1]).ravel(),
+        )
+
+    def expand_spatial(self, values: ArrayLike, shape: Tuple[int, ...]) -> FloatArray:
+        """Map values at `spatial_points` onto all of the evaluation
+        points. The last axis of ``values`` must be the flattened
+        spatial points"""
+        values = np.asarray(values)
+        leading = values.shape[:-1]
+        values = values.reshape(leading + (len(self.spatial_offsets), -1))
+        return values[..., self.spatial_index, :].reshape(leading + (-1,))
+
+    def apply(
+        self, values: ArrayLike, shape: Tuple[int, ...] = ()
+    ) -> Dict[str, ArrayLike]:
+        """Apply the stencils to the function evaluated at `points`"""
+        values = np.reshape(values, (len(self.offsets),) + shape)
+        weights = np.reshape(
+            self._stencil_weights, self._stencil_weights.shape + (1,) * len(shape)
+        )
+        results = weights[0] * values[self._stencil_points[0]]
+        for points, weight in zip(self._stencil_points[1:], weights[1:]):
+            results += weight * values[points]
+        return dict(zip(self.names, results))
+
+
+def _spatial_jet(
+    value: ArrayLike,
+    derivatives: Dict[str, FloatArray],
+    name: str,
+    second_order: bool,
+) -> Jet:
+    """Build a `Jet` over the `COORDINATES` for a field quantity from
+    the output of `MagneticField.evaluate`"""
+    jet = Jet.constant(value, len(COORDINATES), second_order)
+    jet.gradient[0] = derivatives[f"d{name}_dR"]
+    jet.gradient[1] = derivatives[f"d{name}_dZ"]
+    if second_order:
+        jet.hessian[0, 0] = derivatives[f"d2{name}_dR2"]
+        jet.hessian[1, 1] = derivatives[f"d2{name}_dZ2"]
+        jet.hessian[0, 1] = jet.hessian[1, 0] = derivatives[f"d2{name}_dR_dZ"]
+    return jet
+
+
+def _named_derivatives(H: Jet) -> Dict[str, ArrayLike]:
+    """Convert the derivatives of a `Jet` over the `COORDINATES` to
+    the names used by `Hamiltonian.derivatives`"""
+    index = {dim: i for i, dim in enumerate(COORDINATES)}
+    dH = {name: H.gradient[index[dim]] for name, (dim,), _ in FIRST_ORDER_DERIVATIVES}
+    if H.second_order:
+        dH.update(
+            {
+                name: H.hessian[index[dim_1], index[dim_2]]
+                for name, (dim_1, dim_2), _ in SECOND_ORDER_DERIVATIVES
+            }
+        )
+    return dH
+
+
+def _check_derivative_names(names: FrozenSet[str]):
+    all_names = [
+        name for name, _, _ in FIRST_ORDER_DERIVATIVES + SECOND_ORDER_DERIVATIVES
+    ]
+    unknown = names.difference(all_names)
+    if unknown:
+        raise ValueError(
+            f"Unknown derivatives of H requested: {sorted(unknown)}. "
+            f"Expected some of {all_names}"
+        )
+
+
+def refractive_index_squared(
+    Booker_alpha: ArrayLike,
+    Booker_beta: ArrayLike,
+    H_discriminant: ArrayLike,
+    mode_flag: int,
+) -> ArrayLike:
+    r"""Square of the refractive index, :math:`N^2`, of one of the two
+    branches of the Booker quartic:
+
+    .. math::
+
+        N^2 = -\frac{\beta - m \sqrt{\beta^2 - 4\alpha\gamma}}{2\alpha}
+
+    where :math:`m` is ``mode_flag``. The Hamiltonian is then
+    :math:`H = (K/K_0)^2 - N^2`
+    """
+    return -(Booker_beta - mode_flag * np.sqrt(H_discriminant)) / (2 * Booker_alpha)
+
+
+DERIVATIVE_METHODS = ("finite-difference", "analytic", "autodiff")
+"""Methods of computing the derivatives of :math:`H`"""
+
 
 class Hamiltonian:
     r"""Functor to evaluate derivatives of the Hamiltonian, :math:`H`, at a
@@ -163,14 +403,36 @@ class Hamiltonian:
     The stencils have been chosen to maximise the reuse of Hamiltonian
     evaluations without sacrificing accuracy.
 
+    Alternatively, with ``derivative_method="analytic"``, the derivatives
+    are computed in closed form by applying the chain rule through the
+    Booker coefficients, using the derivatives of the magnetic field
+    (`MagneticField.derivatives`) and of the density profile
+    (`DensityFit.derivative`). This needs only one evaluation of the
+    equilibrium per point, and doesn't depend on the ``delta_*``
+    spacings, except where the field or density fall back to finite
+    differences themselves.
+
+    Lastly, with ``derivative_method="autodiff"``, the Hamiltonian is
+    evaluated once on `scotty.autodiff.Jet` variables, which carry
+    their exact first and second derivatives through the same code
+    as `__call__`. This works for fields and density fits written in
+    terms of NumPy operations, and for the spline-based ones.
+
+    The frequency and mode may also be arrays, in which case they are
+    broadcast against the points :math:`H` is evaluated at. This
+    evaluates a batch of beams at different frequencies, or in
+    different modes, in a single vectorised call.
+
     Parameters
     ----------
     field
         An object describing the magnetic field of the plasma
     launch_angular_frequency
-        Angular frequency of the beam
+        Angular frequency of the beam, or an array of them for each
+        point
     mode_flag
-        Either ``+/-1``, used to determine which mode branch to use
+        Either ``+/-1``, used to determine which mode branch to use, or
+        an array of them for each point
     density_fit
         Function or ``Callable`` parameterising the density
     delta_R
@@ -183,22 +445,36 @@ class Hamiltonian:
         Finite difference spacing in the ``K_zeta`` direction
     delta_K_Z
         Finite difference spacing in the ``K_Z`` direction
+    derivative_method
+        One of `DERIVATIVE_METHODS`: ``"finite-difference"`` (default),
+        ``"analytic"``, or ``"autodiff"``
 
     """
 
     def __init__(
         self,
         field: MagneticField,
-        launch_angular_frequency: float,
-        mode_flag: int,
+        launch_angular_frequency: ArrayLike,
+        mode_flag: ArrayLike,
         density_fit: DensityFitLike,
         delta_R: float,
         delta_Z: float,
         delta_K_R: float,
         delta_K_zeta: float,
         delta_K_Z: float,
+        derivative_method: str = "finite-difference",
     ):
+        if derivative_method not in DERIVATIVE_METHODS:
+            raise ValueError(
+                f"Unknown derivative method '{derivative_method}'. "
+                f"Expected one of {DERIVATIVE_METHODS}"
+            )
+        self.derivative_method = derivative_method
         self.field = field
+        if np.ndim(launch_angular_frequency):
+            launch_angular_frequency = np.asfarray(launch_angular_frequency)
+        if np.ndim(mode_flag):
+            mode_flag = np.asarray(mode_flag)
         self.angular_frequency = launch_angular_frequency
         self.wavenumber_K0 = angular_frequency_to_wavenumber(launch_angular_frequency)
         self.mode_flag = mode_flag
@@ -210,6 +486,21 @@ class Hamiltonian:
             "K_zeta": delta_K_zeta,
             "K_Z": delta_K_Z,
         }
+        self.stencil_plans: Dict[FrozenSet[str], StencilPlan] = {}
+
+    def select(self, index) -> "Hamiltonian":
+        """Return a copy of this Hamiltonian for a subset of beams,
+        taking ``index`` of the frequency and mode where they are
+        arrays. The copy shares the stencil plans with this one
+
+        """
+        selected = copy(self)
+        if np.ndim(self.angular_frequency):
+            selected.angular_frequency = self.angular_frequency[index]
+            selected.wavenumber_K0 = self.wavenumber_K0[index]
+        if np.ndim(self.mode_flag):
+            selected.mode_flag = self.mode_flag[index]
+        return selected
 
     def __call__(
         self,
@@ -235,26 +526,96 @@ class Hamiltonian:
 
         """
 
-        K_magnitude = np.sqrt(K_R**2 + (K_zeta / q_R) ** 2 + K_Z**2)
-        poloidal_flux = self.field.poloidal_flux(q_R, q_Z)
+        return self.from_spatial_terms(
+            self.spatial_terms(q_R, q_Z), q_R, K_R, K_zeta, K_Z
+        )
+
+    def spatial_terms(self, q_R: ArrayLike, q_Z: ArrayLike) -> Dict[str, ArrayLike]:
+        """Evaluate the parts of the Hamiltonian that only depend on
+        position: the poloidal flux, electron density, and the
+        magnitude and direction of the magnetic field.
+
+        These are the expensive parts of evaluating :math:`H`, as they
+        involve the equilibrium and density profile
+
+        Returns
+        -------
+        Dict[str, ArrayLike]
+            ``poloidal_flux``, ``electron_density``, ``B_total``, and
+            ``b_hat`` (with the ``R, zeta, Z`` components along the
+            first axis)
+
+        """
+        field = self.field.evaluate(q_R, q_Z)
+        poloidal_flux = field["polflux"]
         electron_density = self.density(poloidal_flux)
-        B_R = np.squeeze(self.field.B_R(q_R, q_Z))
-        B_T = np.squeeze(self.field.B_T(q_R, q_Z))
-        B_Z = np.squeeze(self.field.B_Z(q_R, q_Z))
+        shape = np.shape(poloidal_flux)
+        B_R, B_T, B_Z = (
+            np.reshape(field[name], shape) for name in ("B_R", "B_T", "B_Z")
+        )
 
         B_total = np.sqrt(B_R**2 + B_T**2 + B_Z**2)
-        b_hat = np.array([B_R, B_T, B_Z]) / B_total
-        K_hat = np.array([K_R, K_zeta / q_R, K_Z]) / K_magnitude
+        b_hat = np.stack([B_R, B_T, B_Z]) / B_total
+
+        return {
+            "poloidal_flux": poloidal_flux,
+            "electron_density": electron_density,
+            "B_total": B_total,
+            "b_hat": b_hat,
+        }
+
+    def from_spatial_terms(
+        self,
+        spatial: Dict[str, ArrayLike],
+        q_R: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+    ) -> ArrayLike:
+        r"""Evaluate the Hamiltonian given the output of `spatial_terms`
+        at the same positions
+
+        Note that this still depends on ``q_R`` through
+        :math:`K_\zeta / q_R`
+
+        """
+        terms = self.dispersion_terms(spatial, q_R, K_R, K_zeta, K_Z)
+        return terms["K_squared"] - refractive_index_squared(
+            terms["Booker_alpha"],
+            terms["Booker_beta"],
+            terms["H_discriminant"],
+            self.mode_flag,
+        )
+
+    def dispersion_terms(
+        self,
+        spatial: Dict[str, ArrayLike],
+        q_R: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+    ) -> Dict[str, ArrayLike]:
+        r"""The parts of the Hamiltonian shared between both mode
+        branches, given the output of `spatial_terms`
+
+        Returns
+        -------
+        Dict[str, ArrayLike]
+            ``K_squared``, the normalised wavenumber
+            :math:`(K/K_0)^2`, ``Booker_alpha``, ``Booker_beta``, and
+            ``H_discriminant``, :math:`\beta^2 - 4\alpha\gamma`
+
+        """
+
+        K_magnitude = np.sqrt(K_R**2 + (K_zeta / q_R) ** 2 + K_Z**2)
+        K_hat = np.stack([K_R, K_zeta / q_R, K_Z]) / K_magnitude
 
         # square of the mismatch angle
-        if np.size(q_R) == 1:
-            sin_theta_m_sq = np.dot(b_hat, K_hat) ** 2
-        else:  # Vectorised version of find_H
-            b_hat = b_hat.T
-            K_hat = K_hat.T
-            sin_theta_m_sq = contract_special(b_hat, K_hat) ** 2
+        sin_theta_m_sq = np.sum(spatial["b_hat"] * K_hat, axis=0) ** 2
 
-        epsilon = DielectricTensor(electron_density, self.angular_frequency, B_total)
+        epsilon = DielectricTensor(
+            spatial["electron_density"], self.angular_frequency, spatial["B_total"]
+        )
 
         Booker_alpha = (epsilon.e_bb * sin_theta_m_sq) + epsilon.e_11 * (
             1 - sin_theta_m_sq
@@ -262,16 +623,88 @@ class Hamiltonian:
         Booker_beta = (-epsilon.e_11 * epsilon.e_bb * (1 + sin_theta_m_sq)) - (
             epsilon.e_11**2 - epsilon.e_12**2
         ) * (1 - sin_theta_m_sq)
-        Booker_gamma = epsilon.e_bb * (epsilon.e_11**2 - epsilon.e_12**2)
 
-        H_discriminant = np.maximum(
-            np.zeros_like(Booker_beta),
-            (Booker_beta**2 - 4 * Booker_alpha * Booker_gamma),
+        # The discriminant, beta**2 - 4 * alpha * gamma, factorises as
+        # below. Calculating it this way avoids the cancellation between
+        # the two terms at low density, which otherwise dominates its
+        # derivatives near the plasma edge. This matters for the finite
+        # differences as much as for the other derivative methods, as the
+        # square root amplifies the rounding errors left after the
+        # cancellation until they swamp the small derivatives with
+        # respect to K_zeta just inside the plasma
+        gyro_freq_2 = (
+            find_normalised_gyro_freq(spatial["B_total"], self.angular_frequency) ** 2
+        )
+        H_discriminant = epsilon.e_12**2 * (
+            gyro_freq_2 * (1 - sin_theta_m_sq) ** 2
+            + 4 * epsilon.e_bb**2 * sin_theta_m_sq
         )
 
-        return (K_magnitude / self.wavenumber_K0) ** 2 + (
-            Booker_beta - self.mode_flag * np.sqrt(H_discriminant)
-        ) / (2 * Booker_alpha)
+        return {
+            "K_squared": (K_magnitude / self.wavenumber_K0) ** 2,
+            "Booker_alpha": Booker_alpha,
+            "Booker_beta": Booker_beta,
+            "H_discriminant": H_discriminant,
+        }
+
+    def mode_branches(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+    ) -> Dict[str, ArrayLike]:
+        r"""Evaluate the Hamiltonian for both the mode given by
+        ``mode_flag`` and the other one, sharing the evaluation of the
+        equilibrium and Booker coefficients between them
+
+        Returns
+        -------
+        Dict[str, ArrayLike]
+            ``H`` for this mode, ``H_other`` for the opposite mode,
+            and ``H_discriminant``, :math:`\beta^2 - 4\alpha\gamma`,
+            which vanishes where the two branches meet
+
+        """
+        terms = self.dispersion_terms(
+            self.spatial_terms(q_R, q_Z), q_R, K_R, K_zeta, K_Z
+        )
+        return {
+            "H": terms["K_squared"]
+            - refractive_index_squared(
+                terms["Booker_alpha"],
+                terms["Booker_beta"],
+                terms["H_discriminant"],
+                self.mode_flag,
+            ),
+            "H_other": terms["K_squared"]
+            - refractive_index_squared(
+                terms["Booker_alpha"],
+                terms["Booker_beta"],
+                terms["H_discriminant"],
+                -self.mode_flag,
+            ),
+            "H_discriminant": terms["H_discriminant"],
+        }
+
+    def stencil_plan(self, names: Iterable[str]) -> StencilPlan:
+        """Get the `StencilPlan` for computing exactly the derivatives in
+        ``names``, building and caching it if required"""
+        names = frozenset(names)
+        try:
+            return self.stencil_plans[names]
+        except KeyError:
+            pass
+
+        _check_derivative_names(names)
+        all_derivatives = FIRST_ORDER_DERIVATIVES + SECOND_ORDER_DERIVATIVES
+        plan = StencilPlan(
+            [derivative for derivative in all_derivatives if derivative[0] in names],
+            self.spacings,
+        )
+        self.stencil_plans[names] = plan
+        return plan
 
     def derivatives(
         self,
@@ -281,10 +714,17 @@ class Hamiltonian:
         K_zeta: ArrayLike,
         K_Z: ArrayLike,
         second_order: bool = False,
+        required: Optional[Iterable[str]] = None,
     ) -> Dict[str, ArrayLike]:
         """Evaluate the first-order derivative in all directions at the given
         point(s), and optionally the second-order ones too
 
+        The Hamiltonian is evaluated once on the stacked array of all
+        the points required by the precompiled `StencilPlan`, and each
+        stencil is then summed over its own points in a fixed order.
+        The position-dependent parts (see `spatial_terms`) are only
+        evaluated at the distinct ``(q_R, q_Z)`` offsets.
+
         Parameters
         ----------
         q_R : ArrayLike
@@ -295,93 +735,192 @@ class Hamiltonian:
             Coordinates to evaluate the derivatives at
         second_order : bool
             If ``True``, also evaluate the second derivatives
+        required : Optional[Iterable[str]]
+            Names of the derivatives to compute, for example
+            ``{"dH_dR", "dH_dKR"}``. If given, only the stencil points
+            needed for these derivatives are evaluated, only these
+            are returned, and ``second_order`` is ignored
 
         """
 
-        @dataclass(frozen=True)
-        class CoordOffset:
-            """Helper class to store relative offsets in a dict"""
+        if required is None:
+            required = [name for name, _, _ in FIRST_ORDER_DERIVATIVES]
+            if second_order:
+                required += [name for name, _, _ in SECOND_ORDER_DERIVATIVES]
+
+        # Per-point frequencies and modes are part of the shape of the batch
+        q_R = np.broadcast_to(
+            q_R, np.broadcast(q_R, self.angular_frequency, self.mode_flag).shape
+        )
+
+        if self.derivative_method in ("analytic", "autodiff"):
+            required = frozenset(required)
+            _check_derivative_names(required)
+            second_order = not required.isdisjoint(
+                name for name, _, _ in SECOND_ORDER_DERIVATIVES
+            )
+            method = (
+                self.analytic_derivatives
+                if self.derivative_method == "analytic"
+                else self.autodiff_derivatives
+            )
+            dH = method(q_R, q_Z, K_R, K_zeta, K_Z, second_order)
+            return {name: value for name, value in dH.items() if name in required}
+
+        plan = self.stencil_plan(required)
+        coords, shape = plan.points(q_R, q_Z, K_R, K_zeta, K_Z)
+
+        # The position-dependent terms are only evaluated once for
+        # each distinct (q_R, q_Z), and shared between all of the K
+        # offsets at that position
+        spatial = self.spatial_terms(*plan.spatial_points(q_R, q_Z, shape))
+        spatial = {
+            name: plan.expand_spatial(value, shape) for name, value in spatial.items()
+        }
+
+        # Separate the stencil offsets from the batch shape again, so
+        # that per-point frequencies and modes broadcast against them
+        coords = [np.reshape(coord, (-1,) + shape) for coord in coords]
+        spatial = {
+            name: np.reshape(value, np.shape(value)[:-1] + (-1,) + shape)
+            for name, value in spatial.items()
+        }
 
-            q_R: int = 0
-            q_Z: int = 0
-            K_R: int = 0
-            K_zeta: int = 0
-            K_Z: int = 0
+        q_R_points, _, K_R_points, K_zeta_points, K_Z_points = coords
+        H_at_points = self.from_spatial_terms(
+            spatial, q_R_points, K_R_points, K_zeta_points, K_Z_points
+        )
+        return plan.apply(H_at_points, shape)
+
+    def density_derivatives(
+        self, poloidal_flux: ArrayLike, second_order: bool = False
+    ) -> Tuple[ArrayLike, ArrayLike, Optional[ArrayLike]]:
+        """The density and its first (and optionally second) derivative
+        with respect to the poloidal flux. Density fits that aren't a
+        `DensityFit` are differentiated with finite differences"""
+        density = self.density(poloidal_flux)
+        orders = (1, 2) if second_order else (1,)
+        if isinstance(self.density, DensityFit):
+            derivatives = [self.density.derivative(poloidal_flux, n) for n in orders]
+        else:
+            derivatives = [
+                cfd_gradient(
+                    self.density,
+                    poloidal_flux=np.asfarray(poloidal_flux),
+                    directions="poloidal_flux",
+                    dx=DERIVATIVE_DELTA_POLFLUX,
+                    d_order=n,
+                )
+                for n in orders
+            ]
+        if not second_order:
+            derivatives.append(None)
+        return density, derivatives[0], derivatives[1]
 
-        # We cache Hamiltonian evaluations only during this function call
-        cache: Dict[CoordOffset, ArrayLike] = {}
+    def analytic_derivatives(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+        second_order: bool = False,
+    ) -> Dict[str, ArrayLike]:
+        r"""Evaluate the first-order derivatives in all directions at the
+        given point(s), and optionally the second-order ones too, in
+        closed form.
 
-        # Capture the location we want the derivatives at
-        starts = {"q_R": q_R, "q_Z": q_Z, "K_R": K_R, "K_zeta": K_zeta, "K_Z": K_Z}
+        Writing :math:`X = \Omega_{pe}^2/\Omega^2`, :math:`Y =
+        \Omega_{ce}/\Omega`, :math:`w = 1 / (1 - Y^2)` and :math:`s`
+        for the square of the mismatch term, the Booker coefficients
+        reduce to polynomials in :math:`X`, :math:`Xw` and :math:`s`,
+        and the discriminant factorises as
 
-        def apply_stencil(dims: Tuple[str, ...], stencil: Stencil) -> ArrayLike:
-            """Apply a stencil in set of directions
+        .. math::
 
-            Parameters
-            ----------
-            dims
-                Tuple of direction names
-            stencil
-                Finite difference stencil
-            """
+            \beta^2 - 4\alpha\gamma = X^2 w^2 Y^2
+              \left[Y^2 (1 - s)^2 + 4 (1 - X)^2 s\right]
 
-            # Collect the relative spacings for the derivative dimensions
-            dim_spacings = [self.spacings[dim] for dim in dims]
-            # For second order derivatives, remove repeated dimensions
-            if len(dims) == 2 and dims[1] == dims[0]:
-                dims = (dims[0],)
+        so that its square root is smooth through the plasma edge,
+        :math:`X = 0`. The derivatives are then propagated through
+        these expressions with the chain rule, vectorised over the
+        points.
 
-            result = np.zeros_like(starts["q_R"])
+        """
+        q_R, q_Z, K_R, K_zeta, K_Z, _ = np.broadcast_arrays(
+            *(np.asfarray(x) for x in (q_R, q_Z, K_R, K_zeta, K_Z)),
+            self.angular_frequency,
+        )
+        shape = q_R.shape
 
-            for stencil_offsets, weight in stencil.items():
-                coord_offsets = CoordOffset(**dict(zip(dims, stencil_offsets)))
-                try:
-                    # See if we've already evaluated H here...
-                    H_at_offset = cache[coord_offsets]
-                except KeyError:
-                    # ...if not, let's do so now
-                    offsets = asdict(coord_offsets)
-                    # Convert integer offsets to absolute positions
-                    coords = {
-                        dim: start + offsets[dim] * self.spacings[dim]
-                        for dim, start in starts.items()
-                    }
-                    # Evaluate the derivative at this offset and cache it
-                    H_at_offset = self(**coords)
-                    cache[coord_offsets] = H_at_offset
-
-                result += weight * H_at_offset
-            return result / np.prod(dim_spacings)
-
-        # We always compute the first order derivatives
-        derivatives = {
-            "dH_dR": apply_stencil(("q_R",), FFD1_stencil),
-            "dH_dZ": apply_stencil(("q_Z",), FFD1_stencil),
-            "dH_dKR": apply_stencil(("K_R",), CFD1_stencil),
-            "dH_dKzeta": apply_stencil(("K_zeta",), CFD1_stencil),
-            "dH_dKZ": apply_stencil(("K_Z",), CFD1_stencil),
+        field = {
+            key: np.reshape(value, shape)
+            for key, value in self.field.evaluate(
+                q_R, q_Z, derivatives=2 if second_order else 1
+            ).items()
         }
+        poloidal_flux = field["polflux"]
+        psi, B_R, B_T, B_Z = (
+            _spatial_jet(field[name], field, name, second_order)
+            for name in FIELD_QUANTITIES
+        )
 
-        if second_order:
-            second_derivatives = {
-                "d2H_dR2": apply_stencil(("q_R", "q_R"), FFD2_stencil),
-                "d2H_dZ2": apply_stencil(("q_Z", "q_Z"), FFD2_stencil),
-                "d2H_dKR2": apply_stencil(("K_R", "K_R"), CFD2_stencil),
-                "d2H_dKzeta2": apply_stencil(("K_zeta", "K_zeta"), CFD2_stencil),
-                "d2H_dKZ2": apply_stencil(("K_Z", "K_Z"), CFD2_stencil),
-                "d2H_dR_dZ": apply_stencil(("q_R", "q_Z"), FFD_FFD_stencil),
-                "d2H_dR_dKR": apply_stencil(("q_R", "K_R"), FFD_CFD_stencil),
-                "d2H_dR_dKzeta": apply_stencil(("q_R", "K_zeta"), FFD_CFD_stencil),
-                "d2H_dR_dKZ": apply_stencil(("q_R", "K_Z"), FFD_CFD_stencil),
-                "d2H_dZ_dKR": apply_stencil(("q_Z", "K_R"), FFD_CFD_stencil),
-                "d2H_dZ_dKzeta": apply_stencil(("q_Z", "K_zeta"), FFD_CFD_stencil),
-                "d2H_dZ_dKZ": apply_stencil(("q_Z", "K_Z"), FFD_CFD_stencil),
-                "d2H_dKR_dKZ": apply_stencil(("K_R", "K_Z"), CFD_CFD_stencil),
-                "d2H_dKR_dKzeta": apply_stencil(("K_R", "K_zeta"), CFD_CFD_stencil),
-                "d2H_dKzeta_dKZ": apply_stencil(("K_zeta", "K_Z"), CFD_CFD_stencil),
-            }
-            derivatives.update(second_derivatives)
-        return derivatives
+        # Normalised plasma and gyro frequencies are proportional to
+        # the density and magnetic field strength respectively
+        X_factor = find_normalised_plasma_freq(1.0, self.angular_frequency) ** 2
+        Y_factor = find_normalised_gyro_freq(1.0, self.angular_frequency)
+        density = self.density_derivatives(poloidal_flux, second_order)
+        X = psi.compose(*(None if n is None else X_factor * n for n in density))
+        B_squared = B_R * B_R + B_T * B_T + B_Z * B_Z
+        Y = Y_factor * np.sqrt(B_squared)
+
+        q_R, _, K_R, K_zeta, K_Z = variables((q_R, q_Z, K_R, K_zeta, K_Z), second_order)
+        K_zeta_over_R = K_zeta / q_R
+        K_squared = K_R * K_R + K_zeta_over_R * K_zeta_over_R + K_Z * K_Z
+        B_dot_K = B_R * K_R + B_T * K_zeta_over_R + B_Z * K_Z
+        # square of the mismatch angle
+        sin_theta_m_sq = (B_dot_K * B_dot_K) / (B_squared * K_squared)
+
+        Y_squared = Y * Y
+        X_w = X / (1 - Y_squared)
+        e_bb = 1 - X
+        e_11 = 1 - X_w
+        e_11_sq_minus_e_12_sq = 1 - X_w * (2 - X)
+
+        Booker_alpha = e_bb * sin_theta_m_sq + e_11 * (1 - sin_theta_m_sq)
+        Booker_beta = -e_11 * e_bb * (1 + sin_theta_m_sq) - e_11_sq_minus_e_12_sq * (
+            1 - sin_theta_m_sq
+        )
+        G = Y_squared * (1 - sin_theta_m_sq) ** 2 + 4 * e_bb * e_bb * sin_theta_m_sq
+        sqrt_discriminant = np.sign(X_w.value) * X_w * Y * np.sqrt(G)
+
+        H = K_squared / self.wavenumber_K0**2 + (
+            Booker_beta - self.mode_flag * sqrt_discriminant
+        ) / (2 * Booker_alpha)
+        return _named_derivatives(H)
+
+    def autodiff_derivatives(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+        second_order: bool = False,
+    ) -> Dict[str, ArrayLike]:
+        """Evaluate the first-order derivatives in all directions at the
+        given point(s), and optionally the second-order ones too, by
+        evaluating the Hamiltonian once on `Jet` variables.
+
+        This requires that the field and density fit can be evaluated
+        on jets, which is the case for the analytic fields and the
+        built-in `DensityFit` classes, as well as for the splines in
+        `InterpolatedField` and `EFITField`
+
+        """
+        return _named_derivatives(
+            self(*variables((q_R, q_Z, K_R, K_zeta, K_Z), second_order))
+        )
 
 
 def hessians(dH: dict):
@@ -420,7 +959,7 @@ def hessians(dH: dict):
         """Such that shape is [points,3,3] instead of [3,3,points]"""
         if array.ndim == 2:
             return array
-        return np.moveaxis(np.squeeze(array), 2, 0)
+        return np.moveaxis(array.reshape(3, 3, -1), 2, 0)
 
     grad_grad_H = reshape(
         np.array(
@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: GPL-3.0
 
 from scotty.fun_general import (
-    make_array_3x3,
     find_Psi_3D_lab,
     find_Psi_3D_plasma,
     find_inverse_2D,
@@ -14,13 +13,13 @@ from scotty.fun_general import (
     angular_frequency_to_wavenumber,
 )
 from scotty.hamiltonian import Hamiltonian
-from scotty.typing import FloatArray
+from scotty.typing import ArrayLike, FloatArray
 from scotty.geometry import MagneticField
 
-from typing import Optional
+from typing import Optional, Tuple
 
 import numpy as np
-from scipy.optimize import direct, root_scalar
+from contourpy import contour_generator
 
 
 def launch_beam(
@@ -91,8 +90,156 @@ def launch_beam(
 
     """
 
-    toroidal_launch_angle = np.deg2rad(toroidal_launch_angle_Torbeam)
-    poloidal_launch_angle = np.deg2rad(poloidal_launch_angle_Torbeam)
+    launch = launch_beams(
+        toroidal_launch_angle_Torbeam,
+        poloidal_launch_angle_Torbeam,
+        launch_beam_width,
+        launch_beam_curvature,
+        launch_position,
+        launch_angular_frequency,
+        field,
+        hamiltonian,
+        vacuum_propagation_flag=vacuum_propagation_flag,
+        Psi_BC_flag=Psi_BC_flag,
+        poloidal_flux_enter=poloidal_flux_enter,
+        delta_R=delta_R,
+        delta_Z=delta_Z,
+    )
+    if not vacuum_propagation_flag:
+        K_initial, _, launch_K, Psi_3D_lab_initial, *_ = launch
+        return (
+            list(K_initial[:, 0]),
+            launch_position,
+            launch_K[:, 0],
+            Psi_3D_lab_initial[0],
+            Psi_3D_lab_initial[0],
+            None,
+            np.full_like(Psi_3D_lab_initial[0], fill_value=np.nan),
+            None,
+        )
+
+    (
+        K_initial,
+        initial_position,
+        launch_K,
+        Psi_3D_lab_initial,
+        Psi_3D_lab_launch,
+        Psi_3D_lab_entry,
+        Psi_3D_lab_entry_cartersian,
+        distance_from_launch_to_entry,
+    ) = launch
+    return (
+        list(K_initial[:, 0]),
+        initial_position[:, 0],
+        launch_K[:, 0],
+        Psi_3D_lab_initial[0],
+        Psi_3D_lab_launch[0],
+        Psi_3D_lab_entry[0],
+        Psi_3D_lab_entry_cartersian[0],
+        distance_from_launch_to_entry[0],
+    )
+
+
+def _rotation_matrices(angle: FloatArray, axes: Tuple[int, int]) -> FloatArray:
+    """Stack of matrices with shape ``(n, 3, 3)`` rotating by each
+    ``angle`` in the plane of ``axes``, as in `launch_beam`"""
+    first, second = axes
+    rotation_matrix = np.zeros((len(angle), 3, 3))
+    rotation_matrix[:, first, first] = np.cos(angle)
+    rotation_matrix[:, second, second] = np.cos(angle)
+    rotation_matrix[:, first, second] = np.sin(angle)
+    rotation_matrix[:, second, first] = -np.sin(angle)
+    (other,) = {0, 1, 2} - {first, second}
+    rotation_matrix[:, other, other] = 1
+    return rotation_matrix
+
+
+def launch_beams(
+    toroidal_launch_angle_Torbeam: ArrayLike,
+    poloidal_launch_angle_Torbeam: ArrayLike,
+    launch_beam_width: ArrayLike,
+    launch_beam_curvature: ArrayLike,
+    launch_position: FloatArray,
+    launch_angular_frequency: ArrayLike,
+    field: MagneticField,
+    hamiltonian: Hamiltonian,
+    vacuum_propagation_flag: bool = True,
+    Psi_BC_flag: bool = True,
+    poloidal_flux_enter: float = 1.0,
+    delta_R: float = -1e-4,
+    delta_Z: float = 1e-4,
+    boundary: Optional["PlasmaBoundary"] = None,
+):
+    r"""Propagate a batch of beams from the antenna to *just* inside
+    the plasma, as `launch_beam` does for a single one.
+
+    The launch parameters are scalars or 1D arrays, broadcast against
+    each other. The matrices for all the beams are stacked and
+    multiplied or inverted together.
+
+    Parameters
+    ----------
+    toroidal_launch_angle_Torbeam: ArrayLike
+        Toroidal angle of antenna in TORBEAM convention
+    poloidal_launch_angle_Torbeam: ArrayLike
+        Poloidal angle of antenna in TORBEAM convention
+    launch_beam_width: ArrayLike
+        Width of the beam at launch
+    launch_beam_curvature: ArrayLike
+        Curvatuve of the beam at launch
+    launch_position: FloatArray
+        Position of the antenna in cylindrical coordinates, with shape
+        ``(3,)`` or ``(n, 3)``
+    launch_angular_frequency: ArrayLike
+        Angular frequency of the beam at launch
+    field: MagneticField
+        Object describing the magnetic field of the plasma
+    hamiltonian: Hamiltonian
+        Hamiltonian for either all the beams, or all with the same
+        frequency and mode
+    vacuum_propagation_flag: bool
+        If ``True``, run solver from the launch position, and don't
+        use analytical vacuum propagation
+    Psi_BC_flag: bool
+        If ``True``, use matching boundary conditions at plasma entry
+        position, otherwise do no special treatment at plasma boundary
+    poloidal_flux_enter: float
+        Normalised poloidal flux label of plasma boundary
+    delta_R: float
+        Finite difference spacing to use for ``R``
+    delta_Z: float
+        Finite difference spacing to use for ``Z``
+    boundary: Optional[PlasmaBoundary]
+        Index of the plasma boundary of ``field``, which is built if
+        not given
+
+    Returns
+    -------
+    The same as `launch_beam`, for each beam. Vectors have shape
+    ``(3, n)``, matrices ``(n, 3, 3)`` and scalars ``(n,)``. If
+    ``vacuum_propagation_flag`` is ``False``, the entry quantities
+    are ``None`` or NaN as there
+
+    """
+    launch_position = np.asfarray(launch_position)
+    launch_parameters = np.broadcast_arrays(
+        np.atleast_1d(np.deg2rad(toroidal_launch_angle_Torbeam)),
+        np.deg2rad(poloidal_launch_angle_Torbeam),
+        launch_beam_width,
+        launch_beam_curvature,
+        launch_angular_frequency,
+        np.atleast_2d(launch_position)[:, 0],
+    )
+    (
+        toroidal_launch_angle,
+        poloidal_launch_angle,
+        launch_beam_width,
+        launch_beam_curvature,
+        launch_angular_frequency,
+    ) = launch_parameters[:-1]
+    n_beams = len(toroidal_launch_angle)
+    launch_position = np.broadcast_to(launch_position, (n_beams, 3))
+    q_R_launch, q_zeta_launch, _ = launch_position.T
 
     wavenumber_K0 = angular_frequency_to_wavenumber(launch_angular_frequency)
 
@@ -103,7 +250,7 @@ def launch_beam(
         -wavenumber_K0
         * np.sin(toroidal_launch_angle)
         * np.cos(poloidal_launch_angle)
-        * launch_position[0]
+        * q_R_launch
     )
     K_Z_launch = -wavenumber_K0 * np.sin(poloidal_launch_angle)
     launch_K = np.array([K_R_launch, K_zeta_launch, K_Z_launch])
@@ -113,44 +260,36 @@ def launch_beam(
     Psi_w_beam_diagonal = (
         wavenumber_K0 * launch_beam_curvature + 2j * launch_beam_width ** (-2)
     )
-    Psi_w_beam_launch_cartersian = np.eye(2) * Psi_w_beam_diagonal
-
-    rotation_matrix_pol = np.array(
-        [
-            [np.cos(poloidal_rotation_angle), 0, np.sin(poloidal_rotation_angle)],
-            [0, 1, 0],
-            [-np.sin(poloidal_rotation_angle), 0, np.cos(poloidal_rotation_angle)],
-        ]
+    Psi_w_beam_launch_cartersian = (
+        np.eye(2) * Psi_w_beam_diagonal[:, np.newaxis, np.newaxis]
     )
 
-    rotation_matrix_tor = np.array(
-        [
-            [np.cos(toroidal_launch_angle), np.sin(toroidal_launch_angle), 0],
-            [-np.sin(toroidal_launch_angle), np.cos(toroidal_launch_angle), 0],
-            [0, 0, 1],
-        ]
-    )
+    rotation_matrix_pol = _rotation_matrices(poloidal_rotation_angle, (0, 2))
+    rotation_matrix_tor = _rotation_matrices(toroidal_launch_angle, (0, 1))
 
     rotation_matrix = np.matmul(rotation_matrix_pol, rotation_matrix_tor)
-    rotation_matrix_inverse = np.transpose(rotation_matrix)
+    rotation_matrix_inverse = np.swapaxes(rotation_matrix, -1, -2)
+
+    def beam_to_lab(Psi_w_beam_cartesian):
+        Psi_3D_beam_cartesian = np.zeros((n_beams, 3, 3), dtype="complex128")
+        Psi_3D_beam_cartesian[:, :2, :2] = Psi_w_beam_cartesian
+        return np.matmul(
+            rotation_matrix_inverse,
+            np.matmul(Psi_3D_beam_cartesian, rotation_matrix),
+        )
 
-    Psi_3D_beam_launch_cartersian = make_array_3x3(Psi_w_beam_launch_cartersian)
-    Psi_3D_lab_launch_cartersian = np.matmul(
-        rotation_matrix_inverse,
-        np.matmul(Psi_3D_beam_launch_cartersian, rotation_matrix),
-    )
     Psi_3D_lab_launch = find_Psi_3D_lab(
-        Psi_3D_lab_launch_cartersian,
-        launch_position[0],
-        launch_position[1],
+        beam_to_lab(Psi_w_beam_launch_cartersian),
+        q_R_launch,
+        q_zeta_launch,
         K_R_launch,
         K_zeta_launch,
     )
 
     if not vacuum_propagation_flag:
         return (
-            [K_R_launch, K_zeta_launch, K_Z_launch],
-            launch_position,
+            launch_K,
+            launch_position.T,
             launch_K,
             Psi_3D_lab_launch,
             Psi_3D_lab_launch,
@@ -161,49 +300,43 @@ def launch_beam(
 
     Psi_w_beam_inverse_launch_cartersian = find_inverse_2D(Psi_w_beam_launch_cartersian)
 
-    entry_position = find_entry_point(
-        launch_position,
-        poloidal_launch_angle,
-        toroidal_launch_angle,
-        poloidal_flux_enter,
-        field,
+    if boundary is None:
+        boundary = PlasmaBoundary(field, poloidal_flux_enter)
+    entry_position = boundary.entry_points(
+        launch_position, poloidal_launch_angle, toroidal_launch_angle
     )
+    missed = np.isnan(entry_position[0])
+    if np.any(missed):
+        raise RuntimeError(
+            f"Beams {np.flatnonzero(missed)} do not hit plasma "
+            f"(launched from {launch_position[missed]} with poloidal angles "
+            f"{poloidal_launch_angle[missed]}, toroidal angles "
+            f"{toroidal_launch_angle[missed]})"
+        )
 
     distance_from_launch_to_entry = np.sqrt(
-        launch_position[0] ** 2
+        q_R_launch**2
         + entry_position[0] ** 2
-        - 2
-        * launch_position[0]
-        * entry_position[0]
-        * np.cos(entry_position[1] - launch_position[1])
-        + (launch_position[2] - entry_position[2]) ** 2
+        - 2 * q_R_launch * entry_position[0] * np.cos(entry_position[1] - q_zeta_launch)
+        + (launch_position[:, 2] - entry_position[2]) ** 2
     )
 
     # Calculate entry parameters from launch parameters
     # That is, find beam at start of plasma given its parameters at the antenna
-    K_lab_launch = np.array([K_R_launch, K_zeta_launch, K_Z_launch])
-    K_lab_Cartesian_launch = find_K_lab_Cartesian(K_lab_launch, launch_position)
+    K_lab_Cartesian_launch = find_K_lab_Cartesian(launch_K, launch_position.T)
     K_lab_Cartesian_entry = K_lab_Cartesian_launch
     entry_position_Cartesian = find_q_lab_Cartesian(entry_position)
     K_lab_entry = find_K_lab(K_lab_Cartesian_entry, entry_position_Cartesian)
-
-    K_R_entry = K_lab_entry[0]  # K_R
-    K_zeta_entry = K_lab_entry[1]
-    K_Z_entry = K_lab_entry[2]  # K_z
+    K_R_entry, K_zeta_entry, K_Z_entry = K_lab_entry
 
     Psi_w_beam_inverse_entry_cartersian = (
-        distance_from_launch_to_entry / (wavenumber_K0) * np.eye(2)
-        + Psi_w_beam_inverse_launch_cartersian
-    )
+        distance_from_launch_to_entry / wavenumber_K0
+    )[:, np.newaxis, np.newaxis] * np.eye(2) + Psi_w_beam_inverse_launch_cartersian
     # 'entry' is still in vacuum, so the components of Psi along g are
     # all 0 (since \nabla H = 0)
-    Psi_3D_beam_entry_cartersian = make_array_3x3(
+    Psi_3D_lab_entry_cartersian = beam_to_lab(
         find_inverse_2D(Psi_w_beam_inverse_entry_cartersian)
     )
-    Psi_3D_lab_entry_cartersian = np.matmul(
-        rotation_matrix_inverse,
-        np.matmul(Psi_3D_beam_entry_cartersian, rotation_matrix),
-    )
 
     # Convert to cylindrical coordinates
     Psi_3D_lab_entry = find_Psi_3D_lab(
@@ -217,24 +350,10 @@ def launch_beam(
     # -------------------
     # Find initial parameters in plasma
     # -------------------
-    K_R_initial = K_R_entry
-    K_zeta_initial = K_zeta_entry
-    K_Z_initial = K_Z_entry
     initial_position = entry_position
-    if Psi_BC_flag:  # Use BCs
-        dH = hamiltonian.derivatives(
-            initial_position[0],
-            initial_position[2],
-            K_R_initial,
-            K_zeta_initial,
-            K_Z_initial,
-        )
-
-        dH_dR_initial = dH["dH_dR"]
-        dH_dZ_initial = dH["dH_dZ"]
-        dH_dKR_initial = dH["dH_dKR"]
-        dH_dKzeta_initial = dH["dH_dKzeta"]
-        dH_dKZ_initial = dH["dH_dKZ"]
+    if not Psi_BC_flag:  # Do not use BCs
+        Psi_3D_lab_initial = Psi_3D_lab_entry
+    else:  # Use BCs
         d_poloidal_flux_d_R_boundary = find_d_poloidal_flux_dR(
             initial_position[0],
             initial_position[2],
@@ -248,21 +367,28 @@ def launch_beam(
             field.poloidal_flux,
         )
 
+        dH = hamiltonian.derivatives(
+            initial_position[0],
+            initial_position[2],
+            K_R_entry,
+            K_zeta_entry,
+            K_Z_entry,
+            required=("dH_dR", "dH_dZ", "dH_dKR", "dH_dKzeta", "dH_dKZ"),
+        )
+
         Psi_3D_lab_initial = find_Psi_3D_plasma(
             Psi_3D_lab_entry,
-            dH_dKR_initial,
-            dH_dKzeta_initial,
-            dH_dKZ_initial,
-            dH_dR_initial,
-            dH_dZ_initial,
+            dH["dH_dKR"],
+            dH["dH_dKzeta"],
+            dH["dH_dKZ"],
+            dH["dH_dR"],
+            dH["dH_dZ"],
             d_poloidal_flux_d_R_boundary,
             d_poloidal_flux_d_Z_boundary,
         )
-    else:  # Do not use BCs
-        Psi_3D_lab_initial = Psi_3D_lab_entry
 
     return (
-        [K_R_initial, K_zeta_initial, K_Z_initial],
+        K_lab_entry,
         initial_position,
         launch_K,
         Psi_3D_lab_initial,
@@ -273,6 +399,345 @@ def launch_beam(
     )
 
 
+def launch_rays(
+    toroidal_launch_angle_Torbeam: ArrayLike,
+    poloidal_launch_angle_Torbeam: ArrayLike,
+    launch_position: FloatArray,
+    launch_angular_frequency: ArrayLike,
+    field: MagneticField,
+    poloidal_flux_enter: float = 1.0,
+) -> Tuple[FloatArray, FloatArray, np.ndarray]:
+    r"""Propagate rays from the antenna to *just* inside the plasma,
+    as in `launch_beam` but without the beam, for a batch of launch
+    parameters at once.
+
+    Parameters
+    ----------
+    toroidal_launch_angle_Torbeam: ArrayLike
+        Toroidal angle of antenna in TORBEAM convention, for each ray
+    poloidal_launch_angle_Torbeam: ArrayLike
+        Poloidal angle of antenna in TORBEAM convention, for each ray
+    launch_position: FloatArray
+        Position of the antenna in cylindrical coordinates, with shape
+        ``(n, 3)``
+    launch_angular_frequency: ArrayLike
+        Angular frequency of each ray
+    field: MagneticField
+        Object describing the magnetic field of the plasma
+    poloidal_flux_enter: float
+        Normalised poloidal flux label of plasma boundary
+
+    Returns
+    -------
+    K_initial: FloatArray
+        Wavevector at plasma entry point, with shape ``(3, n)``
+    initial_position: FloatArray
+        Coordinates of entry point, with shape ``(3, n)``
+    hits_plasma: np.ndarray
+        Whether each ray enters the plasma at all. ``K_initial`` and
+        ``initial_position`` are NaN for those that don't
+
+    """
+    toroidal_launch_angle = np.deg2rad(toroidal_launch_angle_Torbeam)
+    poloidal_launch_angle = np.deg2rad(poloidal_launch_angle_Torbeam)
+    launch_position = np.asfarray(launch_position)
+
+    wavenumber_K0 = angular_frequency_to_wavenumber(launch_angular_frequency)
+    launch_K = -wavenumber_K0 * np.array(
+        [
+            np.cos(toroidal_launch_angle) * np.cos(poloidal_launch_angle),
+            np.sin(toroidal_launch_angle)
+            * np.cos(poloidal_launch_angle)
+            * launch_position[:, 0],
+            np.sin(poloidal_launch_angle),
+        ]
+    )
+
+    initial_position = PlasmaBoundary(field, poloidal_flux_enter).entry_points(
+        launch_position, poloidal_launch_angle, toroidal_launch_angle
+    )
+    hits_plasma = np.isfinite(initial_position[0])
+
+    # The wavevector is constant in vacuum, in Cartesian coordinates
+    K_lab_Cartesian = find_K_lab_Cartesian(launch_K, launch_position.T)
+    K_initial = find_K_lab(K_lab_Cartesian, find_q_lab_Cartesian(initial_position))
+    return K_initial, initial_position, hits_plasma
+
+
+class PlasmaBoundary:
+    r"""Index of the plasma boundary for finding where straight lines
+    from the antenna enter the plasma.
+
+    The boundary is the :math:`\psi` = ``poloidal_flux_enter``
+    contour of ``field.poloidalFlux_grid``, as a set of line segments
+    in the poloidal plane. A straight line in Cartesian coordinates
+    is a hyperbola in :math:`(R, Z)`, whose intersections with each
+    segment are the roots of a quadratic, so the first crossing of the
+    polygon is found analytically for all segments and lines at once.
+    This is then refined with a few Newton iterations on
+    ``field.poloidal_flux`` itself, so that the result doesn't depend on
+    the resolution of the grid.
+
+    Build this once per equilibrium and reuse it for every launch.
+
+    Parameters
+    ----------
+    field
+        Object describing the magnetic field geometry
+    poloidal_flux_enter
+        Normalised poloidal flux label of plasma boundary
+    newton_iterations
+        Number of Newton iterations from the crossing of the polygon
+    grazing_tolerance
+        Lines that don't cross the polygon still enter the plasma if
+        the poloidal flux somewhere along them is within this of
+        ``poloidal_flux_enter``
+
+    """
+
+    def __init__(
+        self,
+        field: MagneticField,
+        poloidal_flux_enter: float = 1.0,
+        newton_iterations: int = 4,
+        grazing_tolerance: float = 1e-8,
+    ):
+        self.field = field
+        self.poloidal_flux_enter = poloidal_flux_enter
+        self.newton_iterations = newton_iterations
+        self.grazing_tolerance = grazing_tolerance
+
+        lines = contour_generator(
+            field.R_coord, field.Z_coord, field.poloidalFlux_grid.T
+        ).lines(poloidal_flux_enter)
+        if not lines:
+            raise ValueError(
+                f"No contour of poloidal flux {poloidal_flux_enter} inside the grid"
+            )
+        #: Start and end points of each segment of the boundary, with
+        #: shape ``(2, n_segments)``
+        self.start = np.concatenate([line[:-1] for line in lines]).T
+        self.end = np.concatenate([line[1:] for line in lines]).T
+
+        # We know that the plasma is contained entirely within
+        # ``field``'s (R, Z) grid, so the maximum distance a line could
+        # possibly travel before hitting the plasma is when it's aimed
+        # at the top/bottom corner of the grid on the far side of the
+        # torus
+        self._R_max = field.R_coord.max()
+        self._Z_max = np.abs(field.Z_coord).max()
+
+    def _crossings(self, start: FloatArray, direction: FloatArray) -> FloatArray:
+        """Distance along each line to its first crossing of the
+        polygon, or infinity if it doesn't cross it. ``start`` and
+        ``direction`` have shape ``(3, n)``, with unit ``direction``"""
+        X0, Y0, Z0 = start[..., np.newaxis]
+        u_X, u_Y, u_Z = direction[..., np.newaxis]
+        R1, Z1 = self.start
+        delta_R, delta_Z = self.end - self.start
+
+        # R^2 = a tau^2 + b tau + c along the line, and each segment
+        # lies on n_R R + n_Z Z = d
+        a = u_X**2 + u_Y**2
+        b = 2 * (X0 * u_X + Y0 * u_Y)
+        c = X0**2 + Y0**2
+        n_R, n_Z = delta_Z, -delta_R
+        d = n_R * R1 + n_Z * Z1
+        # Squaring n_R R = e + g tau gives a quadratic in tau
+        e = d - n_Z * Z0
+        g = -n_Z * u_Z
+        A = n_R**2 * a - g**2
+        B = n_R**2 * b - 2 * e * g
+        C = n_R**2 * c - e**2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Lines that only touch a segment can have slightly
+            # negative discriminants from rounding, but genuine misses
+            # are then ruled out by not being on the segment
+            discriminant = np.maximum(B**2 - 4 * A * C, 0)
+            # Numerically stable roots, either of which are inf or NaN
+            # when the quadratic is degenerate
+            q = -0.5 * (B + np.copysign(np.sqrt(discriminant), B))
+            tau = np.stack(np.broadcast_arrays(q / A, C / q))
+
+            R = np.sqrt(a * tau**2 + b * tau + c)
+            Z = Z0 + u_Z * tau
+            along = ((R - R1) * delta_R + (Z - Z1) * delta_Z) / (
+                delta_R**2 + delta_Z**2
+            )
+            valid = (
+                (tau >= 0)
+                & (np.abs(n_R * R + n_Z * Z - d) <= 1e-9 * np.hypot(n_R, n_Z))
+                # Allowing for lines through the ends of segments
+                & (along >= -1e-9)
+                & (along <= 1 + 1e-9)
+                # Not a root introduced by squaring
+                & (n_R * (e + g * tau) >= 0)
+            )
+        return np.min(np.where(valid, tau, np.inf), axis=(0, -1))
+
+    def _flux_along_line(
+        self, start: FloatArray, direction: FloatArray, tau: FloatArray
+    ) -> FloatArray:
+        """Poloidal flux relative to the boundary at distance ``tau``
+        along each line"""
+        X, Y, Z = start + tau * direction
+        return self.field.poloidal_flux(np.hypot(X, Y), Z) - self.poloidal_flux_enter
+
+    def _closest_approach(
+        self, start: FloatArray, direction: FloatArray, max_length: FloatArray
+    ) -> FloatArray:
+        """Distance along each line to where it touches the boundary,
+        for lines that don't cross the polygon. If the minimum poloidal
+        flux along the line is inside the plasma, this is the first
+        crossing before it, or if it's within `grazing_tolerance` of
+        the boundary, the minimum itself, and otherwise NaN"""
+        samples = np.linspace(0, 1, 65)[:, np.newaxis] * max_length
+        spacing = samples[1]
+        flux = self._flux_along_line(
+            start[:, np.newaxis, :], direction[:, np.newaxis, :], samples
+        )
+        minimum = samples[np.nanargmin(flux, axis=0), np.arange(len(max_length))]
+
+        # Newton iterations for the minimum, with the first and second
+        # derivatives from finite differences, staying near the sample
+        step = 1e-4 * max_length
+        for _ in range(2 * self.newton_iterations):
+            below, centre, above = (
+                self._flux_along_line(start, direction, minimum + offset)
+                for offset in (-step, 0, step)
+            )
+            curvature = (above - 2 * centre + below) / step**2
+            with np.errstate(divide="ignore", invalid="ignore"):
+                newton_step = np.where(
+                    curvature > 0, 0.5 * (above - below) / step / curvature, 0
+                )
+            minimum = minimum - np.clip(newton_step, -spacing, spacing)
+        minimum_flux = self._flux_along_line(start, direction, minimum)
+
+        # Bisect for the crossing between the previous sample, which
+        # is outside the plasma, and the minimum
+        lower = np.maximum(minimum - spacing, 0)
+        upper = minimum.copy()
+        for _ in range(60):
+            middle = 0.5 * (lower + upper)
+            inside = self._flux_along_line(start, direction, middle) < 0
+            lower = np.where(inside, lower, middle)
+            upper = np.where(inside, middle, upper)
+
+        tau = np.where(minimum_flux < 0, upper, minimum)
+        return np.where(minimum_flux <= self.grazing_tolerance, tau, np.nan)
+
+    def entry_points(
+        self,
+        launch_position: ArrayLike,
+        poloidal_launch_angle: ArrayLike,
+        toroidal_launch_angle: ArrayLike,
+        boundary_adjust: float = 1e-8,
+    ) -> FloatArray:
+        """Find the coordinates where each beam enters the plasma.
+
+        Parameters
+        ----------
+        launch_position:
+            Cartesian coordinates of the antenna (or cylindrical with
+            zeta=0), with shape ``(3,)`` or ``(n, 3)``
+        poloidal_launch_angle:
+            Poloidal angle of the antenna (radians), clockwise from the
+            horizontal axis
+        toroidal_launch_angle:
+            Toroidal angle of the antenna (radians), anti-clockwise
+            from the negative X-axis
+        boundary_adjust:
+            Step size used to ensure entry point is _just_ inside plasma
+
+        Returns
+        -------
+        Array with cylindrical coordinates of entry points, with shape
+        ``(3, n)``, and NaN for those lines that miss the plasma
+        """
+        launch_position = np.atleast_2d(np.asfarray(launch_position))
+        toroidal_launch_angle, poloidal_launch_angle = np.broadcast_arrays(
+            np.atleast_1d(toroidal_launch_angle), np.atleast_1d(poloidal_launch_angle)
+        )
+        start = np.broadcast_to(launch_position.T, (3, len(toroidal_launch_angle)))
+
+        # TORBEAM antenna angles are anti-clockwise from negative
+        # X-axis, so we need to rotate the toroidal angle by pi. This
+        # will take care of the direction of the beam. The poloidal
+        # angle is also reversed from its usual sense, so we can just
+        # flip it
+        toroidal_launch_angle = toroidal_launch_angle + np.pi
+        poloidal_launch_angle = -poloidal_launch_angle
+        direction = np.array(
+            [
+                np.cos(toroidal_launch_angle) * np.cos(poloidal_launch_angle),
+                np.sin(toroidal_launch_angle) * np.cos(poloidal_launch_angle),
+                np.sin(poloidal_launch_angle),
+            ]
+        )
+
+        # Bound the memory used for the lines against all the segments
+        chunk = max(1, 2**20 // self.start.shape[1])
+        tau = np.concatenate(
+            [
+                self._crossings(start[:, i : i + chunk], direction[:, i : i + chunk])
+                for i in range(0, start.shape[1], chunk)
+            ]
+        )
+        max_length = np.hypot(
+            np.abs(start[0]) + self._R_max, np.abs(start[2]) + self._Z_max
+        )
+        step = 1e-7 * max_length
+
+        # Lines that only graze the boundary can miss the polygon, so
+        # look for where they touch it instead
+        missed = ~np.isfinite(tau)
+        if np.any(missed):
+            tau[missed] = self._closest_approach(
+                start[:, missed], direction[:, missed], max_length[missed]
+            )
+
+        # Refine on the actual flux rather than the polygon, keeping
+        # the polygon crossing if that doesn't improve it
+        residual = self._flux_along_line(start, direction, tau)
+        for _ in range(self.newton_iterations):
+            slope = (
+                self._flux_along_line(start, direction, tau + step)
+                - self._flux_along_line(start, direction, tau - step)
+            ) / (2 * step)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                new_tau = tau - residual / slope
+            new_residual = self._flux_along_line(start, direction, new_tau)
+            # Each line is independent, so that the result doesn't
+            # depend on what it's launched with
+            better = np.abs(new_residual) < np.abs(residual)
+            tau = np.where(better, new_tau, tau)
+            residual = np.where(better, new_residual, residual)
+
+        # The root might be just outside the plasma due to floating
+        # point errors, if so, find the closest point inside within a
+        # small step
+        outside = residual > 0
+        if np.any(outside):
+            lower = tau[outside]
+            upper = lower + boundary_adjust * max_length[outside]
+            for _ in range(60):
+                middle = 0.5 * (lower + upper)
+                inside = (
+                    self._flux_along_line(
+                        start[:, outside], direction[:, outside], middle
+                    )
+                    <= 0
+                )
+                lower = np.where(inside, lower, middle)
+                upper = np.where(inside, middle, upper)
+            tau[outside] = upper
+
+        X, Y, Z = start + tau * direction
+        return np.array((np.hypot(X, Y), np.arctan2(Y, X), Z))
+
+
 def find_entry_point(
     launch_position: FloatArray,
     poloidal_launch_angle: float,
@@ -280,6 +745,7 @@ def find_entry_point(
     poloidal_flux_enter: float,
     field: MagneticField,
     boundary_adjust: float = 1e-8,
+    boundary: Optional[PlasmaBoundary] = None,
 ) -> FloatArray:
     """Find the coordinates where the beam enters the plasma.
 
@@ -298,87 +764,26 @@ def find_entry_point(
         Object describing the magnetic field geometry
     boundary_adjust:
         Step size used to ensure entry point is _just_ inside plasma
+    boundary:
+        Index of the plasma boundary of ``field``, which is built if
+        not given. Pass one in to reuse it for many launches
 
     Returns
     -------
     Array with cylindrical coordinates of entry point
     """
-
-    # We know that the plasma is contained entirely within ``field``'s
-    # (R, Z) grid, so the maximum distance the beam could possibly
-    # travel before hitting the plasma is when it's aimed at the
-    # top/bottom corner of the grid on the far side of the torus. This
-    # an overestimate, but it's only used to parameterize the beam
-    X_start, Y_start, Z_start = launch_position
-    X_length = abs(X_start) + field.R_coord.max()
-    Z_length = abs(Z_start) + field.Z_coord.max()
-    max_length = np.hypot(X_length, Z_length)
-
-    # TORBEAM antenna angles are anti-clockwise from negative X-axis,
-    # so we need to rotate the toroidal angle by pi. This will take
-    # care of the direction of the beam. The poloidal angle is also
-    # reversed from its usual sense, so we can just flip it
-    toroidal_launch_angle = toroidal_launch_angle + np.pi
-    poloidal_launch_angle = -poloidal_launch_angle
-
-    # We parameterise beam in a line normal to the antenna up to
-    # max_length, and we can be sure the beam will either hit the
-    # plasma or miss it entirely.
-    X_step = max_length * np.cos(toroidal_launch_angle) * np.cos(poloidal_launch_angle)
-    Y_step = max_length * np.sin(toroidal_launch_angle) * np.cos(poloidal_launch_angle)
-    Z_step = max_length * np.sin(poloidal_launch_angle)
-    step_array = np.array((X_step, Y_step, Z_step))
-
-    def beam_line(tau):
-        """Parameterised line in beam direction"""
-        return launch_position + tau * step_array
-
-    def cartesian_to_cylindrical(X, Y, Z):
-        """Cartesian to cylindrical coordinates"""
-        return np.sqrt(X**2 + Y**2), np.arctan2(Y, X), Z
-
-    def poloidal_flux_boundary_along_line(tau):
-        """Signed poloidal flux distance to plasma boundary"""
-        R, _, Z = cartesian_to_cylindrical(*beam_line(tau))
-        return field.poloidal_flux(R, Z) - poloidal_flux_enter
-
-    # Find the plasma boundary using a bracket search. We need the
-    # minimum so that the flux has different sign to our initial
-    # position for the bracket points. There could be one or two
-    # minima (corresponding to the two halves of the torus), we only
-    # care about the closest, so use the first result as a bound for
-    # the second. If there isn't a second, this will just find the
-    # first again
-    first_min = direct(
-        poloidal_flux_boundary_along_line, bounds=((0, 1),), len_tol=1e-3
-    )
-    minimum = direct(
-        poloidal_flux_boundary_along_line, bounds=((0, first_min.x),), len_tol=1e-3
-    )
-    # If the closest minimum is positive, then the beam never actually
-    # enters the plasma, and we should abort
-    if minimum.fun > 0:
-        R_miss, zeta_miss, Z_miss = cartesian_to_cylindrical(*beam_line(minimum.x))
-        miss_coords = f"(R={R_miss}, zeta={zeta_miss}, Z={Z_miss})"
+    if boundary is None:
+        boundary = PlasmaBoundary(field, poloidal_flux_enter)
+
+    entry_point = boundary.entry_points(
+        launch_position, poloidal_launch_angle, toroidal_launch_angle, boundary_adjust
+    )[:, 0]
+    # If there's no crossing, then the beam never actually enters the
+    # plasma, and we should abort
+    if np.isnan(entry_point[0]):
         raise RuntimeError(
-            f"Beam does not hit plasma. Closest point is at {miss_coords}, "
-            f"distance in poloidal flux to boundary={minimum.fun}"
+            f"Beam does not hit plasma (launched from {launch_position} with "
+            f"poloidal angle {poloidal_launch_angle}, "
+            f"toroidal angle {toroidal_launch_angle})"
         )
-
-    # `minimum.x` is some point along the beam that's definitely
-    # inside the plasma. So any root between the start of the beam and
-    # this point is the closest entry point
-    boundary = root_scalar(poloidal_flux_boundary_along_line, bracket=(0, minimum.x))
-    if not boundary.converged:
-        raise RuntimeError(
-            f"Could not find plasma boundary, root finding failed with '{boundary.flag}'"
-        )
-
-    # The root might be just outside the plasma due to floating point
-    # errors, if so, take small steps until we're definitely inside
-    boundary_tau = boundary.root
-    R_boundary, _, Z_boundary = cartesian_to_cylindrical(*beam_line(boundary_tau))
-    if field.poloidal_flux(R_boundary, Z_boundary) > poloidal_flux_enter:
-        boundary_tau += boundary_adjust
-
-    return np.array(cartesian_to_cylindrical(*beam_line(boundary.root)))
+    return entry_point
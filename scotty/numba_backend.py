@@ -0,0 +1,899 @@
+# Copyright 2023 - 2023, Valerian Hall-Chen and the Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+r"""Optional compiled backend for the Hamiltonian, using Numba.
+
+Evaluating the right-hand side of the beam equations for the 17
+element state is dominated by Python overhead: calls through the
+`MagneticField` and `DensityFit` objects, the `StencilPlan`
+bookkeeping, and building lots of small arrays. This module
+provides nopython kernels for :math:`H`, its finite difference
+derivatives and `beam_evolution_fun`, which instead take the
+equilibrium as plain arrays (see `EquilibriumArrays`): spline knots
+and coefficients, or the parameters of the analytic fields and
+density profiles. The kernels release the GIL, so sweeps run in
+threads can evaluate them in parallel.
+
+Select it by passing ``backend="numba"`` to `beam_me_up`, or use
+`CompiledHamiltonian` directly:
+
+.. code-block:: python
+
+    hamiltonian = make_hamiltonian(
+        field, angular_frequency, mode_flag, density_fit,
+        delta_R, delta_Z, delta_K_R, delta_K_zeta, delta_K_Z,
+        backend="numba",
+    )
+
+Only the built-in analytic fields and the spline-based
+`InterpolatedField` and `EFITField` are supported, along with the
+`QuadraticFit`, `PolynomialFit`, `TanhFit` and `SmoothingSplineFit`
+density profiles. For anything else, or if Numba isn't installed,
+`make_hamiltonian` warns and falls back to the NumPy `Hamiltonian`.
+
+"""
+
+from typing import NamedTuple
+from warnings import warn
+
+import numpy as np
+from scipy import constants
+
+from scotty.density_fit import (
+    DensityFitLike,
+    PolynomialFit,
+    QuadraticFit,
+    SmoothingSplineFit,
+    TanhFit,
+)
+from scotty.geometry import (
+    CircularCrossSectionField,
+    ConstantCurrentDensityField,
+    EFITField,
+    InterpolatedField,
+    MagneticField,
+)
+from scotty.hamiltonian import (
+    FIRST_ORDER_DERIVATIVES,
+    SECOND_ORDER_DERIVATIVES,
+    Hamiltonian,
+)
+from scotty.typing import ArrayLike, FloatArray
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+HAS_NUMBA = numba is not None
+"""Whether Numba is installed, and the kernels are compiled"""
+
+BACKENDS = ("numpy", "numba")
+"""Backends for evaluating the Hamiltonian, see `make_hamiltonian`"""
+
+
+def _njit(function):
+    """Compile ``function`` in nopython mode, releasing the GIL. Without
+    Numba, the plain Python function is returned"""
+    if numba is None:
+        return function
+    return numba.njit(nogil=True, cache=True)(function)
+
+
+# Field and density parameterisations understood by the kernels
+FIELD_CIRCULAR = 0
+FIELD_CONSTANT_CURRENT = 1
+FIELD_INTERPOLATED = 2
+FIELD_EFIT = 3
+
+DENSITY_POLYNOMIAL = 0
+DENSITY_TANH = 1
+DENSITY_SPLINE = 2
+
+# X = _PLASMA_FREQ_FACTOR * n_e / Omega**2, with n_e in units of 10^19 m^-3
+_PLASMA_FREQ_FACTOR = (
+    constants.e**2 * 10**19 / (constants.epsilon_0 * constants.m_e)
+)
+# Y = _GYRO_FREQ_FACTOR * B / Omega
+_GYRO_FREQ_FACTOR = constants.e / constants.m_e
+_SPEED_OF_LIGHT = constants.c
+
+_EMPTY = np.zeros(0)
+
+
+class EquilibriumArrays(NamedTuple):
+    """The magnetic field and density profile flattened into arrays
+    that can be passed to the compiled kernels.
+
+    Spline parameters are those of FITPACK, as in the ``tck``
+    attributes of the `scipy.interpolate` splines. The four
+    bivariate splines are the poloidal flux, ``B_R``, ``B_T`` and
+    ``B_Z`` for `InterpolatedField`; only the first is used for
+    `EFITField`, with ``rBphi`` stored as a univariate spline in
+    ``field_t``, ``field_c``.
+    """
+
+    field_kind: int
+    #: ``B_T_axis, R_axis, minor_radius_a, B_p_a`` for the analytic
+    #: fields, or ``poloidal_flux_gradient, delta_R, delta_Z`` for EFIT
+    field_parameters: FloatArray
+    tx: tuple
+    ty: tuple
+    c: tuple
+    kx: int
+    ky: int
+    field_t: FloatArray
+    field_c: FloatArray
+    field_k: int
+    density_kind: int
+    poloidal_flux_enter: float
+    #: Polynomial coefficients, or ``ne_0, ne_1`` for `TanhFit`
+    density_parameters: FloatArray
+    density_t: FloatArray
+    density_c: FloatArray
+    density_k: int
+
+
+def _bivariate_tck(interpolator) -> tuple:
+    """Knots, coefficients and degrees of a spline from `_make_rect_spline`"""
+    tx, ty, c = interpolator.spline.tck
+    kx, ky = interpolator.spline.degrees
+    return np.asfarray(tx), np.asfarray(ty), np.asfarray(c), kx, ky
+
+
+def _univariate_tck(spline) -> tuple:
+    t, c, k = spline._eval_args
+    return np.asfarray(t), np.asfarray(c), int(k)
+
+
+def equilibrium_arrays(
+    field: MagneticField, density_fit: DensityFitLike
+) -> EquilibriumArrays:
+    """Flatten ``field`` and ``density_fit`` into an `EquilibriumArrays`.
+
+    Raises
+    ------
+    ValueError
+        If either isn't supported by the compiled kernels. Subclasses
+        of the supported types aren't accepted either, as they may
+        change the parameterisation
+    """
+    empty_splines = (_EMPTY,) * 4
+    field_t, field_c, field_k = _EMPTY, _EMPTY, 0
+    tx = ty = c = empty_splines
+    kx = ky = 0
+
+    field_type = type(field)
+    if field_type in (CircularCrossSectionField, ConstantCurrentDensityField):
+        field_kind = (
+            FIELD_CIRCULAR
+            if field_type is CircularCrossSectionField
+            else FIELD_CONSTANT_CURRENT
+        )
+        field_parameters = np.array(
+            [field.B_T_axis, field.R_axis, field.minor_radius_a, field.B_p_a],
+            dtype=float,
+        )
+    elif field_type is InterpolatedField:
+        field_kind = FIELD_INTERPOLATED
+        field_parameters = _EMPTY
+        splines = [
+            _bivariate_tck(interpolator)
+            for interpolator in (
+                field._interp_poloidal_flux,
+                field._interp_B_R,
+                field._interp_B_T,
+                field._interp_B_Z,
+            )
+        ]
+        tx, ty, c = (tuple(spline[i] for spline in splines) for i in range(3))
+        kx, ky = splines[0][3:]
+    elif field_type is EFITField:
+        field_kind = FIELD_EFIT
+        field_parameters = np.array(
+            [field.poloidal_flux_gradient, field.delta_R, field.delta_Z], dtype=float
+        )
+        psi_tx, psi_ty, psi_c, kx, ky = _bivariate_tck(field._interp_poloidal_flux)
+        tx, ty, c = (psi_tx,) * 4, (psi_ty,) * 4, (psi_c,) * 4
+        field_t, field_c, field_k = _univariate_tck(field._interp_rBphi)
+    else:
+        raise ValueError(f"No compiled kernel for magnetic field '{field_type}'")
+
+    density_t, density_c, density_k = _EMPTY, _EMPTY, 0
+    density_type = type(density_fit)
+    if density_type is QuadraticFit:
+        density_kind = DENSITY_POLYNOMIAL
+        density_parameters = np.array(
+            [-density_fit.ne_0 / density_fit.poloidal_flux_enter, 0.0, density_fit.ne_0]
+        )
+    elif density_type is PolynomialFit:
+        density_kind = DENSITY_POLYNOMIAL
+        density_parameters = np.asfarray(density_fit.coefficients)
+    elif density_type is TanhFit:
+        density_kind = DENSITY_TANH
+        density_parameters = np.array([density_fit.ne_0, density_fit.ne_1])
+    elif density_type is SmoothingSplineFit:
+        density_kind = DENSITY_SPLINE
+        density_parameters = _EMPTY
+        density_t, density_c, density_k = _univariate_tck(density_fit.spline)
+    else:
+        raise ValueError(f"No compiled kernel for density fit '{density_type}'")
+
+    return EquilibriumArrays(
+        field_kind,
+        field_parameters,
+        tx,
+        ty,
+        c,
+        int(kx),
+        int(ky),
+        field_t,
+        field_c,
+        int(field_k),
+        density_kind,
+        float(density_fit.poloidal_flux_enter),
+        density_parameters,
+        density_t,
+        density_c,
+        int(density_k),
+    )
+
+
+# ----------------------------------
+# Splines
+
+
+@_njit
+def _find_span(t, k, x):
+    """Index ``l`` of the knot interval ``t[l] <= x < t[l + 1]``,
+    restricted to the interior intervals ``k <= l <= len(t) - k - 2``,
+    so that points outside these are extrapolated"""
+    low = k
+    high = len(t) - k - 2
+    if x >= t[high]:
+        return high
+    if x < t[low + 1]:
+        return low
+    while high - low > 1:
+        middle = (low + high) // 2
+        if x < t[middle]:
+            high = middle
+        else:
+            low = middle
+    return low
+
+
+@_njit
+def _basis_functions(t, k, x, span, basis):
+    """The ``k + 1`` non-zero B-splines of degree ``k`` at ``x`` in the
+    knot interval ``span``, using the Cox-de Boor recursion"""
+    left = np.empty(k + 1)
+    right = np.empty(k + 1)
+    basis[0] = 1.0
+    for j in range(1, k + 1):
+        left[j] = x - t[span + 1 - j]
+        right[j] = t[span + j] - x
+        saved = 0.0
+        for r in range(j):
+            temp = basis[r] / (right[r + 1] + left[j - r])
+            basis[r] = saved + right[r + 1] * temp
+            saved = left[j - r] * temp
+        basis[j] = saved
+
+
+@_njit
+def splev(t, c, k, x):
+    """Evaluate a univariate spline at ``x``, extrapolating outside the
+    knots like `scipy.interpolate.UnivariateSpline` with ``ext=0``"""
+    span = _find_span(t, k, x)
+    basis = np.empty(k + 1)
+    _basis_functions(t, k, x, span, basis)
+    result = 0.0
+    for r in range(k + 1):
+        result += c[span - k + r] * basis[r]
+    return result
+
+
+@_njit
+def bispev(tx, ty, c, kx, ky, x, y):
+    """Evaluate a bivariate spline at ``(x, y)``. Like
+    `scipy.interpolate.RectBivariateSpline`, points outside the
+    domain are clamped to its boundary"""
+    x = min(max(x, tx[kx]), tx[len(tx) - kx - 1])
+    y = min(max(y, ty[ky]), ty[len(ty) - ky - 1])
+    span_x = _find_span(tx, kx, x)
+    span_y = _find_span(ty, ky, y)
+    basis_x = np.empty(kx + 1)
+    basis_y = np.empty(ky + 1)
+    _basis_functions(tx, kx, x, span_x, basis_x)
+    _basis_functions(ty, ky, y, span_y, basis_y)
+
+    num_y = len(ty) - ky - 1
+    result = 0.0
+    for i in range(kx + 1):
+        row = (span_x - kx + i) * num_y + span_y - ky
+        partial = 0.0
+        for j in range(ky + 1):
+            partial += c[row + j] * basis_y[j]
+        result += basis_x[i] * partial
+    return result
+
+
+# ----------------------------------
+# Equilibrium
+
+
+@_njit
+def _field(eq, q_R, q_Z):
+    """Poloidal flux and ``B_R, B_T, B_Z`` at a single point"""
+    if eq.field_kind == FIELD_CIRCULAR or eq.field_kind == FIELD_CONSTANT_CURRENT:
+        B_T_axis = eq.field_parameters[0]
+        R_axis = eq.field_parameters[1]
+        minor_radius_a = eq.field_parameters[2]
+        B_p_a = eq.field_parameters[3]
+        rho = np.sqrt((q_R - R_axis) ** 2 + q_Z**2)
+        B_p_factor = B_p_a / rho
+        if eq.field_kind == FIELD_CIRCULAR:
+            B_p_factor /= q_R * minor_radius_a
+        return (
+            rho / minor_radius_a,
+            B_p_factor * q_Z,
+            B_T_axis * (R_axis / q_R),
+            -B_p_factor * (q_R - R_axis),
+        )
+
+    if eq.field_kind == FIELD_INTERPOLATED:
+        return (
+            bispev(eq.tx[0], eq.ty[0], eq.c[0], eq.kx, eq.ky, q_R, q_Z),
+            bispev(eq.tx[1], eq.ty[1], eq.c[1], eq.kx, eq.ky, q_R, q_Z),
+            bispev(eq.tx[2], eq.ty[2], eq.c[2], eq.kx, eq.ky, q_R, q_Z),
+            bispev(eq.tx[3], eq.ty[3], eq.c[3], eq.kx, eq.ky, q_R, q_Z),
+        )
+
+    # EFIT: B_R and B_Z from central differences of the flux, as in
+    # `EFITField.B_R` and `EFITField.B_Z`
+    tx, ty, c, kx, ky = eq.tx[0], eq.ty[0], eq.c[0], eq.kx, eq.ky
+    poloidal_flux_gradient = eq.field_parameters[0]
+    delta_R = eq.field_parameters[1]
+    delta_Z = eq.field_parameters[2]
+    poloidal_flux = bispev(tx, ty, c, kx, ky, q_R, q_Z)
+    dpolflux_dR = (
+        bispev(tx, ty, c, kx, ky, q_R + delta_R, q_Z)
+        - bispev(tx, ty, c, kx, ky, q_R - delta_R, q_Z)
+    ) / (2 * delta_R)
+    dpolflux_dZ = (
+        bispev(tx, ty, c, kx, ky, q_R, q_Z + delta_Z)
+        - bispev(tx, ty, c, kx, ky, q_R, q_Z - delta_Z)
+    ) / (2 * delta_Z)
+    rBphi = splev(eq.field_t, eq.field_c, eq.field_k, poloidal_flux)
+    return (
+        poloidal_flux,
+        -dpolflux_dZ * poloidal_flux_gradient / q_R,
+        rBphi / q_R,
+        dpolflux_dR * poloidal_flux_gradient / q_R,
+    )
+
+
+@_njit
+def _density(eq, poloidal_flux):
+    """Electron density, which is zero outside the plasma"""
+    if not poloidal_flux <= eq.poloidal_flux_enter:
+        return 0.0
+    if eq.density_kind == DENSITY_POLYNOMIAL:
+        result = 0.0
+        for coefficient in eq.density_parameters:
+            result = result * poloidal_flux + coefficient
+        return result
+    if eq.density_kind == DENSITY_TANH:
+        return eq.density_parameters[0] * np.tanh(
+            eq.density_parameters[1] * (poloidal_flux - eq.poloidal_flux_enter)
+        )
+    return splev(eq.density_t, eq.density_c, eq.density_k, poloidal_flux)
+
+
+# ----------------------------------
+# Hamiltonian
+
+
+@_njit
+def _booker_hamiltonian(
+    K_magnitude,
+    electron_density,
+    B_total,
+    sin_theta_m_sq,
+    launch_angular_frequency,
+    mode_flag,
+):
+    """:math:`H` from the local plasma parameters at a single point, as
+    in `Hamiltonian.from_spatial_terms`"""
+    X = _PLASMA_FREQ_FACTOR * electron_density / launch_angular_frequency**2
+    Y = _GYRO_FREQ_FACTOR * B_total / launch_angular_frequency
+    Y_squared = Y * Y
+
+    e_bb = 1 - X
+    e_11 = 1 - X / (1 - Y_squared)
+    e_12 = X * Y / (1 - Y_squared)
+
+    Booker_alpha = e_bb * sin_theta_m_sq + e_11 * (1 - sin_theta_m_sq)
+    Booker_beta = -e_11 * e_bb * (1 + sin_theta_m_sq) - (e_11**2 - e_12**2) * (
+        1 - sin_theta_m_sq
+    )
+    # Factorised as in `Hamiltonian.dispersion_terms`, to avoid the
+    # cancellation in beta**2 - 4 * alpha * gamma at low density
+    H_discriminant = e_12**2 * (
+        Y_squared * (1 - sin_theta_m_sq) ** 2 + 4 * e_bb**2 * sin_theta_m_sq
+    )
+
+    wavenumber_K0 = launch_angular_frequency / _SPEED_OF_LIGHT
+    return (K_magnitude / wavenumber_K0) ** 2 + (
+        Booker_beta - mode_flag * np.sqrt(H_discriminant)
+    ) / (2 * Booker_alpha)
+
+
+@_njit
+def _hamiltonian(
+    electron_density,
+    B_R,
+    B_T,
+    B_Z,
+    q_R,
+    K_R,
+    K_zeta,
+    K_Z,
+    launch_angular_frequency,
+    mode_flag,
+):
+    """:math:`H` given the position-dependent terms at a single point"""
+    K_zeta_over_R = K_zeta / q_R
+    K_magnitude = np.sqrt(K_R**2 + K_zeta_over_R**2 + K_Z**2)
+    B_total = np.sqrt(B_R**2 + B_T**2 + B_Z**2)
+    cos_theta = (B_R * K_R + B_T * K_zeta_over_R + B_Z * K_Z) / (B_total * K_magnitude)
+    return _booker_hamiltonian(
+        K_magnitude,
+        electron_density,
+        B_total,
+        cos_theta**2,
+        launch_angular_frequency,
+        mode_flag,
+    )
+
+
+@_njit
+def hamiltonian_kernel(
+    eq, launch_angular_frequency, mode_flag, q_R, q_Z, K_R, K_zeta, K_Z, out
+):
+    """Evaluate :math:`H` at each of the points in the 1D arrays ``q_R``
+    etc, storing the result in ``out``"""
+    for i in range(len(out)):
+        poloidal_flux, B_R, B_T, B_Z = _field(eq, q_R[i], q_Z[i])
+        out[i] = _hamiltonian(
+            _density(eq, poloidal_flux),
+            B_R,
+            B_T,
+            B_Z,
+            q_R[i],
+            K_R[i],
+            K_zeta[i],
+            K_Z[i],
+            launch_angular_frequency,
+            mode_flag,
+        )
+
+
+@_njit
+def _point_derivatives(
+    eq,
+    launch_angular_frequency,
+    mode_flag,
+    q_R,
+    q_Z,
+    K_R,
+    K_zeta,
+    K_Z,
+    displacements,
+    spatial_displacements,
+    spatial_index,
+    weights,
+    out,
+):
+    """Apply the stencils of a `StencilPlan` at a single point. The
+    field and density are evaluated once at each distinct position"""
+    num_spatial = len(spatial_displacements)
+    spatial = np.empty((num_spatial, 4))
+    for j in range(num_spatial):
+        q_R_j = q_R + spatial_displacements[j, 0]
+        poloidal_flux, B_R, B_T, B_Z = _field(
+            eq, q_R_j, q_Z + spatial_displacements[j, 1]
+        )
+        spatial[j, 0] = _density(eq, poloidal_flux)
+        spatial[j, 1] = B_R
+        spatial[j, 2] = B_T
+        spatial[j, 3] = B_Z
+
+    out[:] = 0.0
+    for point in range(len(displacements)):
+        j = spatial_index[point]
+        H = _hamiltonian(
+            spatial[j, 0],
+            spatial[j, 1],
+            spatial[j, 2],
+            spatial[j, 3],
+            q_R + displacements[point, 0],
+            K_R + displacements[point, 2],
+            K_zeta + displacements[point, 3],
+            K_Z + displacements[point, 4],
+            launch_angular_frequency,
+            mode_flag,
+        )
+        for derivative in range(len(out)):
+            out[derivative] += weights[derivative, point] * H
+
+
+@_njit
+def derivatives_kernel(
+    eq,
+    launch_angular_frequency,
+    mode_flag,
+    q_R,
+    q_Z,
+    K_R,
+    K_zeta,
+    K_Z,
+    displacements,
+    spatial_displacements,
+    spatial_index,
+    weights,
+    out,
+):
+    """Apply the stencils of a `StencilPlan` at each of the points in the
+    1D arrays ``q_R`` etc, storing the derivatives in ``out``, with
+    shape ``(derivatives, points)``"""
+    result = np.empty(len(weights))
+    for i in range(out.shape[1]):
+        _point_derivatives(
+            eq,
+            launch_angular_frequency,
+            mode_flag,
+            q_R[i],
+            q_Z[i],
+            K_R[i],
+            K_zeta[i],
+            K_Z[i],
+            displacements,
+            spatial_displacements,
+            spatial_index,
+            weights,
+            result,
+        )
+        out[:, i] = result
+
+
+@_njit
+def beam_evolution_kernel(
+    eq,
+    launch_angular_frequency,
+    mode_flag,
+    beam_parameters,
+    K_zeta,
+    displacements,
+    spatial_displacements,
+    spatial_index,
+    weights,
+):
+    """Compiled version of `beam_evolution_fun`. The stencil plan must
+    be for all of the first and then second order derivatives, in the
+    order of `FIRST_ORDER_DERIVATIVES` and `SECOND_ORDER_DERIVATIVES`"""
+    dH = np.empty(len(weights))
+    _point_derivatives(
+        eq,
+        launch_angular_frequency,
+        mode_flag,
+        beam_parameters[0],
+        beam_parameters[2],
+        beam_parameters[3],
+        K_zeta,
+        beam_parameters[4],
+        displacements,
+        spatial_displacements,
+        spatial_index,
+        weights,
+        dH,
+    )
+    (
+        dH_dR,
+        dH_dZ,
+        dH_dKR,
+        dH_dKzeta,
+        dH_dKZ,
+        d2H_dR2,
+        d2H_dZ2,
+        d2H_dKR2,
+        d2H_dKzeta2,
+        d2H_dKZ2,
+        d2H_dR_dZ,
+        d2H_dR_dKR,
+        d2H_dR_dKzeta,
+        d2H_dR_dKZ,
+        d2H_dZ_dKR,
+        d2H_dZ_dKzeta,
+        d2H_dZ_dKZ,
+        d2H_dKR_dKZ,
+        d2H_dKR_dKzeta,
+        d2H_dKzeta_dKZ,
+    ) = dH
+
+    # Symmetric matrix of Psi, from its packed real and imaginary parts
+    Psi = np.empty((3, 3), dtype=np.complex128)
+    for packed, (row, column) in enumerate(
+        ((0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2))
+    ):
+        Psi[row, column] = (
+            beam_parameters[5 + packed] + 1j * beam_parameters[11 + packed]
+        )
+        Psi[column, row] = Psi[row, column]
+
+    grad_grad_H = np.zeros((3, 3))
+    grad_grad_H[0, 0] = d2H_dR2
+    grad_grad_H[0, 2] = grad_grad_H[2, 0] = d2H_dR_dZ
+    grad_grad_H[2, 2] = d2H_dZ2
+
+    gradK_grad_H = np.zeros((3, 3))
+    gradK_grad_H[0, 0] = d2H_dR_dKR
+    gradK_grad_H[1, 0] = d2H_dR_dKzeta
+    gradK_grad_H[2, 0] = d2H_dR_dKZ
+    gradK_grad_H[0, 2] = d2H_dZ_dKR
+    gradK_grad_H[1, 2] = d2H_dZ_dKzeta
+    gradK_grad_H[2, 2] = d2H_dZ_dKZ
+
+    gradK_gradK_H = np.empty((3, 3))
+    gradK_gradK_H[0, 0] = d2H_dKR2
+    gradK_gradK_H[1, 1] = d2H_dKzeta2
+    gradK_gradK_H[2, 2] = d2H_dKZ2
+    gradK_gradK_H[0, 1] = gradK_gradK_H[1, 0] = d2H_dKR_dKzeta
+    gradK_gradK_H[0, 2] = gradK_gradK_H[2, 0] = d2H_dKR_dKZ
+    gradK_gradK_H[1, 2] = gradK_gradK_H[2, 1] = d2H_dKzeta_dKZ
+
+    Psi_gradK_grad_H = Psi @ gradK_grad_H.astype(np.complex128)
+    d_Psi_d_tau = (
+        -grad_grad_H
+        - Psi_gradK_grad_H
+        - Psi_gradK_grad_H.T
+        - Psi @ gradK_gradK_H.astype(np.complex128) @ Psi
+    )
+
+    result = np.empty(17)
+    result[0] = dH_dKR
+    result[1] = dH_dKzeta
+    result[2] = dH_dKZ
+    result[3] = -dH_dR
+    result[4] = -dH_dZ
+    for packed, (row, column) in enumerate(
+        ((0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2))
+    ):
+        result[5 + packed] = d_Psi_d_tau[row, column].real
+        result[11 + packed] = d_Psi_d_tau[row, column].imag
+    return result
+
+
+def _broadcast(*arrays: ArrayLike) -> list:
+    """Broadcast ``arrays`` against each other, as contiguous float
+    arrays that can be flattened and passed to the kernels"""
+    return [np.array(x, dtype=float) for x in np.broadcast_arrays(*arrays)]
+
+
+@_njit
+def _find_H_kernel(
+    K_magnitude,
+    electron_density,
+    B_total,
+    sin_theta_m_sq,
+    launch_angular_frequency,
+    mode_flag,
+    out,
+):
+    for i in range(len(out)):
+        out[i] = _booker_hamiltonian(
+            K_magnitude[i],
+            electron_density[i],
+            B_total[i],
+            sin_theta_m_sq[i],
+            launch_angular_frequency,
+            mode_flag,
+        )
+
+
+def find_H(
+    K_magnitude: ArrayLike,
+    electron_density: ArrayLike,
+    B_total: ArrayLike,
+    sin_theta_m_sq: ArrayLike,
+    launch_angular_frequency: float,
+    mode_flag: int,
+) -> FloatArray:
+    """Evaluate :math:`H` from the local plasma parameters with the
+    compiled kernel, broadcasting over the arrays"""
+    arrays = _broadcast(K_magnitude, electron_density, B_total, sin_theta_m_sq)
+    result = np.empty(arrays[0].shape)
+    _find_H_kernel(
+        *(x.ravel() for x in arrays),
+        float(launch_angular_frequency),
+        float(mode_flag),
+        result.reshape(-1),
+    )
+    return result
+
+
+# ----------------------------------
+# Interface
+
+
+class CompiledHamiltonian(Hamiltonian):
+    """`Hamiltonian` evaluated with the compiled kernels in this module.
+
+    The derivatives are always computed with finite differences, using
+    the same stencils as `Hamiltonian.derivatives`. Takes the same
+    arguments as `Hamiltonian`, apart from ``derivative_method``.
+
+    Raises
+    ------
+    ValueError
+        If the field or density fit aren't supported (see
+        `equilibrium_arrays`), or for arrays of frequencies or modes
+    RuntimeError
+        If Numba isn't installed
+    """
+
+    def __init__(
+        self,
+        field: MagneticField,
+        launch_angular_frequency: float,
+        mode_flag: int,
+        density_fit: DensityFitLike,
+        delta_R: float,
+        delta_Z: float,
+        delta_K_R: float,
+        delta_K_zeta: float,
+        delta_K_Z: float,
+    ):
+        if not HAS_NUMBA:
+            raise RuntimeError("The compiled Hamiltonian requires Numba")
+        if np.ndim(launch_angular_frequency) or np.ndim(mode_flag):
+            raise ValueError(
+                "The compiled Hamiltonian needs a single frequency and mode_flag"
+            )
+
+        super().__init__(
+            field,
+            launch_angular_frequency,
+            mode_flag,
+            density_fit,
+            delta_R,
+            delta_Z,
+            delta_K_R,
+            delta_K_zeta,
+            delta_K_Z,
+        )
+        self.equilibrium = equilibrium_arrays(field, density_fit)
+        self._beam_plan = self.stencil_plan(
+            name for name, _, _ in FIRST_ORDER_DERIVATIVES + SECOND_ORDER_DERIVATIVES
+        )
+
+    def __call__(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+    ):
+        coords = _broadcast(q_R, q_Z, K_R, K_zeta, K_Z)
+        result = np.empty(coords[0].shape)
+        hamiltonian_kernel(
+            self.equilibrium,
+            float(self.angular_frequency),
+            float(self.mode_flag),
+            *(x.ravel() for x in coords),
+            result.reshape(-1),
+        )
+        return result
+
+    def derivatives(
+        self,
+        q_R: ArrayLike,
+        q_Z: ArrayLike,
+        K_R: ArrayLike,
+        K_zeta: ArrayLike,
+        K_Z: ArrayLike,
+        second_order: bool = False,
+        required=None,
+    ):
+        if required is None:
+            required = [name for name, _, _ in FIRST_ORDER_DERIVATIVES]
+            if second_order:
+                required += [name for name, _, _ in SECOND_ORDER_DERIVATIVES]
+
+        plan = self.stencil_plan(required)
+        coords = _broadcast(q_R, q_Z, K_R, K_zeta, K_Z)
+        shape = coords[0].shape
+        result = np.empty((len(plan.names), coords[0].size))
+        derivatives_kernel(
+            self.equilibrium,
+            float(self.angular_frequency),
+            float(self.mode_flag),
+            *(x.ravel() for x in coords),
+            plan.displacements,
+            plan.spatial_displacements,
+            plan.spatial_index,
+            plan.weights,
+            result,
+        )
+        return dict(zip(plan.names, result.reshape((-1,) + shape)))
+
+    def beam_evolution_fun(
+        self, tau: float, beam_parameters: FloatArray, K_zeta: float
+    ) -> FloatArray:
+        """Compiled equivalent of `scotty.fun_evolution.beam_evolution_fun`"""
+        plan = self._beam_plan
+        return beam_evolution_kernel(
+            self.equilibrium,
+            float(self.angular_frequency),
+            float(self.mode_flag),
+            np.asfarray(beam_parameters),
+            float(K_zeta),
+            plan.displacements,
+            plan.spatial_displacements,
+            plan.spatial_index,
+            plan.weights,
+        )
+
+
+def make_hamiltonian(
+    field: MagneticField,
+    launch_angular_frequency: float,
+    mode_flag: int,
+    density_fit: DensityFitLike,
+    delta_R: float,
+    delta_Z: float,
+    delta_K_R: float,
+    delta_K_zeta: float,
+    delta_K_Z: float,
+    derivative_method: str = "finite-difference",
+    backend: str = "numpy",
+) -> Hamiltonian:
+    """Create a `Hamiltonian` for one of the `BACKENDS`.
+
+    With ``backend="numba"``, this returns a `CompiledHamiltonian` if
+    possible. If Numba isn't installed, the field or density fit
+    aren't supported, or ``derivative_method`` isn't
+    ``"finite-difference"``, this warns and falls back to the NumPy
+    `Hamiltonian`
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Expected one of {BACKENDS}")
+
+    arguments = (
+        field,
+        launch_angular_frequency,
+        mode_flag,
+        density_fit,
+        delta_R,
+        delta_Z,
+        delta_K_R,
+        delta_K_zeta,
+        delta_K_Z,
+    )
+
+    if backend == "numba":
+        if not HAS_NUMBA:
+            reason = "Numba is not installed"
+        elif derivative_method != "finite-difference":
+            reason = f"derivative_method='{derivative_method}' is not supported"
+        else:
+            try:
+                return CompiledHamiltonian(*arguments)
+            except ValueError as error:
+                reason = str(error)
+        warn(f"Cannot use the 'numba' backend ({reason}), falling back to 'numpy'")
+
+    return Hamiltonian(*arguments, derivative_method=derivative_method)
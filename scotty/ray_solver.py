@@ -2,6 +2,8 @@
 
 Used by the main code to find the point where the beam leaves the
 plasma, which then sets the integration limits for the beam solver.
+Alternatively, `propagate_beam` uses the same events to find where
+the beam leaves the plasma while integrating the beam itself.
 
 """
 
@@ -9,8 +11,19 @@ plasma, which then sets the integration limits for the beam solver.
 # SPDX-License-Identifier: GPL-3.0
 
 from dataclasses import dataclass
+from functools import partial
 from time import time
-from typing import Any, Callable, Dict, Protocol, Tuple, Union, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 import numpy as np
 from scipy.integrate import solve_ivp
@@ -18,7 +31,9 @@ from scipy.integrate import solve_ivp
 from scotty.fun_general import K_magnitude, find_normalised_gyro_freq
 from scotty.geometry import MagneticField
 from scotty.hamiltonian import Hamiltonian
-from scotty.typing import FloatArray
+from scotty.sweep import WarmStart
+from scotty.trajectory import SPECTRUM_POWER_LAW_COEFFICIENT
+from scotty.typing import ArrayLike, FloatArray
 
 
 class _Event(Protocol):
@@ -47,8 +62,89 @@ def _event(terminal: bool, direction: float):
     return decorator_event
 
 
+# Derivatives of H needed by `ray_evolution_2D_fun`, which also cover
+# those needed by the events
+RAY_DERIVATIVES = ("dH_dR", "dH_dZ", "dH_dKR", "dH_dKZ")
+
+
+class RayEvaluationCache:
+    """Quantities at the last ray state evaluated, shared between
+    `ray_evolution_2D_fun` and the events from `make_solver_events`.
+
+    After each step, `scipy.integrate.solve_ivp` checks the events at
+    the state where its RK45 solver has just evaluated the right-hand
+    side, so the events can read the derivatives of :math:`H` from
+    there, rather than evaluating the finite difference stencil again.
+    Only the last state is kept, and any other state (such as those
+    from the root finding of an event) is evaluated afresh. The state
+    doesn't include ``K_zeta``, so a cache must only be used for one
+    ray.
+
+    Parameters
+    ----------
+    field : MagneticField
+        Object describing magnetic field
+
+    Attributes
+    ----------
+    evaluations : int
+        Number of times the derivatives of :math:`H` were evaluated
+
+    """
+
+    def __init__(self, field: MagneticField):
+        self.field = field
+        self.evaluations = 0
+        self._state: Optional[Tuple[float, ...]] = None
+        self._values: Dict[str, Any] = {}
+
+    def _at(self, ray_parameters_2D) -> Dict[str, Any]:
+        """The cached values, emptied if the state has changed"""
+        state = tuple(np.asfarray(ray_parameters_2D).tolist())
+        if state != self._state:
+            self._state = state
+            self._values = {}
+        return self._values
+
+    def derivatives(
+        self, ray_parameters_2D, K_zeta: float, hamiltonian: Hamiltonian
+    ) -> Dict[str, ArrayLike]:
+        """The derivatives of :math:`H` in `RAY_DERIVATIVES`"""
+        values = self._at(ray_parameters_2D)
+        if "dH" not in values:
+            q_R, q_Z, K_R, K_Z = ray_parameters_2D
+            values["dH"] = hamiltonian.derivatives(
+                q_R, q_Z, K_R, K_zeta, K_Z, required=RAY_DERIVATIVES
+            )
+            self.evaluations += 1
+        return values["dH"]
+
+    def poloidal_flux(self, ray_parameters_2D) -> float:
+        """The poloidal flux at the position of the ray"""
+        values = self._at(ray_parameters_2D)
+        if "poloidal_flux" not in values:
+            q_R, q_Z, _, _ = ray_parameters_2D
+            values["poloidal_flux"] = self.field.poloidal_flux(q_R, q_Z)
+        return values["poloidal_flux"]
+
+    def B_magnitude(self, ray_parameters_2D) -> float:
+        """The magnitude of the magnetic field at the position of the ray"""
+        values = self._at(ray_parameters_2D)
+        if "B_magnitude" not in values:
+            q_R, q_Z, _, _ = ray_parameters_2D
+            field = self.field.evaluate(q_R, q_Z)
+            values.setdefault("poloidal_flux", field["polflux"])
+            values["B_magnitude"] = np.sqrt(
+                field["B_R"] ** 2 + field["B_T"] ** 2 + field["B_Z"] ** 2
+            )
+        return values["B_magnitude"]
+
+
 def make_solver_events(
-    poloidal_flux_enter: float, launch_angular_frequency: float, field: MagneticField
+    poloidal_flux_enter: float,
+    launch_angular_frequency: float,
+    field: MagneticField,
+    cache: Optional[RayEvaluationCache] = None,
 ) -> Dict[str, Callable]:
     """Define event handlers for the ray solver
 
@@ -62,6 +158,10 @@ def make_solver_events(
         Beam frequency
     field : MagneticField
         Magnetic field object
+    cache : Optional[RayEvaluationCache]
+        Values at the last state evaluated, shared with
+        `ray_evolution_2D_fun`. If ``None``, the events only share
+        them between themselves
 
     Returns
     -------
@@ -69,13 +169,14 @@ def make_solver_events(
         Dictionary of event handlers with names
 
     """
+    if cache is None:
+        cache = RayEvaluationCache(field)
 
     @_event(terminal=True, direction=1.0)
     def event_leave_plasma(
         tau, ray_parameters_2D, K_zeta: float, hamiltonian: Hamiltonian
     ):
-        q_R, q_Z, _, _ = ray_parameters_2D
-        poloidal_flux = field.poloidal_flux(q_R, q_Z)
+        poloidal_flux = cache.poloidal_flux(ray_parameters_2D)
 
         # Leave at the same poloidal flux of entry
         # goes from negative to positive when leaving the plasma
@@ -85,8 +186,7 @@ def make_solver_events(
     def event_leave_LCFS(
         tau, ray_parameters_2D, K_zeta: float, hamiltonian: Hamiltonian
     ):
-        q_R, q_Z, _, _ = ray_parameters_2D
-        poloidal_flux = field.poloidal_flux(q_R, q_Z)
+        poloidal_flux = cache.poloidal_flux(ray_parameters_2D)
         poloidal_flux_LCFS = 1.0
         # goes from negative to positive when leaving the LCFS
         return poloidal_flux - poloidal_flux_LCFS
@@ -103,29 +203,24 @@ def make_solver_events(
     ):
         q_R, q_Z, _, _ = ray_parameters_2D
 
-        is_inside = (
-            (q_R > data_R_coord_min)
-            and (q_R < data_R_coord_max)
-            and (q_Z > data_Z_coord_min)
-            and (q_Z < data_Z_coord_max)
+        # Signed distance to the nearest side of the bounding box,
+        # continuous so that the root finding can locate the crossing.
+        # Goes from positive (inside) to negative (outside) when
+        # leaving the simulation region
+        return min(
+            q_R - data_R_coord_min,
+            data_R_coord_max - q_R,
+            q_Z - data_Z_coord_min,
+            data_Z_coord_max - q_Z,
         )
 
-        # goes from positive (True) to negative(False) when leaving the simulation region
-        return +1 if is_inside else -1
-
     @_event(terminal=True, direction=0.0)
     def event_cross_resonance(tau, ray_parameters_2D, K_zeta, hamiltonian: Hamiltonian):
         # Currently only works when crossing resonance.
         # To implement crossing of higher harmonics as well
         delta_gyro_freq = 0.01
 
-        q_R, q_Z, _, _ = ray_parameters_2D
-
-        B_R = field.B_R(q_R, q_Z)
-        B_T = field.B_T(q_R, q_Z)
-        B_Z = field.B_Z(q_R, q_Z)
-
-        B_Total = np.sqrt(B_R**2 + B_T**2 + B_Z**2)
+        B_Total = cache.B_magnitude(ray_parameters_2D)
         gyro_freq = find_normalised_gyro_freq(B_Total, launch_angular_frequency)
 
         # The function's return value gives zero when the gyrofreq on the ray goes from either
@@ -144,7 +239,8 @@ def make_solver_events(
         K_Z = ray_parameters_2D[3]
         K_magnitude = np.sqrt(K_R**2 + K_Z**2 + K_zeta**2 / q_R**2)
 
-        dH = hamiltonian.derivatives(q_R, q_Z, K_R, K_zeta, K_Z)
+        # Usually from the right-hand side at the end of the step
+        dH = cache.derivatives(ray_parameters_2D, K_zeta, hamiltonian)
 
         d_K_d_tau = -(1 / K_magnitude) * (
             dH["dH_dR"] * K_R + dH["dH_dZ"] * K_Z + dH["dH_dKR"] * q_R
@@ -160,6 +256,63 @@ def make_solver_events(
     }
 
 
+def make_localisation_event(localisation_tolerance: float) -> _Event:
+    r"""Define an event for the ray or beam solver which stops it once
+    the backscattering localisation has converged past the cut-off.
+
+    The ray and spectrum pieces of the localisation,
+    :math:`|K|^{-13/3} / |g|^2`, are evaluated as the solver goes
+    along, and the event occurs once they have decayed to
+    ``localisation_tolerance`` times the largest value seen so far.
+    These pieces peak at the cut-off and fall off quickly beyond it,
+    so the rest of the beam adds little to the cumulative
+    localisation, while the beam would otherwise still have to be
+    followed all the way out of the plasma. The beam piece is not
+    included, as it needs the beam frame, but varies slowly near the
+    cut-off.
+
+    The largest value is kept between calls, so a new event must be
+    made for each solve.
+
+    Parameters
+    ----------
+    localisation_tolerance : float
+        Fraction of the peak localisation below which the solver stops
+
+    Returns
+    -------
+    Callable
+        Terminal event, with the same signature as those from
+        `make_solver_events`
+
+    """
+    peak_localisation = 0.0
+
+    @_event(terminal=True, direction=-1)
+    def event_localisation_converged(tau, ray_parameters_2D, K_zeta, hamiltonian):
+        nonlocal peak_localisation
+
+        q_R = ray_parameters_2D[0]
+        q_Z = ray_parameters_2D[1]
+        K_R = ray_parameters_2D[2]
+        K_Z = ray_parameters_2D[3]
+
+        dH = hamiltonian.derivatives(
+            q_R, q_Z, K_R, K_zeta, K_Z, required=("dH_dKR", "dH_dKzeta", "dH_dKZ")
+        )
+        g_magnitude_squared = (
+            q_R**2 * dH["dH_dKzeta"] ** 2 + dH["dH_dKR"] ** 2 + dH["dH_dKZ"] ** 2
+        )
+        localisation = (
+            K_magnitude(K_R, K_zeta, K_Z, q_R) ** -SPECTRUM_POWER_LAW_COEFFICIENT
+            / g_magnitude_squared
+        )
+        peak_localisation = max(peak_localisation, localisation)
+        return localisation - localisation_tolerance * peak_localisation
+
+    return event_localisation_converged
+
+
 def handle_leaving_plasma_events(
     tau_events: Dict[str, FloatArray], ray_parameters_2D_events: FloatArray
 ) -> float:
@@ -229,15 +382,15 @@ def handle_leaving_plasma_events(
 
 
 def handle_no_resonance(
-    solver_ray_output,
+    tau_ray: FloatArray,
+    ray_parameters_2D: FloatArray,
     tau_leave: float,
-    tau_points: FloatArray,
     K_zeta: float,
     solver_arguments,
     event_leave_plasma: Callable,
-) -> FloatArray:
-    """Add an additional tau point at the cut-off (minimum K) if the
-    beam does NOT reach a resonance
+) -> float:
+    """Find the cut-off (minimum K) if the beam does NOT reach a
+    resonance
 
     Propagates another ray to find the cut-off location
 
@@ -247,9 +400,6 @@ def handle_no_resonance(
     the same information better/faster
 
     """
-    ray_parameters_2D = solver_ray_output.y
-    tau_ray = solver_ray_output.t
-
     max_tau_idx = int(np.argmax(tau_ray[tau_ray <= tau_leave]))
 
     K_magnitude_ray = K_magnitude(
@@ -292,8 +442,73 @@ def handle_no_resonance(
         q_R=solver_ray_output_fine.y[0, :],
     )
     index_cutoff_fine = np.argmin(K_magnitude_ray_fine)
-    tau_cutoff_fine = float(solver_ray_output_fine.t[index_cutoff_fine])
-    return np.sort(np.append(tau_points, tau_cutoff_fine))
+    return float(solver_ray_output_fine.t[index_cutoff_fine])
+
+
+def ray_tau_points(
+    tau_events: Dict[str, FloatArray],
+    ray_parameters_2D_events: Dict[str, FloatArray],
+    K_zeta: float,
+    len_tau: int,
+    find_cutoff: Callable[[float], float],
+    cutoff_from_events: bool = False,
+) -> Tuple[float, FloatArray, Optional[float]]:
+    """Where a ray leaves the plasma, the values of tau to output the
+    beam at, and the cut-off, from the events of the ray solver
+
+    Parameters
+    ----------
+    tau_events : Dict[str, FloatArray]
+        A mapping between event names and the solver ``t_events``
+    ray_parameters_2D_events : Dict[str, FloatArray]
+        A mapping between event names and the solver ``y_events``
+    K_zeta : float
+        Toroidal wavevector of the ray
+    len_tau : int
+        Number of points for tau
+    find_cutoff : Callable[[float], float]
+        Called with ``tau_leave`` to find the cut-off, such as with
+        `handle_no_resonance`
+    cutoff_from_events : bool
+        If true, take the cut-off from the turning points of
+        :math:`|K|` inside the plasma instead, which are already known
+        to the tolerance of the event root finding, as in
+        `propagate_beam`. ``find_cutoff`` is then only called if there
+        are none
+
+    Returns
+    -------
+    tau_leave : float
+    tau_points : FloatArray
+        Evenly spaced up to ``tau_leave``, along with the cut-off
+    tau_cutoff : Optional[float]
+        ``None`` if the ray crosses a resonance
+
+    """
+    tau_leave = handle_leaving_plasma_events(
+        tau_events, ray_parameters_2D_events["leave_LCFS"]
+    )
+
+    # The beam solver outputs data at these values of tau
+    # Don't include `tau_leave` itself so that last point is inside
+    # the plasma
+    tau_points = np.linspace(0, tau_leave, len_tau - 1, endpoint=False)
+
+    if len(tau_events["cross_resonance"]) != 0:
+        return tau_leave, tau_points, None
+
+    tau_K_min = np.asarray(tau_events["reach_K_min"])
+    inside = tau_K_min < tau_leave
+    if cutoff_from_events and any(inside):
+        q_R, _, K_R, K_Z = np.reshape(ray_parameters_2D_events["reach_K_min"], (-1, 4))[
+            inside
+        ].T
+        tau_cutoff = float(
+            tau_K_min[inside][np.argmin(K_magnitude(K_R, K_zeta, K_Z, q_R))]
+        )
+    else:
+        tau_cutoff = find_cutoff(tau_leave)
+    return tau_leave, np.sort(np.append(tau_points, tau_cutoff)), tau_cutoff
 
 
 @dataclass
@@ -338,10 +553,8 @@ def quick_K_cutoff(
     K_min_idx = np.argmin(K_turning_pt)
     q_R, q_Z, K_R, K_Z = ray_parameters_turning_pt[K_min_idx]
 
-    B_R = field.B_R(q_R, q_Z)
-    B_T = field.B_T(q_R, q_Z)
-    B_Z = field.B_Z(q_R, q_Z)
-    B = np.array([B_R, B_T, B_Z])
+    field_at_cutoff = field.evaluate(q_R, q_Z)
+    B = np.array([field_at_cutoff[name] for name in ("B_R", "B_T", "B_Z")])
 
     K = np.array([K_R, K_zeta / q_R, K_Z])
     K_norm_min = K_turning_pt[K_min_idx]
@@ -350,12 +563,79 @@ def quick_K_cutoff(
     # Assumes the mismatch angle is never smaller than -90deg or bigger than 90deg
     theta_m = np.sign(sin_theta_m) * np.arcsin(abs(sin_theta_m))
 
-    poloidal_flux = field.poloidal_flux(q_R, q_Z)
+    poloidal_flux = field_at_cutoff["polflux"]
 
     return K_cutoff_data(q_R, q_Z, K_norm_min, cast(float, poloidal_flux), theta_m)
 
 
-def ray_evolution_2D_fun(tau, ray_parameters_2D, K_zeta, hamiltonian: Hamiltonian):
+def quick_K_cutoffs(
+    ray_parameters_turning_pts: Sequence[FloatArray],
+    K_zeta: FloatArray,
+    field: MagneticField,
+) -> K_cutoff_data:
+    r"""Vectorised version of `quick_K_cutoff` for a batch of rays
+
+    Parameters
+    ----------
+    ray_parameters_turning_pts : Sequence[FloatArray]
+        For each ray, the state vectors at its turning points, with
+        shape ``(n_turning_points, 4)``
+    K_zeta : FloatArray
+        :math:`K_\zeta` for each ray
+    field : MagneticField
+        Object describing the magnetic field
+
+    Returns
+    -------
+    K_cutoff_data
+        With an array of each quantity for the rays, which is NaN for
+        rays without any turning points
+
+    """
+    n_rays = len(ray_parameters_turning_pts)
+    counts = [len(turning_pts) for turning_pts in ray_parameters_turning_pts]
+    ray = np.repeat(np.arange(n_rays), counts)
+    q_R, q_Z, K_R, K_Z = np.reshape(
+        np.concatenate([np.reshape(y, (-1, 4)) for y in ray_parameters_turning_pts]),
+        (-1, 4),
+    ).T
+    K_norm = K_magnitude(K_R, K_zeta[ray], K_Z, q_R)
+
+    # The smallest |K| of each ray comes first among its turning points
+    order = np.lexsort((K_norm, ray))
+    first = order[np.unique(ray[order], return_index=True)[1]]
+    has_turning_pt = np.bincount(ray, minlength=n_rays) > 0
+
+    q_R, q_Z, K_R, K_Z, K_norm_min = (
+        value[first] for value in (q_R, q_Z, K_R, K_Z, K_norm)
+    )
+    field_at_cutoffs = field.evaluate(q_R, q_Z)
+    B = np.array([field_at_cutoffs[name] for name in ("B_R", "B_T", "B_Z")])
+    K = np.array([K_R, K_zeta[has_turning_pt] / q_R, K_Z])
+
+    sin_theta_m = np.sum(B * K, axis=0) / (K_norm_min * np.linalg.norm(B, axis=0))
+    # Assumes the mismatch angle is never smaller than -90deg or bigger than 90deg
+    theta_m = np.sign(sin_theta_m) * np.arcsin(abs(sin_theta_m))
+
+    poloidal_flux = field_at_cutoffs["polflux"]
+
+    def per_ray(value):
+        result = np.full(n_rays, np.nan)
+        result[has_turning_pt] = value
+        return result
+
+    return K_cutoff_data(
+        *(per_ray(value) for value in (q_R, q_Z, K_norm_min, poloidal_flux, theta_m))
+    )
+
+
+def ray_evolution_2D_fun(
+    tau,
+    ray_parameters_2D,
+    K_zeta,
+    hamiltonian: Hamiltonian,
+    cache: Optional[RayEvaluationCache] = None,
+):
     """
     Parameters
     ----------
@@ -365,6 +645,9 @@ def ray_evolution_2D_fun(tau, ray_parameters_2D, K_zeta, hamiltonian: Hamiltonia
         q_R, q_Z, K_R, K_Z
     hamiltonian:
         Hamiltonian object
+    cache:
+        If given, the derivatives of H are kept here for the events
+        of the solver
 
     Returns
     -------
@@ -382,8 +665,13 @@ def ray_evolution_2D_fun(tau, ray_parameters_2D, K_zeta, hamiltonian: Hamiltonia
     K_R = ray_parameters_2D[2]
     K_Z = ray_parameters_2D[3]
 
-    # Find derivatives of H
-    dH = hamiltonian.derivatives(q_R, q_Z, K_R, K_zeta, K_Z)
+    # Find derivatives of H. The ray doesn't need dH_dKzeta
+    if cache is None:
+        dH = hamiltonian.derivatives(
+            q_R, q_Z, K_R, K_zeta, K_Z, required=RAY_DERIVATIVES
+        )
+    else:
+        dH = cache.derivatives(ray_parameters_2D, K_zeta, hamiltonian)
 
     d_ray_parameters_2D_d_tau = np.zeros_like(ray_parameters_2D)
 
@@ -399,6 +687,116 @@ def ray_evolution_2D_fun(tau, ray_parameters_2D, K_zeta, hamiltonian: Hamiltonia
     return d_ray_parameters_2D_d_tau
 
 
+class RayEvolution:
+    """Right-hand side of the ray equations, equivalent to
+    `ray_evolution_2D_fun`, for a batch of rays in
+    `scotty.ensemble.solve_ensemble`, with ``index`` selecting their
+    frequencies, modes and ``K_zeta`` from those of the whole ensemble
+
+    Parameters
+    ----------
+    hamiltonian
+        The Hamiltonian of the rays
+    K_zeta
+        Toroidal wavevector of the rays, which is conserved
+
+    """
+
+    def __init__(self, hamiltonian: Hamiltonian, K_zeta: ArrayLike):
+        self.hamiltonian = hamiltonian
+        self.K_zeta = np.asfarray(K_zeta)
+
+    def __call__(
+        self, tau: ArrayLike, ray_parameters_2D: FloatArray, index: np.ndarray
+    ) -> FloatArray:
+        q_R, q_Z, K_R, K_Z = ray_parameters_2D
+        dH = self.hamiltonian.select(index).derivatives(
+            q_R, q_Z, K_R, self.K_zeta[index], K_Z, required=RAY_DERIVATIVES
+        )
+        return np.array([dH["dH_dKR"], dH["dH_dKZ"], -dH["dH_dR"], -dH["dH_dZ"]])
+
+
+def make_ensemble_solver_events(
+    poloidal_flux_enter: float,
+    launch_angular_frequency: FloatArray,
+    field: MagneticField,
+    K_zeta: FloatArray,
+    hamiltonian: Hamiltonian,
+) -> Dict[str, Callable]:
+    """Versions of the events from `make_solver_events` for a batch of
+    rays in `scotty.ensemble.solve_ensemble`, called as ``(tau,
+    ray_parameters_2D, index)`` for the rays in ``index``"""
+
+    data_R_coord_min = field.R_coord.min()
+    data_R_coord_max = field.R_coord.max()
+    data_Z_coord_min = field.Z_coord.min()
+    data_Z_coord_max = field.Z_coord.max()
+
+    @_event(terminal=True, direction=1.0)
+    def event_leave_plasma(tau, ray_parameters_2D, index):
+        q_R, q_Z, _, _ = ray_parameters_2D
+        return field.poloidal_flux(q_R, q_Z) - poloidal_flux_enter
+
+    @_event(terminal=False, direction=1.0)
+    def event_leave_LCFS(tau, ray_parameters_2D, index):
+        q_R, q_Z, _, _ = ray_parameters_2D
+        return field.poloidal_flux(q_R, q_Z) - 1.0
+
+    @_event(terminal=True, direction=-1.0)
+    def event_leave_simulation(tau, ray_parameters_2D, index):
+        q_R, q_Z, _, _ = ray_parameters_2D
+        return np.minimum.reduce(
+            [
+                q_R - data_R_coord_min,
+                data_R_coord_max - q_R,
+                q_Z - data_Z_coord_min,
+                data_Z_coord_max - q_Z,
+            ]
+        )
+
+    @_event(terminal=True, direction=0.0)
+    def event_cross_resonance(tau, ray_parameters_2D, index):
+        delta_gyro_freq = 0.01
+        q_R, q_Z, _, _ = ray_parameters_2D
+        B = field.evaluate(q_R, q_Z)
+        B_Total = np.sqrt(B["B_R"] ** 2 + B["B_T"] ** 2 + B["B_Z"] ** 2)
+        gyro_freq = find_normalised_gyro_freq(B_Total, launch_angular_frequency[index])
+        return (gyro_freq - 1.0 - delta_gyro_freq) * (gyro_freq - 1.0 + delta_gyro_freq)
+
+    @_event(terminal=False, direction=1.0)
+    def event_reach_K_min(tau, ray_parameters_2D, index):
+        q_R, q_Z, K_R, K_Z = ray_parameters_2D
+        K_zeta_index = K_zeta[index]
+        dH = hamiltonian.select(index).derivatives(
+            q_R, q_Z, K_R, K_zeta_index, K_Z, required=("dH_dR", "dH_dZ", "dH_dKR")
+        )
+        return -(1 / K_magnitude(K_R, K_zeta_index, K_Z, q_R)) * (
+            dH["dH_dR"] * K_R + dH["dH_dZ"] * K_Z + dH["dH_dKR"] * q_R
+        )
+
+    return {
+        "leave_plasma": event_leave_plasma,
+        "leave_LCFS": event_leave_LCFS,
+        "leave_simulation": event_leave_simulation,
+        "cross_resonance": event_cross_resonance,
+        "reach_K_min": event_reach_K_min,
+    }
+
+
+def check_solver_status(status: int):
+    """Raise an error if the solver stopped for any reason other than
+    one of its terminal events, such as leaving the plasma"""
+    if status == 0:
+        raise RuntimeError(
+            "Ray has not left plasma/simulation region. "
+            "Increase tau_max or choose different initial conditions."
+        )
+    if status == -1:
+        raise RuntimeError(
+            "Integration step failed. Check density interpolation is not negative"
+        )
+
+
 def propagate_ray(
     poloidal_flux_enter: float,
     launch_angular_frequency: float,
@@ -412,6 +810,9 @@ def propagate_ray(
     len_tau: int,
     tau_max: float = 1e5,
     verbose: bool = True,
+    warm_start: Optional[WarmStart] = None,
+    max_step: float = 50,
+    cutoff_from_events: bool = False,
 ) -> Union[Tuple[float, FloatArray], K_cutoff_data]:
     """Propagate a ray. Quickly finds tau at which the ray leaves the
     plasma, as well as estimates location of cut-off.
@@ -442,6 +843,18 @@ def propagate_ray(
         Maximum value of tau before the solver stops
     verbose : bool
         If true, print some timing information
+    warm_start : Optional[WarmStart]
+        What a neighbouring run found out about its ray. The ray
+        solver starts with its ``ray_first_step``, and it is then
+        updated in place with what this ray found
+    max_step : float
+        Largest step of the solver. Too large a step can skip over
+        the LCFS where the ray only grazes it
+    cutoff_from_events : bool
+        If true, take the cut-off from the ``"reach_K_min"`` events of
+        the ray solver instead of solving for the ray again with
+        `handle_no_resonance`, as for runs with a warm start (see
+        `ray_tau_points`)
 
     Returns
     -------
@@ -459,8 +872,9 @@ def propagate_ray(
     # values. We can then pass the keys to our event handler along
     # with the returned events, and use these names instead of list
     # indices
+    cache = RayEvaluationCache(field)
     solver_ray_events = make_solver_events(
-        poloidal_flux_enter, launch_angular_frequency, field
+        poloidal_flux_enter, launch_angular_frequency, field, cache
     )
 
     K_R_initial, K_zeta_initial, K_Z_initial = K_initial
@@ -478,7 +892,7 @@ def propagate_ray(
 
     solver_start_time = time()
     solver_ray_output = solve_ivp(
-        ray_evolution_2D_fun,
+        partial(ray_evolution_2D_fun, cache=cache),
         [0, tau_max],
         ray_parameters_2D_initial,
         method="RK45",
@@ -489,21 +903,14 @@ def propagate_ray(
         args=solver_arguments,
         rtol=rtol,
         atol=atol,
-        max_step=50,
+        max_step=max_step,
+        first_step=None if warm_start is None else warm_start.ray_first_step,
     )
     solver_end_time = time()
     if verbose:
         print("Time taken (ray solver)", solver_end_time - solver_start_time, "s")
 
-    if solver_ray_output.status == 0:
-        raise RuntimeError(
-            "Ray has not left plasma/simulation region. "
-            "Increase tau_max or choose different initial conditions."
-        )
-    if solver_ray_output.status == -1:
-        raise RuntimeError(
-            "Integration step failed. Check density interpolation is not negative"
-        )
+    check_solver_status(solver_ray_output.status)
 
     # tau_events is a list with the same order as the values of
     # solver_ray_events, so we can use the names from that dict
@@ -512,28 +919,219 @@ def propagate_ray(
     ray_parameters_2D_events = dict(
         zip(solver_ray_events.keys(), solver_ray_output.y_events)
     )
-    tau_leave = handle_leaving_plasma_events(
-        tau_events, ray_parameters_2D_events["leave_LCFS"]
-    )
-
     if quick_run:
         return quick_K_cutoff(
             ray_parameters_2D_events["reach_K_min"], K_zeta_initial, field
         )
 
-    # The beam solver outputs data at these values of tau
+    tau_leave, tau_points, tau_cutoff = ray_tau_points(
+        tau_events,
+        ray_parameters_2D_events,
+        K_zeta_initial,
+        len_tau,
+        lambda tau_leave: handle_no_resonance(
+            solver_ray_output.t,
+            solver_ray_output.y,
+            tau_leave,
+            K_zeta_initial,
+            solver_arguments,
+            solver_ray_events["leave_plasma"],
+        ),
+        cutoff_from_events=cutoff_from_events,
+    )
+
+    if warm_start is not None:
+        warm_start.ray_first_step = float(solver_ray_output.t[1])
+        warm_start.tau_cutoff = tau_cutoff
+
+    return tau_leave, tau_points
+
+
+# Positions of q_R, q_Z, K_R, K_Z in the beam parameters, see
+# `scotty.fun_evolution.pack_beam_parameters`
+RAY_INDICES = [0, 2, 3, 4]
+
+
+def make_beam_solver_events(
+    poloidal_flux_enter: float,
+    launch_angular_frequency: float,
+    field: MagneticField,
+    K_zeta: float,
+    hamiltonian: Hamiltonian,
+    localisation_tolerance: Optional[float] = None,
+) -> Dict[str, Callable]:
+    """Versions of the events from `make_solver_events` for the beam
+    solver, taking the 17 beam parameters instead of the 4 ray ones,
+    and any extra arguments to the beam evolution function. If
+    ``localisation_tolerance`` is given, this includes the
+    ``"localisation_converged"`` event from `make_localisation_event`"""
+
+    def beam_event(event: _Event) -> _Event:
+        @_event(terminal=event.terminal, direction=event.direction)
+        def wrapper(tau, beam_parameters, *args):
+            return event(tau, beam_parameters[RAY_INDICES], K_zeta, hamiltonian)
+
+        return wrapper
+
+    ray_events = make_solver_events(
+        poloidal_flux_enter, launch_angular_frequency, field
+    )
+    if localisation_tolerance is not None:
+        ray_events["localisation_converged"] = make_localisation_event(
+            localisation_tolerance
+        )
+    return {name: beam_event(event) for name, event in ray_events.items()}
+
+
+def propagate_beam(
+    poloidal_flux_enter: float,
+    launch_angular_frequency: float,
+    field: MagneticField,
+    beam_parameters_initial: FloatArray,
+    K_zeta: float,
+    hamiltonian: Hamiltonian,
+    evolution_fun: Callable,
+    evolution_args: tuple,
+    rtol: float,
+    atol: float,
+    len_tau: int,
+    tau_max: float = 1e5,
+    first_step: Optional[float] = None,
+    localisation_tolerance: Optional[float] = None,
+    max_step: float = 50,
+):
+    r"""Propagate the beam in a single pass, without tracing a ray
+    first.
+
+    The beam solver carries the same events as the ray solver in
+    `propagate_ray`, stopping when the beam leaves the plasma or
+    simulation, or crosses a resonance. The output points are the
+    same as those of the ray solver followed by the beam solver, but
+    are evaluated from the dense output of this single integration.
+    The cut-off, where :math:`|K|` is smallest, is located by the
+    root finding of the ``"reach_K_min"`` event, rather than by
+    another fine ray solve as in `handle_no_resonance`.
+
+    Parameters
+    ----------
+    poloidal_flux_enter : float
+        Flux label where the beam enters the plasma
+    launch_angular_frequency : float
+        Angular frequency of beam
+    field : MagneticField
+        Object describing magnetic field
+    beam_parameters_initial : FloatArray
+        Initial beam parameters, from
+        `scotty.fun_evolution.pack_beam_parameters`
+    K_zeta : float
+        Toroidal wavevector of the beam
+    hamiltonian : Hamiltonian
+        Object to compute Hamiltonian
+    evolution_fun : Callable
+        Right-hand side of the beam equations, such as
+        `scotty.fun_evolution.beam_evolution_fun`
+    evolution_args : tuple
+        Extra arguments to ``evolution_fun``
+    rtol : float
+        Relative tolerance
+    atol : float
+        Absolute tolerance
+    len_tau : int
+        Number of points for tau
+    tau_max : float
+        Maximum value of tau before the solver stops
+    first_step : Optional[float]
+        Initial step of the solver, estimated if ``None``
+    localisation_tolerance : Optional[float]
+        If given, also stop once the localisation has converged past
+        the cut-off, see `make_localisation_event`
+    max_step : float
+        Largest step of the solver, as in `propagate_ray`
+
+    Returns
+    -------
+    scipy.integrate.OdeResult
+        The output of `scipy.integrate.solve_ivp`, with ``t`` and ``y``
+        replaced by the output points inside the plasma and the beam
+        parameters at them, and with the additional ``tau_leave``
+
+    """
+    solver_beam_events = make_beam_solver_events(
+        poloidal_flux_enter,
+        launch_angular_frequency,
+        field,
+        K_zeta,
+        hamiltonian,
+        localisation_tolerance,
+    )
+
+    solver_beam_output = solve_ivp(
+        evolution_fun,
+        [0, tau_max],
+        beam_parameters_initial,
+        method="RK45",
+        t_eval=None,
+        dense_output=True,
+        events=solver_beam_events.values(),
+        vectorized=False,
+        args=evolution_args,
+        rtol=rtol,
+        atol=atol,
+        max_step=max_step,
+        first_step=first_step,
+    )
+    check_solver_status(solver_beam_output.status)
+
+    tau_events = dict(zip(solver_beam_events.keys(), solver_beam_output.t_events))
+    # Events that didn't occur have empty, one-dimensional y_events
+    beam_parameters_events = {
+        name: np.reshape(y_events, (-1, len(beam_parameters_initial)))
+        for name, y_events in zip(
+            solver_beam_events.keys(), solver_beam_output.y_events
+        )
+    }
+    tau_converged = tau_events.get("localisation_converged", [])
+    left_plasma = any(
+        len(tau_events[event]) != 0
+        for event in ("leave_plasma", "leave_LCFS", "cross_resonance")
+    )
+    if len(tau_converged) != 0 and not left_plasma:
+        # Stopped early, before any of the events for leaving the plasma
+        tau_leave = tau_converged[0]
+    else:
+        tau_leave = handle_leaving_plasma_events(
+            tau_events, beam_parameters_events["leave_LCFS"][:, RAY_INDICES]
+        )
+        if len(tau_converged) != 0:
+            tau_leave = min(tau_leave, tau_converged[0])
+
     # Don't include `tau_leave` itself so that last point is inside
     # the plasma
     tau_points = np.linspace(0, tau_leave, len_tau - 1, endpoint=False)
 
     if len(tau_events["cross_resonance"]) == 0:
-        tau_points = handle_no_resonance(
-            solver_ray_output,
-            tau_leave,
-            tau_points,
-            K_zeta_initial,
-            solver_arguments,
-            solver_ray_events["leave_plasma"],
+        # Take the deepest turning point of |K| inside the plasma, or
+        # failing that, the smallest |K| of the solver steps
+        tau_K_min = tau_events["reach_K_min"]
+        beam_parameters_K_min = beam_parameters_events["reach_K_min"]
+        inside = tau_K_min < tau_leave
+        if np.any(inside):
+            tau_K_min = tau_K_min[inside]
+            beam_parameters_K_min = beam_parameters_K_min[inside].T
+        else:
+            inside = solver_beam_output.t < tau_leave
+            tau_K_min = solver_beam_output.t[inside]
+            beam_parameters_K_min = solver_beam_output.y[:, inside]
+        K_magnitude_K_min = K_magnitude(
+            K_R=beam_parameters_K_min[3],
+            K_zeta=K_zeta,
+            K_Z=beam_parameters_K_min[4],
+            q_R=beam_parameters_K_min[0],
         )
+        tau_cutoff = tau_K_min[np.argmin(K_magnitude_K_min)]
+        tau_points = np.sort(np.append(tau_points, tau_cutoff))
 
-    return tau_leave, tau_points
+    solver_beam_output.t = tau_points
+    solver_beam_output.y = solver_beam_output.sol(tau_points)
+    solver_beam_output.tau_leave = tau_leave
+    return solver_beam_output
@@ -0,0 +1,200 @@
+"""Integration of the beam equations where they become stiff.
+
+Near the cut-off and cyclotron resonances, the explicit RK45 solver
+used by `scotty.beam_me_up.beam_me_up` can be forced to take very small
+steps, and the number of evaluations of the beam equations grows
+accordingly. The implicit methods of `scipy.integrate.solve_ivp`
+(``"Radau"``, ``"BDF"``, and ``"LSODA"``, which switches between
+Adams and BDF methods itself) can use much larger steps there, given
+the Jacobian from `scotty.fun_evolution.BeamEvolution.jacobian`.
+
+`solve_switching` starts with RK45, which is cheaper while the beam
+equations are not stiff, and hands over to one of the implicit methods
+once the step size shows that they have become stiff.
+
+"""
+
+# Copyright 2023, Valerian Hall-Chen and Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+from scipy.integrate import BDF, LSODA, RK45, OdeSolution, Radau
+from scipy.integrate._ivp.ivp import OdeResult
+
+from scotty.typing import ArrayLike
+
+
+STIFF_METHODS = {"Radau": Radau, "BDF": BDF, "LSODA": LSODA}
+"""Implicit methods of `scipy.integrate.solve_ivp` for stiff beams"""
+
+NONSTIFF_STEPS = 6
+"""Number of consecutive steps within the stability region of RK45
+which reset the count of steps limited by stability"""
+
+
+def solve_switching(
+    fun: Callable,
+    t_span: Sequence[float],
+    y0: ArrayLike,
+    t_eval: Optional[ArrayLike] = None,
+    jac: Optional[Callable] = None,
+    args: tuple = (),
+    rtol: float = 1e-3,
+    atol: float = 1e-6,
+    stiff_method: str = "Radau",
+    stability_limit: float = 3.25,
+    stiff_steps: int = 15,
+    dense_output: bool = False,
+) -> OdeResult:
+    r"""Integrate with RK45, switching to ``stiff_method`` if the
+    problem becomes stiff.
+
+    RK45 detects stiffness when its step size is limited by stability
+    rather than by accuracy, using the test of Hairer and Wanner
+    (*Solving Ordinary Differential Equations II*, section IV.2): the
+    largest eigenvalue of the Jacobian is estimated from the last two
+    stages of each step, which are both at the end of the step, as
+
+    .. math::
+
+        \rho = \frac{\|k_7 - k_6\|}{\|y_7 - y_6\|}
+
+    and the problem is considered stiff once ``stiff_steps`` steps,
+    without `NONSTIFF_STEPS` consecutive steps in between, have
+    :math:`h \rho` larger than ``stability_limit``, roughly where the
+    stability region of RK45 crosses the negative real axis. From then
+    on, the integration carries on from the current point with
+    ``stiff_method``.
+
+    Parameters
+    ----------
+    fun
+        Right-hand side, called as ``fun(t, y, *args)``
+    t_span
+        Interval of integration
+    y0
+        Initial state
+    t_eval
+        Times at which to output the solution. If ``None``, the
+        solution is output at the end of every step
+    jac
+        Jacobian of ``fun``, called as ``jac(t, y, *args)``. If
+        ``None``, ``stiff_method`` estimates it by finite differences
+    args
+        Extra arguments to ``fun`` and ``jac``
+    rtol, atol
+        Relative and absolute tolerances
+    stiff_method
+        One of `STIFF_METHODS`
+    stability_limit
+        Value of :math:`h \rho` above which a step counts as limited
+        by stability
+    stiff_steps
+        Number of steps limited by stability before switching
+    dense_output
+        If ``True``, include the continuous solution as ``sol``
+
+    Returns
+    -------
+    scipy.integrate.OdeResult
+        As returned by `scipy.integrate.solve_ivp`, with the
+        additional ``t_switch``, the time of the switch to
+        ``stiff_method``, or ``None`` if the problem was never stiff
+
+    """
+    if stiff_method not in STIFF_METHODS:
+        raise ValueError(
+            f"Unknown stiff_method '{stiff_method}'. "
+            f"Expected one of {tuple(STIFF_METHODS)}"
+        )
+
+    def fun_with_args(t, y):
+        return fun(t, y, *args)
+
+    jac_with_args = None
+    if jac is not None:
+
+        def jac_with_args(t, y):
+            return jac(t, y, *args)
+
+    t0, t_bound = t_span
+    solver = RK45(fun_with_args, t0, y0, t_bound, rtol=rtol, atol=atol)
+
+    ts = [t0]
+    ys = [np.asfarray(y0)]
+    interpolants = []
+    nfev = njev = nlu = 0
+    t_switch = None
+    stiff_count = nonstiff_count = 0
+    # Weights of the stages in the solution, relative to the last stage
+    last_stage_weights = solver.B - np.append(solver.A[-1], 0.0)
+
+    while solver.status == "running":
+        message = solver.step()
+        if solver.status == "failed":
+            break
+        ts.append(solver.t)
+        ys.append(solver.y)
+        interpolants.append(solver.dense_output())
+
+        if t_switch is not None or solver.status != "running":
+            continue
+        step = abs(solver.t - solver.t_old)
+        stage_difference = np.linalg.norm(solver.K[-1] - solver.K[-2])
+        # Divided by the step size, which cancels in h * rho
+        solution_difference = np.linalg.norm(last_stage_weights @ solver.K[:-1])
+        # Occasional steps within the stability region are allowed
+        if stage_difference > stability_limit * solution_difference:
+            stiff_count += 1
+            nonstiff_count = 0
+        else:
+            nonstiff_count += 1
+            if nonstiff_count >= NONSTIFF_STEPS:
+                stiff_count = 0
+        if stiff_count >= stiff_steps:
+            t_switch = solver.t
+            nfev += solver.nfev
+            solver = STIFF_METHODS[stiff_method](
+                fun_with_args,
+                solver.t,
+                solver.y,
+                t_bound,
+                rtol=rtol,
+                atol=atol,
+                jac=jac_with_args,
+                first_step=step,
+            )
+
+    nfev += solver.nfev
+    njev += solver.njev
+    nlu += solver.nlu
+    status = {"finished": 0, "failed": -1}[solver.status]
+    if status == 0:
+        message = "The solver successfully reached the end of the integration interval."
+
+    ts_array = np.array(ts)
+    sol = OdeSolution(ts_array, interpolants) if len(interpolants) else None
+    if t_eval is None:
+        t = ts_array
+        y = np.array(ys).T
+    else:
+        t = np.asfarray(t_eval)
+        t = t[(t >= ts_array[0]) & (t <= ts_array[-1])]
+        y = sol(t) if sol is not None else np.empty((len(ys[0]), 0))
+
+    return OdeResult(
+        t=t,
+        y=y,
+        sol=sol if dense_output else None,
+        t_events=None,
+        y_events=None,
+        nfev=nfev,
+        njev=njev,
+        nlu=nlu,
+        status=status,
+        message=message,
+        success=status >= 0,
+        t_switch=t_switch,
+    )
@@ -0,0 +1,399 @@
+"""Precomputed tables of the cut-off over launch parameters.
+
+Even a quick run of `scotty.beam_me_up.beam_me_up` takes a noticeable
+time, which is too slow for choosing mirror angles between shots. A
+`CutoffSurrogate` is built once for an equilibrium and density profile,
+from `scotty.beam_me_up.scan_cutoffs` over a grid of poloidal and
+toroidal launch angles and frequencies. After that, it interpolates the
+cut-off location, :math:`|K|` and mismatch angle there for any launch
+within the grid, along with an estimate of the interpolation error:
+
+>>> surrogate = load_or_build_surrogate(
+...     "cutoffs.npz",
+...     poloidal_angles=np.linspace(-10, 10, 41),
+...     toroidal_angles=np.linspace(-5, 5, 11),
+...     frequencies=np.linspace(40, 70, 31),
+...     mode_flag=-1,
+...     launch_position=launch_position,
+...     field=field,
+...     density_fit=density_fit,
+... )
+>>> cutoff = surrogate(4.0, 0.0, 50.0)
+>>> error = surrogate.error_estimate(4.0, 0.0, 50.0)
+
+Each table records a `fingerprint` of the equilibrium and density it
+was built for, and a hash of the solver settings, and
+`load_or_build_surrogate` builds a new one if any of these have changed
+since.
+
+"""
+
+# Copyright 2023, Valerian Hall-Chen and Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+import hashlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from scotty.beam_me_up import scan_cutoffs
+from scotty.density_fit import DensityFitLike
+from scotty.geometry import MagneticField
+from scotty.ray_solver import K_cutoff_data
+from scotty.typing import ArrayLike, FloatArray, PathLike
+
+
+SURROGATE_QUANTITIES = ("q_R", "q_Z", "K_norm_min", "poloidal_flux", "theta_m")
+"""Fields of `scotty.ray_solver.K_cutoff_data` kept in a `CutoffSurrogate`"""
+
+_CORNERS = np.array(list(np.ndindex(2, 2, 2)))
+"""Offsets of the corners of a grid cell"""
+
+
+def fingerprint(
+    field: MagneticField,
+    density_fit: DensityFitLike,
+    poloidal_flux_enter: float = 1.0,
+    n_samples: int = 33,
+) -> str:
+    """Hash of the poloidal flux and magnetic field on a grid over the
+    simulation region, and of the density inside the plasma, which
+    changes whenever the equilibrium or density profile does
+
+    Parameters
+    ----------
+    field
+        Object describing the magnetic field
+    density_fit
+        Density as a function of poloidal flux
+    poloidal_flux_enter
+        Poloidal flux label of the plasma boundary
+    n_samples
+        Number of samples along each direction
+
+    """
+    R = np.linspace(field.R_coord.min(), field.R_coord.max(), n_samples)
+    Z = np.linspace(field.Z_coord.min(), field.Z_coord.max(), n_samples)
+    q_R, q_Z = np.meshgrid(R, Z, indexing="ij")
+    poloidal_flux = np.linspace(0, poloidal_flux_enter, n_samples)
+    # Analytical fields may not be defined exactly on the axis
+    with np.errstate(divide="ignore", invalid="ignore"):
+        samples = [
+            R,
+            Z,
+            *field.evaluate(q_R, q_Z).values(),
+            density_fit(poloidal_flux),
+        ]
+    digest = hashlib.sha256()
+    for sample in samples:
+        # Rounded, so that the same profile gives the same hash
+        # regardless of how it was evaluated
+        digest.update(np.asfarray(sample).round(10).tobytes())
+    return digest.hexdigest()
+
+
+def solver_settings(**kwargs) -> str:
+    """Hash of the keyword arguments passed on to
+    `scotty.beam_me_up.scan_cutoffs`, such as tolerances and step
+    sizes, which also change the table"""
+    digest = hashlib.sha256()
+    for name, value in sorted(kwargs.items()):
+        value = np.asarray(value).tolist() if isinstance(value, np.ndarray) else value
+        digest.update(f"{name}={value!r};".encode())
+    return digest.hexdigest()
+
+
+class CutoffSurrogate:
+    """Multilinear interpolation of the cut-off over a regular grid of
+    launch parameters, with the same mode and launch position
+
+    Parameters
+    ----------
+    poloidal_angles, toroidal_angles, frequencies
+        Increasing grid of launch parameters, in degrees (TORBEAM
+        convention) and GHz
+    table
+        Each of `SURROGATE_QUANTITIES` on the grid, NaN where the ray
+        missed the plasma or didn't reach a cut-off
+    mode_flag
+        Mode of the rays
+    launch_position
+        Position of the antenna in cylindrical coordinates
+    fingerprint
+        `fingerprint` of the equilibrium and density profile
+    settings
+        `solver_settings` of the other arguments the table was built
+        with
+
+    """
+
+    def __init__(
+        self,
+        poloidal_angles: ArrayLike,
+        toroidal_angles: ArrayLike,
+        frequencies: ArrayLike,
+        table: Dict[str, FloatArray],
+        mode_flag: int,
+        launch_position: ArrayLike,
+        fingerprint: str,
+        settings: str = "",
+    ):
+        self.axes = tuple(
+            np.asfarray(axis)
+            for axis in (poloidal_angles, toroidal_angles, frequencies)
+        )
+        for axis in self.axes:
+            if axis.ndim != 1 or np.any(np.diff(axis) <= 0):
+                raise ValueError("Grid of launch parameters must be increasing")
+        self.table = {name: np.asfarray(table[name]) for name in SURROGATE_QUANTITIES}
+        # All the quantities at each grid point together, so each
+        # corner of a cell is a single lookup
+        self._stacked = np.stack(list(self.table.values()), axis=-1)
+        self._last_index = np.array([len(axis) - 1 for axis in self.axes])
+        self.mode_flag = int(mode_flag)
+        self.launch_position = np.asfarray(launch_position)
+        self.fingerprint = fingerprint
+        self.settings = settings
+        self._errors = {
+            name: self._cell_errors(values) for name, values in self.table.items()
+        }
+
+    @classmethod
+    def build(
+        cls,
+        poloidal_angles: ArrayLike,
+        toroidal_angles: ArrayLike,
+        frequencies: ArrayLike,
+        mode_flag: int,
+        launch_position: ArrayLike,
+        field: MagneticField,
+        density_fit: DensityFitLike,
+        poloidal_flux_enter: float = 1.0,
+        **kwargs,
+    ) -> "CutoffSurrogate":
+        """Build the table with `scotty.beam_me_up.scan_cutoffs`, which
+        takes any other keyword arguments"""
+        poloidal_angles, toroidal_angles, frequencies = (
+            np.asfarray(axis)
+            for axis in (poloidal_angles, toroidal_angles, frequencies)
+        )
+        cutoffs = scan_cutoffs(
+            poloidal_angles[:, np.newaxis, np.newaxis],
+            toroidal_angles[np.newaxis, :, np.newaxis],
+            frequencies,
+            mode_flag,
+            launch_position,
+            find_B_method=field,
+            density_fit_method=density_fit,
+            poloidal_flux_enter=poloidal_flux_enter,
+            **kwargs,
+        )
+        return cls(
+            poloidal_angles,
+            toroidal_angles,
+            frequencies,
+            {name: getattr(cutoffs, name) for name in SURROGATE_QUANTITIES},
+            mode_flag,
+            launch_position,
+            fingerprint(field, density_fit, poloidal_flux_enter),
+            solver_settings(**kwargs),
+        )
+
+    def _cell_errors(self, values: FloatArray) -> FloatArray:
+        r"""Estimate of the interpolation error in each cell of the grid.
+
+        Linear interpolation over a spacing :math:`h` has an error of
+        up to :math:`h^2 |f''| / 8`, and :math:`h^2 f''` is estimated
+        from the second differences of the table at the corners of
+        each cell, summed over the axes. Axes with fewer than three
+        points don't contribute
+
+        """
+        cells = tuple(max(len(axis) - 1, 1) for axis in self.axes)
+        errors = np.zeros(cells)
+        for dimension, axis in enumerate(self.axes):
+            if len(axis) < 3:
+                continue
+            spacing = np.diff(axis)
+            slope = np.diff(values, axis=dimension) / _along(spacing, dimension)
+            second_derivative = np.diff(slope, axis=dimension) / _along(
+                0.5 * (spacing[1:] + spacing[:-1]), dimension
+            )
+            # The end points take the value of their neighbour
+            curvature = np.abs(
+                np.take(
+                    second_derivative,
+                    np.clip(np.arange(len(axis)) - 1, 0, len(axis) - 3),
+                    axis=dimension,
+                )
+            )
+            # Largest over the corners of each cell
+            for corner_axis, size in enumerate(values.shape):
+                if size > 1:
+                    curvature = np.fmax(
+                        np.take(curvature, range(size - 1), axis=corner_axis),
+                        np.take(curvature, range(1, size), axis=corner_axis),
+                    )
+            errors = errors + curvature * _along(spacing, dimension) ** 2 / 8
+        return errors
+
+    def _locate(
+        self, poloidal_angle: ArrayLike, toroidal_angle: ArrayLike, frequency: ArrayLike
+    ) -> Tuple[Tuple[np.ndarray, ...], Tuple[FloatArray, ...], Tuple[int, ...]]:
+        """Cell of the grid containing each point, the fractional
+        position within it along each axis, and the broadcast shape"""
+        points = np.broadcast_arrays(poloidal_angle, toroidal_angle, frequency)
+        shape = points[0].shape
+        cells = []
+        fractions = []
+        for axis, point in zip(self.axes, points):
+            point = np.ravel(np.asfarray(point))
+            if np.any((point < axis[0]) | (point > axis[-1])):
+                raise ValueError(
+                    f"Launch parameters outside of the grid [{axis[0]}, {axis[-1]}]"
+                )
+            if len(axis) == 1:
+                cells.append(np.zeros(point.shape, dtype=int))
+                fractions.append(np.zeros(point.shape))
+                continue
+            cell = np.clip(
+                np.searchsorted(axis, point, side="right") - 1, 0, len(axis) - 2
+            )
+            cells.append(cell)
+            fractions.append((point - axis[cell]) / (axis[cell + 1] - axis[cell]))
+        return tuple(cells), tuple(fractions), shape
+
+    def __call__(
+        self, poloidal_angle: ArrayLike, toroidal_angle: ArrayLike, frequency: ArrayLike
+    ) -> K_cutoff_data:
+        """The cut-off of rays launched with the given angles (degrees)
+        and frequency (GHz), which are broadcast against each other"""
+        cells, fractions, shape = self._locate(
+            poloidal_angle, toroidal_angle, frequency
+        )
+        cells = np.stack(cells, axis=-1)[:, np.newaxis, :]
+        fractions = np.stack(fractions, axis=-1)[:, np.newaxis, :]
+        weights = np.where(_CORNERS, fractions, 1 - fractions).prod(axis=-1)
+        # Single points have zero weight on the far corner
+        corners = np.minimum(cells + _CORNERS, self._last_index)
+        value = np.einsum(
+            "nc,ncq->nq", weights, self._stacked[tuple(np.moveaxis(corners, -1, 0))]
+        )
+        return K_cutoff_data(*np.reshape(value.T, (-1, *shape)))
+
+    def error_estimate(
+        self, poloidal_angle: ArrayLike, toroidal_angle: ArrayLike, frequency: ArrayLike
+    ) -> K_cutoff_data:
+        """Estimate of the interpolation error of `__call__` at the same
+        launch parameters, see `_cell_errors`"""
+        cells, _, shape = self._locate(poloidal_angle, toroidal_angle, frequency)
+        return K_cutoff_data(
+            **{
+                name: errors[cells].reshape(shape)
+                for name, errors in self._errors.items()
+            }
+        )
+
+    def matches(
+        self,
+        field: MagneticField,
+        density_fit: DensityFitLike,
+        poloidal_flux_enter: float = 1.0,
+        **kwargs,
+    ) -> bool:
+        """True if this table was built for the same equilibrium and
+        density profile, and with the same other arguments to
+        `scotty.beam_me_up.scan_cutoffs`"""
+        return self.fingerprint == fingerprint(
+            field, density_fit, poloidal_flux_enter
+        ) and self.settings == solver_settings(**kwargs)
+
+    def save(self, filename: PathLike):
+        """Save the table to an ``npz`` file"""
+        np.savez(
+            filename,
+            poloidal_angles=self.axes[0],
+            toroidal_angles=self.axes[1],
+            frequencies=self.axes[2],
+            mode_flag=self.mode_flag,
+            launch_position=self.launch_position,
+            fingerprint=self.fingerprint,
+            settings=self.settings,
+            **self.table,
+        )
+
+    @classmethod
+    def load(cls, filename: PathLike) -> "CutoffSurrogate":
+        """Load a table saved with `save`"""
+        with np.load(filename) as f:
+            return cls(
+                f["poloidal_angles"],
+                f["toroidal_angles"],
+                f["frequencies"],
+                {name: f[name] for name in SURROGATE_QUANTITIES},
+                int(f["mode_flag"]),
+                f["launch_position"],
+                str(f["fingerprint"]),
+                # Tables saved without their settings are always rebuilt
+                str(f["settings"]) if "settings" in f else "",
+            )
+
+
+def _along(values: FloatArray, dimension: int) -> FloatArray:
+    """Reshape ``values`` to broadcast along ``dimension`` of the
+    (poloidal angle, toroidal angle, frequency) grid"""
+    shape = [1] * 3
+    shape[dimension] = -1
+    return np.reshape(values, shape)
+
+
+def load_or_build_surrogate(
+    filename: PathLike,
+    poloidal_angles: ArrayLike,
+    toroidal_angles: ArrayLike,
+    frequencies: ArrayLike,
+    mode_flag: int,
+    launch_position: ArrayLike,
+    field: MagneticField,
+    density_fit: DensityFitLike,
+    poloidal_flux_enter: float = 1.0,
+    verbose: bool = True,
+    **kwargs,
+) -> CutoffSurrogate:
+    """Load the table in ``filename``, unless it doesn't exist or was
+    built for a different grid, mode, launch position, equilibrium,
+    density profile or other arguments, in which case build a new one with
+    `CutoffSurrogate.build` and save it there instead. If ``verbose``,
+    say when a new table is being built"""
+    surrogate: Optional[CutoffSurrogate] = None
+    try:
+        surrogate = CutoffSurrogate.load(filename)
+    except FileNotFoundError:
+        pass
+
+    grid = (poloidal_angles, toroidal_angles, frequencies)
+    if (
+        surrogate is not None
+        and all(
+            np.shape(axis) == np.shape(expected) and np.allclose(axis, expected)
+            for axis, expected in zip(surrogate.axes, grid)
+        )
+        and surrogate.mode_flag == mode_flag
+        and np.allclose(surrogate.launch_position, launch_position)
+        and surrogate.matches(field, density_fit, poloidal_flux_enter, **kwargs)
+    ):
+        return surrogate
+
+    if verbose:
+        print("Building cut-off surrogate")
+    surrogate = CutoffSurrogate.build(
+        *grid,
+        mode_flag,
+        launch_position,
+        field,
+        density_fit,
+        poloidal_flux_enter,
+        **kwargs,
+    )
+    surrogate.save(filename)
+    return surrogate
@@ -0,0 +1,119 @@
+"""Continuation between neighbouring runs of a parameter sweep.
+
+Sweeps over launch angles and frequencies run
+`scotty.beam_me_up.beam_me_up` many times, for beams which only differ
+slightly from one run to the next. Each run returns a `WarmStart`,
+with what its solvers found out about the beam, and passing that to
+the next, neighbouring, run lets it skip some of the same work:
+
+>>> continuation = SweepContinuation(scales=[1.0, 1.0, 5.0])
+>>> for poloidal_angle, toroidal_angle, frequency in points:
+...     point = (poloidal_angle, toroidal_angle, frequency)
+...     warm_start = beam_me_up(
+...         poloidal_angle,
+...         toroidal_angle,
+...         frequency,
+...         ...,
+...         warm_start=continuation.nearest(point),
+...     )
+...     continuation.add(point, warm_start)
+
+"""
+
+# Copyright 2023, Valerian Hall-Chen and Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from scotty.typing import ArrayLike
+
+
+@dataclass
+class WarmStart:
+    """What the solvers of one run of `scotty.beam_me_up.beam_me_up`
+    found out about the beam, to start a neighbouring run with.
+    Anything unknown is ``None``.
+
+    Attributes
+    ----------
+    ray_first_step
+        First step of the ray solver, used as its ``first_step``
+        instead of estimating one
+    beam_first_step
+        First step of the beam solver, used in the same way
+    tau_cutoff
+        Where the ray reached the cut-off, if it doesn't reach a
+        resonance. Runs with a warm start take their cut-off from the
+        events of the ray solver, instead of solving for the ray again
+        near the cut-off (see `scotty.ray_solver.propagate_ray`)
+
+    """
+
+    ray_first_step: Optional[float] = None
+    beam_first_step: Optional[float] = None
+    tau_cutoff: Optional[float] = None
+
+
+class FirstStep:
+    """Event for `scipy.integrate.solve_ivp` which never triggers, but
+    records the first step of the solver. The events are evaluated at
+    the start and after every step, whatever the ``t_eval``, so this
+    doesn't need the dense output
+
+    """
+
+    terminal = False
+    direction = 0.0
+
+    def __init__(self):
+        self.tau: List[float] = []
+
+    def __call__(self, tau: float, *args) -> float:
+        if len(self.tau) < 2:
+            self.tau.append(tau)
+        return 1.0
+
+    @property
+    def step(self) -> Optional[float]:
+        """The first step, if the solver took one"""
+        return self.tau[1] - self.tau[0] if len(self.tau) == 2 else None
+
+
+class SweepContinuation:
+    """The `WarmStart` of every run so far in a sweep, to start new
+    runs from their nearest neighbour
+
+    Parameters
+    ----------
+    scales
+        Typical spacing of the sweep in each parameter, so that
+        distances between points with different units can be compared.
+        Defaults to one for every parameter
+
+    """
+
+    def __init__(self, scales: Optional[ArrayLike] = None):
+        self.scales = None if scales is None else np.asfarray(scales)
+        self._points: List[np.ndarray] = []
+        self._warm_starts: List[WarmStart] = []
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def add(self, point: Sequence[float], warm_start: WarmStart):
+        """Record the `WarmStart` of the run at ``point``"""
+        self._points.append(np.asfarray(point))
+        self._warm_starts.append(warm_start)
+
+    def nearest(self, point: Sequence[float]) -> Optional[WarmStart]:
+        """The `WarmStart` of the run nearest to ``point``, or ``None``
+        if there have been no runs yet"""
+        if not self._points:
+            return None
+        distance = np.asfarray(self._points) - np.asfarray(point)
+        if self.scales is not None:
+            distance = distance / self.scales
+        return self._warm_starts[int(np.argmin(np.linalg.norm(distance, axis=1)))]
@@ -249,14 +249,16 @@ def write_torbeam_file(
         buffer_factor,
     )
     x_meshgrid, z_meshgrid = np.meshgrid(field.R_coord, field.Z_coord, indexing="ij")
-    B_t = field.B_T(x_meshgrid, z_meshgrid)
-    B_r = field.B_R(x_meshgrid, z_meshgrid)
-    B_z = field.B_Z(x_meshgrid, z_meshgrid)
-    psi = field.poloidal_flux(x_meshgrid, z_meshgrid)
-
-    Torbeam(field.R_coord, field.Z_coord, B_r, B_t, B_z, psi).write(
-        torbeam_directory_path / "topfile"
-    )
+    grids = field.evaluate(x_meshgrid, z_meshgrid)
+
+    Torbeam(
+        field.R_coord,
+        field.Z_coord,
+        grids["B_R"],
+        grids["B_T"],
+        grids["B_Z"],
+        grids["polflux"],
+    ).write(torbeam_directory_path / "topfile")
 
 
 def main(
@@ -0,0 +1,347 @@
+"""Continuous representation of the solution of the beam equations
+
+The beam solver only outputs the beam at the ``tau`` points chosen
+before the solve. `BeamTrajectory` keeps the interpolating polynomials
+of every step of the solver instead, so that the beam can be
+resampled afterwards at any ``tau``, arc length, or poloidal flux,
+without integrating the beam equations again.
+
+"""
+
+# Copyright 2023, Valerian Hall-Chen and Scotty contributors
+# SPDX-License-Identifier: GPL-3.0
+
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.integrate import OdeSolution, cumulative_trapezoid
+from scipy.optimize import brentq
+
+from scotty.fun_evolution import unpack_beam_parameters
+from scotty.fun_general import K_magnitude
+from scotty.geometry import MagneticField
+from scotty.typing import ArrayLike, FloatArray, PathLike
+
+
+# Nodes and weights for integrating the arc length over each step
+_GAUSS_NODES, _GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(8)
+_GAUSS_NODES = 0.5 * (_GAUSS_NODES + 1)
+_GAUSS_WEIGHTS = 0.5 * _GAUSS_WEIGHTS
+
+# Power law of the turbulence spectrum, as used in the localisation
+SPECTRUM_POWER_LAW_COEFFICIENT = 13 / 3
+
+
+class BeamTrajectory:
+    r"""Dense output of the beam solver, from which the beam can be
+    evaluated at any ``tau`` between the start of the beam and
+    ``tau_end``.
+
+    Each step of the solver from ``tau_old`` to ``tau_old + h``
+    contributes a polynomial in :math:`x = (\tau - \tau_{old}) / h`:
+
+    .. math::
+
+        y(\tau) = y_{old} + h \sum_j Q_j x^{j + 1}
+
+    which is the interpolant used by the ``"RK45"`` and ``"RK23"``
+    methods of `scipy.integrate.solve_ivp`.
+
+    Parameters
+    ----------
+    tau_old
+        Start of each step
+    h
+        Size of each step
+    beam_parameters_old
+        Beam parameters at the start of each step, shape ``(n_steps, 17)``
+    coefficients
+        Polynomial coefficients of each step, shape ``(n_steps, 17, order)``
+    K_zeta
+        Toroidal wavevector of the beam
+    tau_end
+        End of the valid part of the trajectory, for example where the
+        beam leaves the plasma. Defaults to the end of the last step
+
+    """
+
+    def __init__(
+        self,
+        tau_old: FloatArray,
+        h: FloatArray,
+        beam_parameters_old: FloatArray,
+        coefficients: FloatArray,
+        K_zeta: float,
+        tau_end: Optional[float] = None,
+    ):
+        self.tau_old = np.asfarray(tau_old)
+        self.h = np.asfarray(h)
+        self.beam_parameters_old = np.asfarray(beam_parameters_old)
+        self.coefficients = np.asfarray(coefficients)
+        self.K_zeta = float(K_zeta)
+        self.tau_start = float(self.tau_old[0])
+        self.tau_end = (
+            float(self.tau_old[-1] + self.h[-1]) if tau_end is None else float(tau_end)
+        )
+        self._arc_length_steps: Optional[FloatArray] = None
+
+    @classmethod
+    def from_ode_solution(
+        cls, solution: OdeSolution, K_zeta: float, tau_end: Optional[float] = None
+    ) -> "BeamTrajectory":
+        """Create from the ``sol`` of `scipy.integrate.solve_ivp`, called
+        with ``dense_output=True`` and ``method="RK45"`` (or ``"RK23"``)"""
+        interpolants = solution.interpolants
+        if not all(hasattr(interpolant, "Q") for interpolant in interpolants):
+            raise ValueError(
+                "BeamTrajectory needs the dense output of the 'RK45' or 'RK23' methods"
+            )
+        return cls(
+            [interpolant.t_old for interpolant in interpolants],
+            [interpolant.h for interpolant in interpolants],
+            [interpolant.y_old for interpolant in interpolants],
+            [interpolant.Q for interpolant in interpolants],
+            K_zeta,
+            tau_end,
+        )
+
+    def _steps(self, tau: FloatArray):
+        """Index of the step containing each ``tau``, and the position
+        within it"""
+        step = np.searchsorted(self.tau_old, tau, side="right") - 1
+        step = np.clip(step, 0, len(self.tau_old) - 1)
+        x = (tau - self.tau_old[step]) / self.h[step]
+        return step, x
+
+    def __call__(self, tau: ArrayLike) -> FloatArray:
+        """Beam parameters (see `scotty.fun_evolution.pack_beam_parameters`)
+        at ``tau``, with shape ``(17,) + np.shape(tau)``"""
+        tau = np.asfarray(tau)
+        step, x = self._steps(tau.ravel())
+        powers = np.cumprod(
+            np.repeat(x[:, np.newaxis], self.coefficients.shape[2], axis=1), axis=1
+        )
+        beam_parameters = self.beam_parameters_old[step] + self.h[step, np.newaxis] * (
+            np.einsum("nij,nj->ni", self.coefficients[step], powers)
+        )
+        return beam_parameters.T.reshape((-1,) + tau.shape)
+
+    def derivative(self, tau: ArrayLike) -> FloatArray:
+        """Derivative of the beam parameters with respect to ``tau``"""
+        tau = np.asfarray(tau)
+        step, x = self._steps(tau.ravel())
+        order = self.coefficients.shape[2]
+        powers = np.cumprod(
+            np.hstack(
+                [np.ones((x.size, 1)), np.repeat(x[:, np.newaxis], order - 1, axis=1)]
+            ),
+            axis=1,
+        ) * np.arange(1, order + 1)
+        derivative = np.einsum("nij,nj->ni", self.coefficients[step], powers)
+        return derivative.T.reshape((-1,) + tau.shape)
+
+    def resample(self, tau: ArrayLike) -> Dict[str, FloatArray]:
+        """The beam at ``tau``, with the same names as the beam solver
+        output saved by `scotty.beam_me_up.beam_me_up`"""
+        tau = np.atleast_1d(np.asfarray(tau))
+        (
+            q_R_array,
+            q_zeta_array,
+            q_Z_array,
+            K_R_array,
+            K_Z_array,
+            Psi_3D_output,
+        ) = unpack_beam_parameters(self(tau))
+        return {
+            "tau_array": tau,
+            "q_R_array": q_R_array,
+            "q_zeta_array": q_zeta_array,
+            "q_Z_array": q_Z_array,
+            "K_R_array": K_R_array,
+            "K_Z_array": K_Z_array,
+            "K_zeta_initial": self.K_zeta,
+            "Psi_3D_output": Psi_3D_output.reshape(-1, 3, 3),
+        }
+
+    def _speed(self, tau: FloatArray) -> FloatArray:
+        """Rate of change of the distance along the central ray"""
+        q_R = self(tau)[0]
+        dq_R, dq_zeta, dq_Z = self.derivative(tau)[:3]
+        return np.sqrt(dq_R**2 + (q_R * dq_zeta) ** 2 + dq_Z**2)
+
+    def _step_arc_lengths(self) -> FloatArray:
+        """Arc length at the start of each step, and the end of the last"""
+        if self._arc_length_steps is None:
+            nodes = self.tau_old[:, np.newaxis] + self.h[:, np.newaxis] * _GAUSS_NODES
+            lengths = self.h * (self._speed(nodes) @ _GAUSS_WEIGHTS)
+            self._arc_length_steps = np.concatenate(([0.0], np.cumsum(lengths)))
+        return self._arc_length_steps
+
+    def arc_length(self, tau: ArrayLike) -> FloatArray:
+        """Distance along the central ray from the start of the beam
+        to ``tau``, consistent with ``distance_along_line`` in the
+        analysis output of `scotty.beam_me_up.beam_me_up` in the limit
+        of many output points"""
+        tau = np.asfarray(tau)
+        step, _ = self._steps(tau.ravel())
+        partial = tau.ravel() - self.tau_old[step]
+        nodes = self.tau_old[step, np.newaxis] + partial[:, np.newaxis] * _GAUSS_NODES
+        lengths = partial * (self._speed(nodes) @ _GAUSS_WEIGHTS)
+        return (self._step_arc_lengths()[step] + lengths).reshape(tau.shape)
+
+    def tau_at_arc_length(self, arc_length: ArrayLike) -> FloatArray:
+        """Values of ``tau`` where the distance along the central ray
+        from the start of the beam is ``arc_length``"""
+        arc_length = np.asfarray(arc_length)
+        # Initial guess from the step boundaries, refined by Newton's
+        # method as the arc length is monotonic in tau
+        step_boundaries = np.append(self.tau_old, self.tau_old[-1] + self.h[-1])
+        tau = np.interp(arc_length, self._step_arc_lengths(), step_boundaries)
+        for _ in range(4):
+            tau = tau - (self.arc_length(tau) - arc_length) / self._speed(tau)
+        return tau
+
+    def tau_at_poloidal_flux(
+        self, field: MagneticField, poloidal_flux: float, samples_per_step: int = 4
+    ) -> FloatArray:
+        """Values of ``tau`` where the central ray crosses the surface
+        of the given ``poloidal_flux``, in increasing order.
+
+        Crossings are bracketed by sampling each step
+        ``samples_per_step`` times, and then located with
+        `scipy.optimize.brentq`
+        """
+
+        def flux_difference(tau):
+            q_R, _, q_Z = self(tau)[:3]
+            return field.poloidal_flux(q_R, q_Z) - poloidal_flux
+
+        tau = np.linspace(
+            self.tau_start, self.tau_end, len(self.tau_old) * samples_per_step + 1
+        )
+        difference = flux_difference(tau)
+        crossings = np.flatnonzero(np.sign(difference[:-1]) != np.sign(difference[1:]))
+        return np.array(
+            [
+                brentq(lambda t: float(flux_difference(t)), tau[i], tau[i + 1])
+                for i in crossings
+            ]
+        )
+
+    def sampling_monitor(self, tau: ArrayLike) -> Dict[str, FloatArray]:
+        r"""Quantities whose variation along the beam determines where
+        `sample_tau` places points, each normalised to a maximum of one:
+
+        - ``K_R``, ``K_Z``: the components of the wavevector
+        - ``g_magnitude``: the magnitude of the group velocity
+        - ``localisation``: the ray and spectrum pieces of the
+          backscattering localisation,
+          :math:`|K|^{-13/3} / |g|^2`, which peak at the cut-off
+
+        """
+        tau = np.asfarray(tau)
+        q_R, _, _, K_R, K_Z = self(tau)[:5]
+        g_magnitude = self._speed(tau)
+        localisation = (
+            K_magnitude(K_R, self.K_zeta, K_Z, q_R) ** -SPECTRUM_POWER_LAW_COEFFICIENT
+            / g_magnitude**2
+        )
+        monitor = {
+            "K_R": K_R,
+            "K_Z": K_Z,
+            "g_magnitude": g_magnitude,
+            "localisation": localisation,
+        }
+        return {
+            key: value / max(np.max(np.abs(value)), np.finfo(float).tiny)
+            for key, value in monitor.items()
+        }
+
+    def sample_tau(
+        self,
+        n_points: Optional[int] = None,
+        tolerance: Optional[float] = None,
+        uniform_fraction: float = 0.2,
+        samples_per_step: int = 8,
+    ) -> FloatArray:
+        r"""Output points between ``tau_start`` and ``tau_end``,
+        concentrated where the quantities in `sampling_monitor` curve
+        the most.
+
+        The points equidistribute the error of linearly interpolating
+        these quantities between them, which is
+        :math:`h^2 |f''| / 8` for spacing :math:`h`, so that the
+        cumulative integrals in the analysis (for example
+        ``cum_loc_b_r_s``) are as accurate as possible for a given
+        number of points.
+
+        Parameters
+        ----------
+        n_points
+            Number of points. If ``tolerance`` is also given, this is
+            the maximum number of points
+        tolerance
+            Target interpolation error of the normalised quantities,
+            which sets the number of points
+        uniform_fraction
+            Weight of a uniform density of points added to the
+            adaptive one, so that flat parts of the beam are still
+            sampled
+        samples_per_step
+            Number of points per solver step at which the curvature is
+            estimated
+
+        """
+        if n_points is None and tolerance is None:
+            raise ValueError("Expected at least one of n_points or tolerance")
+
+        tau = np.linspace(
+            self.tau_start, self.tau_end, len(self.tau_old) * samples_per_step + 1
+        )
+        curvature = np.max(
+            [
+                np.abs(np.gradient(np.gradient(value, tau), tau))
+                for value in self.sampling_monitor(tau).values()
+            ],
+            axis=0,
+        )
+        density = np.sqrt(curvature)
+        density += uniform_fraction * np.mean(density) + np.finfo(float).tiny
+        cumulative_density = cumulative_trapezoid(density, tau, initial=0)
+
+        if tolerance is not None:
+            n_tolerance = int(np.ceil(cumulative_density[-1] / np.sqrt(8 * tolerance)))
+            n_points = (
+                max(n_tolerance + 1, 3)
+                if n_points is None
+                else min(n_points, max(n_tolerance + 1, 3))
+            )
+
+        return np.interp(
+            np.linspace(0, cumulative_density[-1], n_points), cumulative_density, tau
+        )
+
+    def save(self, filename: PathLike):
+        """Save to a ``.npz`` file which can be read with `load`"""
+        np.savez(
+            filename,
+            tau_old=self.tau_old,
+            h=self.h,
+            beam_parameters_old=self.beam_parameters_old,
+            coefficients=self.coefficients,
+            K_zeta=self.K_zeta,
+            tau_end=self.tau_end,
+        )
+
+    @classmethod
+    def load(cls, filename: PathLike) -> "BeamTrajectory":
+        """Read a trajectory saved with `save`"""
+        with np.load(filename) as f:
+            return cls(
+                f["tau_old"],
+                f["h"],
+                f["beam_parameters_old"],
+                f["coefficients"],
+                float(f["K_zeta"]),
+                float(f["tau_end"]),
+            )
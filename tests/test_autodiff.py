@@ -0,0 +1,156 @@
+from scotty.autodiff import Jet, variables, apply_univariate, apply_bivariate
+from scotty import geometry
+from scotty.density_fit import QuadraticFit, TanhFit, PolynomialFit, StefanikovaFit
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import pytest
+
+
+def myfun(x, y):
+    return (
+        y**2 * (1 + np.sin(x))
+        + np.exp(x * y) / (1 + x**2)
+        - np.sqrt(y) * np.tanh(x)
+    )
+
+
+def myfun_derivatives(x, y):
+    """Derivatives of `myfun` by finite differences"""
+    delta = 1e-4
+
+    def d(f, direction):
+        if direction == 0:
+            return lambda x, y: (f(x + delta, y) - f(x - delta, y)) / (2 * delta)
+        return lambda x, y: (f(x, y + delta) - f(x, y - delta)) / (2 * delta)
+
+    gradient = [d(myfun, i)(x, y) for i in range(2)]
+    hessian = [[d(d(myfun, i), j)(x, y) for j in range(2)] for i in range(2)]
+    return np.array(gradient), np.array(hessian)
+
+
+def test_jet_arithmetic():
+    x_value = np.array([0.1, 0.5, 1.2])
+    y_value = np.array([0.3, 2.0, 1.5])
+    x, y = variables((x_value, y_value))
+
+    result = myfun(x, y)
+    gradient, hessian = myfun_derivatives(x_value, y_value)
+
+    assert isinstance(result, Jet)
+    assert_allclose(result.value, myfun(x_value, y_value))
+    assert_allclose(result.gradient, gradient, rtol=1e-6)
+    assert_allclose(result.hessian, hessian, rtol=1e-5, atol=1e-6)
+
+
+def test_jet_first_order_only():
+    x, y = variables((0.5, 2.0), second_order=False)
+    result = myfun(x, y)
+    assert result.hessian is None
+    assert_allclose(result.gradient, myfun_derivatives(0.5, 2.0)[0], rtol=1e-6)
+
+
+def test_jet_mixed_shapes():
+    x, y = variables((np.array([1.0, 2.0]), 3.0))
+    stacked = np.stack([x, y, 2 * x])
+    assert stacked.shape == (3, 2)
+    assert stacked.gradient.shape == (2, 3, 2)
+
+    # Constant with more dimensions than the jet
+    weights = np.arange(6.0).reshape(3, 2)
+    total = np.sum(weights * stacked, axis=0)
+    assert total.shape == (2,)
+    assert_allclose(total.value, [0 * 1 + 2 * 3 + 4 * 2, 1 * 2 + 3 * 3 + 5 * 4])
+    assert_allclose(total.gradient[0], [0 + 4 * 2, 1 + 5 * 2])
+    assert_allclose(total.gradient[1], [2, 3])
+
+    total += x
+    assert_allclose(total.gradient[0], [9, 12])
+
+    assert np.shape(total) == (2,)
+    assert np.reshape(total, (2, 1)).gradient.shape == (2, 2, 1)
+    assert np.all((x <= 1.5) == [True, False])
+
+
+def test_jet_sqrt_of_zero():
+    """Derivatives should be zero, rather than NaN"""
+    (x,) = variables((np.array([0.0, 4.0]),))
+    result = np.sqrt(0.0 * x + np.array([0.0, 4.0]))
+    assert np.all(np.isfinite(result.gradient))
+    assert np.all(np.isfinite(result.hessian))
+
+
+def test_apply_univariate():
+    (x,) = variables((0.3,))
+    result = apply_univariate(
+        lambda x, n: [np.sin, np.cos, lambda x: -np.sin(x)][n](x), x
+    )
+    assert_allclose(result.value, np.sin(0.3))
+    assert_allclose(result.gradient, [np.cos(0.3)])
+    assert_allclose(result.hessian, [[-np.sin(0.3)]])
+
+    assert apply_univariate(lambda x, n: x, 2.0) == 2.0
+
+
+def test_apply_bivariate():
+    def f(x, y, nx, ny):
+        """Partial derivatives of x**3 * y**2"""
+        x_factor = [x**3, 3 * x**2, 6 * x][nx]
+        y_factor = [y**2, 2 * y, 2.0][ny]
+        return x_factor * y_factor
+
+    x, y = variables((2.0, 3.0))
+    # Check chain rule through functions of the variables
+    result = apply_bivariate(f, x * y, y)
+    expected = (x * y) ** 3 * y**2
+    assert_allclose(result.value, expected.value)
+    assert_allclose(result.gradient, expected.gradient)
+    assert_allclose(result.hessian, expected.hessian)
+
+
+@pytest.mark.parametrize(
+    "field",
+    [
+        geometry.CircularCrossSectionField(1.0, 2.0, 1.0, 0.5),
+        geometry.ConstantCurrentDensityField(1.0, 2.0, 1.0, 0.5),
+    ],
+)
+def test_analytic_field(field):
+    R = np.linspace(1.5, 2.7, 5)
+    Z = np.linspace(-0.4, 0.3, 5)
+    expected = field.derivatives(R, Z)
+    q_R, q_Z = variables((R, Z))
+
+    for name, method in zip(
+        geometry.FIELD_QUANTITIES,
+        (field.poloidal_flux, field.B_R, field.B_T, field.B_Z),
+    ):
+        result = method(q_R, q_Z)
+        assert_allclose(result.value, method(R, Z))
+        assert_allclose(result.gradient[0], expected[f"d{name}_dR"])
+        assert_allclose(result.gradient[1], expected[f"d{name}_dZ"])
+        assert_allclose(result.hessian[0, 0], expected[f"d2{name}_dR2"])
+        assert_allclose(result.hessian[1, 1], expected[f"d2{name}_dZ2"])
+        assert_allclose(result.hessian[0, 1], expected[f"d2{name}_dR_dZ"])
+
+
+@pytest.mark.parametrize(
+    "fit",
+    [
+        QuadraticFit(1.0, 2.0),
+        TanhFit(1.0, 2.0, -2.0),
+        PolynomialFit(1.0, -3.1, 3.3, -1.55, 2.0),
+        StefanikovaFit(1.0, 2.0, 1.0, 1.2, 1.0, 1.1, 0.8, 0.3, 0.9),
+    ],
+)
+def test_density_fit(fit):
+    poloidal_flux = np.linspace(0.1, 1.2, 7)
+    (psi,) = variables((poloidal_flux,))
+    result = fit(psi)
+
+    assert_allclose(result.value, fit(poloidal_flux))
+    assert_allclose(result.gradient[0], fit.derivative(poloidal_flux), rtol=1e-5)
+    assert_allclose(
+        result.hessian[0, 0], fit.derivative(poloidal_flux, 2), rtol=1e-3, atol=1e-4
+    )
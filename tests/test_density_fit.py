@@ -75,3 +75,37 @@ def test_make_density_fit(ne_dat):
     _, _, filename = ne_dat
     fit = density_fit(None, LCFS, [filename, 5, 0], filename=filename)
     assert isinstance(fit, SmoothingSplineFit)
+
+
+@pytest.mark.parametrize(
+    "fit",
+    [
+        pytest.param(QuadraticFit(LCFS, CENTRAL_DENSITY), id="QuadraticFit"),
+        pytest.param(TanhFit(LCFS, CENTRAL_DENSITY, -CENTRAL_DENSITY), id="TanhFit"),
+        pytest.param(
+            PolynomialFit(LCFS, -3.1, 3.3, -1.55, CENTRAL_DENSITY), id="PolynomialFit"
+        ),
+        pytest.param(
+            StefanikovaFit(LCFS, CENTRAL_DENSITY, 1.0, 1.2, 1.0, 1.1, 0.8, 0.3, 0.9),
+            id="StefanikovaFit",
+        ),
+        pytest.param(
+            SmoothingSplineFit(
+                LCFS, np.linspace(0, 1, 10), np.linspace(CENTRAL_DENSITY, 0.0, 10)
+            ),
+            id="SmoothingSplineFit",
+        ),
+    ],
+)
+def test_density_fit_derivative(fit):
+    poloidal_flux = np.linspace(0.1, 0.9, 9)
+    delta = 1e-4
+
+    first = (fit(poloidal_flux + delta) - fit(poloidal_flux - delta)) / (2 * delta)
+    second = (
+        fit(poloidal_flux + delta) - 2 * fit(poloidal_flux) + fit(poloidal_flux - delta)
+    ) / delta**2
+
+    assert np.allclose(fit.derivative(poloidal_flux), first, rtol=1e-5, atol=1e-6)
+    assert np.allclose(fit.derivative(poloidal_flux, 2), second, rtol=1e-3, atol=1e-3)
+    assert fit.derivative(LCFS + 0.1) == 0.0, "Outside"
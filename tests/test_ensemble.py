@@ -0,0 +1,274 @@
+from scotty.beam_me_up import beam_me_up, beam_me_up_batch, scan_cutoffs
+from scotty.density_fit import QuadraticFit
+from scotty.ensemble import METHODS, solve_ensemble
+from scotty.fun_evolution import (
+    BeamEvolution,
+    beam_evolution_fun,
+    linearised_beam_evolution_fun,
+    linearised_to_beam_parameters,
+    pack_beam_parameters,
+    pack_linearised_parameters,
+)
+from scotty.geometry import CircularCrossSectionField
+from scotty.hamiltonian import Hamiltonian
+from scotty.init_bruv import get_parameters_for_Scotty
+
+import importlib
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from scipy.integrate import solve_ivp
+
+import pytest
+
+
+# Damped oscillators with different frequencies
+FREQUENCIES = np.array([1.0, 2.0, 3.5, 0.7])
+Y0 = np.array([[1.0, 0.5, 2.0, 1.0], [0.0, 1.0, 0.0, -1.0]])
+T_BOUND = np.array([10.0, 5.0, 3.0, 20.0])
+
+
+def oscillators(t, y, index):
+    return np.array([y[1], -FREQUENCIES[index] ** 2 * y[0] - 0.1 * y[1]])
+
+
+def crossing(t, y, index):
+    return y[0] - 0.5
+
+
+crossing.direction = 1
+
+
+def single_member(function, member):
+    """Version of an ensemble function for `solve_ivp`"""
+
+    def wrapper(t, y):
+        return function(t, y[:, np.newaxis], np.array([member]))[..., 0]
+
+    wrapper.terminal = getattr(function, "terminal", False)
+    wrapper.direction = getattr(function, "direction", 0.0)
+    return wrapper
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("terminal", [False, True])
+@pytest.mark.parametrize("with_t_eval", [False, True])
+def test_solve_ensemble(monkeypatch, method, terminal, with_t_eval):
+    monkeypatch.setattr(crossing, "terminal", terminal, raising=False)
+    t_eval = [np.linspace(0, t_bound, 7) for t_bound in T_BOUND]
+
+    solution = solve_ensemble(
+        oscillators,
+        0.0,
+        T_BOUND,
+        Y0,
+        t_eval=t_eval if with_t_eval else None,
+        events=[crossing],
+        method=method,
+    )
+
+    for member in range(len(T_BOUND)):
+        expected = solve_ivp(
+            single_member(oscillators, member),
+            [0, T_BOUND[member]],
+            Y0[:, member],
+            t_eval=t_eval[member] if with_t_eval else None,
+            events=[single_member(crossing, member)],
+            method=method,
+        )
+        assert solution.status[member] == expected.status
+        assert_allclose(solution.t[member], expected.t, atol=1e-12)
+        assert_allclose(solution.y[member], expected.y, atol=1e-12)
+        assert_allclose(solution.t_events[member][0], expected.t_events[0])
+        assert_allclose(
+            solution.y_events[member][0].reshape(-1, 2),
+            expected.y_events[0].reshape(-1, 2),
+            atol=1e-12,
+        )
+
+
+def test_solve_ensemble_in_place():
+    calls = []
+
+    def oscillators_in_place(t, y, index, out=None):
+        if out is None:
+            out = np.empty_like(y)
+        else:
+            calls.append(out)
+        out[0] = y[1]
+        out[1] = -FREQUENCIES[index] ** 2 * y[0] - 0.1 * y[1]
+        return out
+
+    expected = solve_ensemble(oscillators, 0.0, T_BOUND, Y0)
+    solution = solve_ensemble(oscillators_in_place, 0.0, T_BOUND, Y0)
+
+    # The stages are written into the same preallocated buffer
+    assert calls
+    assert len({id(out.base) for out in calls}) == 1
+    for member in range(len(T_BOUND)):
+        assert_array_equal(solution.t[member], expected.t[member])
+        assert_array_equal(solution.y[member], expected.y[member])
+
+
+def test_beam_evolution():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    frequencies = 2 * np.pi * np.array([50e9, 55e9, 60e9, 55e9])
+    mode_flags = np.array([1, 1, -1, -1])
+    K_zeta = np.array([0.0, 10.0, -5.0, 1.0])
+    args = (QuadraticFit(1.0, 4.0), -1e-4, 1e-4, 0.1, 0.1, 0.1)
+    hamiltonian = Hamiltonian(field, frequencies, mode_flags, *args)
+
+    Psi = np.array(
+        [[10 + 2j, 0.1 + 0.5j, 1 - 1j], [0.1 + 0.5j, 20 + 3j, 0.2], [1 - 1j, 0.2, 30j]]
+    )
+    beam_parameters = pack_beam_parameters(
+        np.array([1.85, 1.9, 1.95, 1.8]),
+        np.zeros(4),
+        np.array([0.1, -0.05, 0.0, 0.05]),
+        np.array([-900.0, -1100.0, -500.0, -700.0]),
+        np.array([10.0, 30.0, -50.0, 0.0]),
+        np.array([Psi, 2 * Psi, Psi.conj(), -Psi]),
+    )
+    assert beam_parameters.shape == (17, 4)
+
+    evolution = BeamEvolution(hamiltonian, K_zeta)
+    index = np.array([3, 1])
+    result = evolution(0.0, beam_parameters[:, index], index)
+    for column, beam in enumerate(index):
+        single = Hamiltonian(field, frequencies[beam], mode_flags[beam], *args)
+        expected = beam_evolution_fun(
+            0.0, beam_parameters[:, beam], K_zeta[beam], single
+        )
+        assert_array_equal(result[:, column], expected)
+        # Single beams, as from solve_ivp
+        single_evolution = BeamEvolution(single, K_zeta[beam])
+        assert_array_equal(single_evolution(0.0, beam_parameters[:, beam]), expected)
+
+
+def test_linearised_beam_evolution_fun():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    args = (QuadraticFit(1.0, 4.0), -1e-4, 1e-4, 0.1, 0.1, 0.1)
+    hamiltonian = Hamiltonian(
+        field, 2 * np.pi * 55e9, -1, *args, derivative_method="analytic"
+    )
+    Psi = np.array(
+        [[10 + 2j, 0.1 + 0.5j, 1 - 1j], [0.1 + 0.5j, 20 + 3j, 0.2], [1 - 1j, 0.2, 30j]]
+    )
+    Q = np.array([[1.2, 0.1j, 0.3], [0.0, 0.9, 0.2], [0.1, 0.0, 1.1 + 0.2j]])
+    linearised = pack_linearised_parameters(1.85, 0.1, 0.05, -900.0, 10.0, Psi @ Q, Q)
+    beam_parameters = linearised_to_beam_parameters(linearised)
+    assert_allclose(
+        beam_parameters,
+        pack_beam_parameters(1.85, 0.1, 0.05, -900.0, 10.0, Psi),
+        atol=1e-12,
+    )
+
+    # d Psi / d tau from the chain rule through Psi = P Q^-1
+    d_linearised = linearised_beam_evolution_fun(0.0, linearised, 10.0, hamiltonian)
+    step = 1e-7
+    d_beam_parameters = (
+        linearised_to_beam_parameters(linearised + step * d_linearised)
+        - beam_parameters
+    ) / step
+    expected = beam_evolution_fun(0.0, beam_parameters, 10.0, hamiltonian)
+    assert_allclose(d_beam_parameters, expected, atol=1e-6 * np.max(np.abs(expected)))
+
+
+def test_beam_me_up_batch(tmp_path):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["len_tau"] = 10
+    # Finite difference derivatives of H are sensitive enough to
+    # rounding that vectorised and scalar evaluations differ visibly
+    kwargs_dict["derivative_method"] = "analytic"
+    del kwargs_dict["figure_flag"]
+    del kwargs_dict["vacuumLaunch_flag"]
+
+    batch_kwargs = kwargs_dict.copy()
+    batch_kwargs["poloidal_launch_angle_Torbeam"] = np.array([[4.0], [6.0]])
+    batch_kwargs["launch_freq_GHz"] = np.array([50.0, 55.0, 60.0])
+    output = beam_me_up_batch(**batch_kwargs)
+    assert len(output) == 6
+
+    for beam in (1, 3):
+        kwargs_dict["poloidal_launch_angle_Torbeam"] = output[beam][
+            "poloidal_launch_angle_Torbeam"
+        ]
+        kwargs_dict["launch_freq_GHz"] = output[beam]["launch_freq_GHz"]
+        beam_me_up(
+            **kwargs_dict,
+            figure_flag=False,
+            detailed_analysis_flag=False,
+            output_path=tmp_path,
+        )
+        with np.load(tmp_path / "solver_output.npz") as f:
+            expected = dict(f)
+
+        for key in ("tau_array", "q_R_array", "q_Z_array", "K_R_array"):
+            assert_allclose(output[beam][key], expected[key], rtol=1e-6, err_msg=key)
+        assert_allclose(
+            output[beam]["Psi_3D_output"],
+            expected["Psi_3D_output"],
+            rtol=1e-6,
+            atol=1e-6,
+        )
+
+
+def test_scan_cutoffs():
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    poloidal_angles = np.array([[2.0], [6.0]])
+    frequencies = np.array([50.0, 55.0, 60.0])
+
+    scan_kwargs = kwargs_dict.copy()
+    for key in (
+        "launch_beam_width",
+        "launch_beam_curvature",
+        "figure_flag",
+        "vacuumLaunch_flag",
+        "vacuum_propagation_flag",
+        "Psi_BC_flag",
+    ):
+        scan_kwargs.pop(key, None)
+    scan_kwargs["poloidal_launch_angle_Torbeam"] = poloidal_angles
+    scan_kwargs["launch_freq_GHz"] = frequencies
+    cutoffs = scan_cutoffs(**scan_kwargs)
+    assert cutoffs.q_R.shape == (2, 3)
+
+    for i, j in [(0, 0), (1, 2)]:
+        kwargs_dict["poloidal_launch_angle_Torbeam"] = poloidal_angles[i, 0]
+        kwargs_dict["launch_freq_GHz"] = frequencies[j]
+        expected = beam_me_up(**kwargs_dict, quick_run=True)
+        for key, value in vars(expected).items():
+            assert_allclose(getattr(cutoffs, key)[i, j], value, rtol=1e-6, err_msg=key)
+
+
+def test_scan_cutoffs_failed_ray(monkeypatch):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    for key in (
+        "launch_beam_width",
+        "launch_beam_curvature",
+        "figure_flag",
+        "vacuumLaunch_flag",
+        "vacuum_propagation_flag",
+        "Psi_BC_flag",
+    ):
+        kwargs_dict.pop(key, None)
+    kwargs_dict["launch_freq_GHz"] = np.array([50.0, 55.0, 60.0])
+    expected = scan_cutoffs(**kwargs_dict)
+
+    def fail_first_ray(*args, **kwargs):
+        solution = solve_ensemble(*args, **kwargs)
+        solution.status[0] = -1
+        return solution
+
+    # The package exports the function beam_me_up under the module's name
+    beam_me_up_module = importlib.import_module("scotty.beam_me_up")
+    monkeypatch.setattr(beam_me_up_module, "solve_ensemble", fail_first_ray)
+    cutoffs = scan_cutoffs(**kwargs_dict)
+
+    for key, value in vars(expected).items():
+        assert np.all(np.isfinite(value)), key
+        assert np.isnan(getattr(cutoffs, key)[0]), key
+        assert_array_equal(getattr(cutoffs, key)[1:], value[1:], err_msg=key)
@@ -2,6 +2,8 @@ from scotty import geometry
 
 import numpy as np
 import numpy.testing as npt
+import pytest
+from scipy.interpolate import RectBivariateSpline
 
 
 def test_circular():
@@ -87,3 +89,120 @@ def test_interpolated():
         circular_field.poloidal_flux(R_midplane, 0.0),
         rtol=1e-3,
     )
+
+
+def test_interpolated_derivatives():
+    B_T_axis = 1.0
+    R_axis = 2.0
+    minor_radius_a = 1.0
+    B_p_a = 0.5
+    circular_field = geometry.CircularCrossSectionField(
+        B_T_axis=B_T_axis, R_axis=R_axis, minor_radius_a=minor_radius_a, B_p_a=B_p_a
+    )
+
+    R = np.linspace(R_axis - minor_radius_a, R_axis + minor_radius_a)
+    Z = np.linspace(-minor_radius_a, minor_radius_a)
+    R_grid, Z_grid = np.meshgrid(R, Z, indexing="ij")
+    field = geometry.InterpolatedField(
+        R,
+        Z,
+        circular_field.B_R(R_grid, Z_grid),
+        circular_field.B_T(R_grid, Z_grid),
+        circular_field.B_Z(R_grid, Z_grid),
+        circular_field.poloidal_flux(R_grid, Z_grid),
+    )
+
+    R_points = np.linspace(R_axis + 0.2, R_axis + 0.8, 5)
+    Z_points = np.linspace(-0.3, 0.4, 5)
+    derivatives = field.derivatives(R_points, Z_points)
+    # Compare spline derivatives with finite differences of the splines
+    expected = geometry.MagneticField.derivatives(field, R_points, Z_points)
+
+    assert derivatives.keys() == expected.keys()
+    for key, value in expected.items():
+        npt.assert_allclose(derivatives[key], value, rtol=1e-4, atol=1e-6, err_msg=key)
+
+
+@pytest.mark.parametrize(
+    "field_type",
+    [geometry.CircularCrossSectionField, geometry.ConstantCurrentDensityField],
+)
+def test_circular_derivatives(field_type):
+    field = field_type(B_T_axis=1.0, R_axis=2.0, minor_radius_a=1.0, B_p_a=0.5)
+
+    R = np.linspace(1.5, 2.7, 5)
+    Z = np.linspace(-0.4, 0.3, 5)
+    derivatives = field.derivatives(R, Z)
+    expected = geometry.MagneticField.derivatives(field, R, Z)
+
+    assert derivatives.keys() == expected.keys()
+    for key, value in expected.items():
+        npt.assert_allclose(derivatives[key], value, rtol=1e-5, atol=1e-7, err_msg=key)
+
+
+@pytest.mark.parametrize("derivatives", [0, 1, 2])
+def test_interpolated_evaluate(derivatives):
+    circular_field = geometry.CircularCrossSectionField(
+        B_T_axis=1.0, R_axis=2.0, minor_radius_a=1.0, B_p_a=0.5
+    )
+    # Avoid the magnetic axis, where B_R and B_Z are undefined
+    R = np.linspace(1.0, 3.0, 40)
+    Z = np.linspace(-1.0, 1.0, 36)
+    R_grid, Z_grid = np.meshgrid(R, Z, indexing="ij")
+    grids = {
+        "polflux": circular_field.poloidal_flux(R_grid, Z_grid),
+        "B_R": circular_field.B_R(R_grid, Z_grid),
+        "B_T": circular_field.B_T(R_grid, Z_grid),
+        "B_Z": circular_field.B_Z(R_grid, Z_grid),
+    }
+    field = geometry.InterpolatedField(
+        R, Z, grids["B_R"], grids["B_T"], grids["B_Z"], grids["polflux"]
+    )
+
+    # Including points off the grid, which are clamped to its edges
+    R_points = np.array([[2.2, 2.5, 2.9], [1.3, 0.8, 3.4]])
+    Z_points = np.array([[-0.3, 0.1, 0.4], [0.7, -0.2, 1.5]])
+    result = field.evaluate(R_points, Z_points, derivatives)
+
+    expected_keys = set(geometry.FIELD_QUANTITIES)
+    for key, orders in geometry.SPATIAL_DERIVATIVE_ORDERS.items():
+        if sum(orders) <= derivatives:
+            expected_keys.update(key.format(name) for name in grids)
+    assert result.keys() == expected_keys
+
+    for name, grid in grids.items():
+        spline = RectBivariateSpline(R, Z, grid, kx=5, ky=5, s=0)
+        for key, orders in [("{}", (0, 0))] + list(
+            geometry.SPATIAL_DERIVATIVE_ORDERS.items()
+        ):
+            if sum(orders) > derivatives:
+                continue
+            expected = spline(R_points, Z_points, *orders, grid=False)
+            npt.assert_allclose(
+                result[key.format(name)],
+                expected,
+                rtol=1e-10,
+                atol=1e-10,
+                err_msg=key.format(name),
+            )
+
+    with pytest.raises(ValueError):
+        field.evaluate(R_points, Z_points, derivatives=3)
+
+
+def test_evaluate_default():
+    field = geometry.CircularCrossSectionField(
+        B_T_axis=1.0, R_axis=2.0, minor_radius_a=1.0, B_p_a=0.5
+    )
+    R = np.linspace(1.5, 2.7, 5)
+    Z = np.linspace(-0.4, 0.3, 5)
+
+    result = field.evaluate(R, Z, derivatives=1)
+    npt.assert_allclose(result["polflux"], field.poloidal_flux(R, Z))
+    npt.assert_allclose(result["B_R"], field.B_R(R, Z))
+    npt.assert_allclose(result["B_T"], field.B_T(R, Z))
+    npt.assert_allclose(result["B_Z"], field.B_Z(R, Z))
+    derivatives = field.derivatives(R, Z)
+    for key in ("dpolflux_dR", "dB_R_dZ", "dB_T_dR", "dB_Z_dZ"):
+        npt.assert_allclose(result[key], derivatives[key], err_msg=key)
+    assert "d2B_T_dR2" not in result
@@ -1,4 +1,13 @@
-from scotty.hamiltonian import Hamiltonian, hessians
+from scotty.hamiltonian import (
+    DielectricTensor,
+    Hamiltonian,
+    hessians,
+    StencilPlan,
+    COORDINATES,
+    FIRST_ORDER_DERIVATIVES,
+    SECOND_ORDER_DERIVATIVES,
+    DERIVATIVE_METHODS,
+)
 from scotty.fun_general import freq_GHz_to_angular_frequency
 from scotty.init_bruv import get_parameters_for_Scotty
 from scotty.beam_me_up import create_magnetic_geometry
@@ -26,18 +35,24 @@ class FakeHamiltonian(Hamiltonian):
         delta_K_zeta: float,
         delta_K_Z: float,
     ):
-        self.spacings = {
-            "q_R": delta_R,
-            "q_Z": delta_Z,
-            "K_R": delta_K_R,
-            "K_zeta": delta_K_zeta,
-            "K_Z": delta_K_Z,
-        }
-
-    def __call__(self, q_R, q_Z, K_R, K_zeta, K_Z):
+        super().__init__(
+            field=None,
+            launch_angular_frequency=1.0,
+            mode_flag=1,
+            density_fit=None,
+            delta_R=delta_R,
+            delta_Z=delta_Z,
+            delta_K_R=delta_K_R,
+            delta_K_zeta=delta_K_zeta,
+            delta_K_Z=delta_K_Z,
+        )
+
+    def spatial_terms(self, q_R, q_Z):
+        return {"H_q": np.exp(k_q_R * q_R) * np.exp(k_q_Z * q_Z)}
+
+    def from_spatial_terms(self, spatial, q_R, K_R, K_zeta, K_Z):
         return (
-            np.exp(k_q_R * q_R)
-            * np.exp(k_q_Z * q_Z)
+            spatial["H_q"]
             * np.exp(k_K_R * K_R)
             * np.exp(k_K_zeta * K_zeta)
             * np.exp(k_K_Z * K_Z)
@@ -122,6 +137,102 @@ def test_hamiltonian_hessians():
     assert_allclose(gradK_gradK_H / H0, gradK_gradK_H_expected, rtol=1e-5, atol=1e-4)
 
 
+def test_stencil_plan():
+    spacings = dict(zip(COORDINATES, (1e-3, 2e-3, 3e-3, 4e-3, 5e-3)))
+    first_order = StencilPlan(FIRST_ORDER_DERIVATIVES, spacings)
+    second_order = StencilPlan(
+        FIRST_ORDER_DERIVATIVES + SECOND_ORDER_DERIVATIVES, spacings
+    )
+
+    # Evaluation points are shared between stencils
+    assert first_order.offsets.shape == (11, 5)
+    assert second_order.offsets.shape == (47, 5)
+    assert len(np.unique(second_order.offsets, axis=0)) == 47
+
+    # Stencil weights for a derivative sum to zero
+    assert_allclose(second_order.weights.sum(axis=1), 0, atol=1e-8)
+
+    coords, shape = first_order.points(np.ones(4), 2.0, 3.0, 4.0, 5.0)
+    assert shape == (4,)
+    assert all(coord.shape == (11 * 4,) for coord in coords)
+
+
+def test_hamiltonian_derivatives_vectorised():
+    """Batched evaluation over arrays of points should agree with
+    evaluating each point separately"""
+    H = FakeHamiltonian(1e-3, 1e-3, 1e-4, 1e-4, 1e-4)
+    q_R = np.array([1.2, 1.3, 1.4])
+    q_Z = np.array([2.3, 2.2, 2.1])
+    K_R = np.array([3.4, 3.5, 3.6])
+    K_Z = np.array([5.6, 5.5, 5.4])
+    K_zeta = 4.5
+
+    dH = H.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+
+    for index in range(len(q_R)):
+        dH_point = H.derivatives(
+            q_R[index], q_Z[index], K_R[index], K_zeta, K_Z[index], second_order=True
+        )
+        for name, value in dH_point.items():
+            assert_allclose(dH[name][index], value, err_msg=name)
+
+
+def test_hamiltonian_required_derivatives():
+    H = FakeHamiltonian(1e-3, 1e-3, 1e-4, 1e-4, 1e-4)
+    dH_all = H.derivatives(1.2, 2.3, 3.4, 4.5, 5.6, second_order=True)
+
+    required = ("dH_dR", "dH_dZ", "dH_dKR", "dH_dKZ", "d2H_dR_dKZ")
+    dH = H.derivatives(1.2, 2.3, 3.4, 4.5, 5.6, required=required)
+
+    assert set(dH.keys()) == set(required)
+    for name in required:
+        assert np.isclose(dH[name], dH_all[name])
+
+    # The K_zeta points aren't needed
+    ray_plan = H.stencil_plan(("dH_dR", "dH_dZ", "dH_dKR", "dH_dKZ"))
+    assert len(ray_plan.offsets) == 9
+    assert not np.any(ray_plan.offsets[:, COORDINATES.index("K_zeta")])
+
+    with pytest.raises(ValueError):
+        H.derivatives(1.2, 2.3, 3.4, 4.5, 5.6, required=("dH_dX",))
+
+
+def test_hamiltonian_spatial_terms():
+    """Splitting H into spatial and K parts should give the same
+    derivatives, while only evaluating the field at distinct positions"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    angular_frequency = freq_GHz_to_angular_frequency(kwargs_dict["launch_freq_GHz"])
+    H = Hamiltonian(
+        field,
+        angular_frequency,
+        kwargs_dict["mode_flag"],
+        kwargs_dict["density_fit_method"],
+        -1e-3,
+        1e-3,
+        0.1,
+        0.1,
+        0.1,
+    )
+    q_R = np.array([1.75, 1.8])
+    q_Z = np.array([0.1, -0.1])
+    K_R = np.array([-1000.0, -900.0])
+    K_Z = np.array([-100.0, -200.0])
+    K_zeta = 0.0
+
+    dH = H.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+
+    plan = H.stencil_plan(dH.keys())
+    assert len(plan.spatial_offsets) < len(plan.offsets) / 3
+
+    # Compare against direct evaluation at each offset
+    coords, shape = plan.points(q_R, q_Z, K_R, K_zeta, K_Z)
+    expected = plan.apply(H(*coords), shape)
+    for name, value in expected.items():
+        assert_allclose(dH[name], value, err_msg=name)
+
+
 @pytest.mark.parametrize(
     ("derivative", "expected"),
     (
@@ -176,3 +287,196 @@ def test_golden():
     )
     expected = -0.2632447148279265
     assert np.isclose(H(1.75, 0.1, 1, 1, 1), expected)
+
+
+@pytest.mark.parametrize("mode_flag", (1, -1))
+def test_analytic_derivatives(mode_flag):
+    """Analytic derivatives should agree with finite differences"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    density = kwargs_dict["density_fit_method"]
+    angular_frequency = freq_GHz_to_angular_frequency(kwargs_dict["launch_freq_GHz"])
+    args = (field, angular_frequency, mode_flag, density, 1e-4, 1e-4, 0.1, 0.1, 0.1)
+
+    H_fd = Hamiltonian(*args)
+    H_analytic = Hamiltonian(*args, derivative_method="analytic")
+
+    q_R = np.array([1.7, 1.85, 1.3])
+    q_Z = np.array([0.1, -0.05, 0.2])
+    K_R = np.array([-900.0, -600.0, 400.0])
+    K_zeta = np.array([80.0, 0.0, -50.0])
+    K_Z = np.array([-50.0, 20.0, 100.0])
+
+    expected = H_fd.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+    dH = H_analytic.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+
+    assert dH.keys() == expected.keys()
+    for name, value in expected.items():
+        assert_allclose(
+            dH[name], value, rtol=1e-3, atol=1e-3 * np.abs(value).max(), err_msg=name
+        )
+
+    required = ("dH_dR", "d2H_dR_dKZ")
+    dH_required = H_analytic.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, required=required)
+    assert sorted(dH_required.keys()) == sorted(required)
+    assert_allclose(dH_required["d2H_dR_dKZ"], dH["d2H_dR_dKZ"])
+
+
+def test_analytic_derivatives_bad_method():
+    with pytest.raises(ValueError):
+        Hamiltonian(None, 1.0, 1, None, 1, 1, 1, 1, 1, derivative_method="magic")
+
+
+def test_autodiff_derivatives():
+    """Automatic differentiation should agree with the analytic derivatives"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    density = kwargs_dict["density_fit_method"]
+    angular_frequency = freq_GHz_to_angular_frequency(kwargs_dict["launch_freq_GHz"])
+    args = (field, angular_frequency, -1, density, 1e-4, 1e-4, 0.1, 0.1, 0.1)
+
+    H_analytic = Hamiltonian(*args, derivative_method="analytic")
+    H_autodiff = Hamiltonian(*args, derivative_method="autodiff")
+
+    # Last point is outside the plasma
+    q_R = np.array([1.7, 1.85, 1.3, 2.6])
+    q_Z = np.array([0.1, -0.05, 0.2, 0.0])
+    K_R = np.array([-900.0, -600.0, 400.0, -1000.0])
+    K_zeta = np.array([80.0, 0.0, -50.0, 0.0])
+    K_Z = np.array([-50.0, 20.0, 100.0, 0.0])
+
+    expected = H_analytic.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+    dH = H_autodiff.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+
+    assert dH.keys() == expected.keys()
+    for name, value in expected.items():
+        assert_allclose(dH[name], value, rtol=1e-8, atol=1e-12, err_msg=name)
+
+
+def test_mode_branches():
+    """Both branches should match separate Hamiltonians for each mode"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    density = kwargs_dict["density_fit_method"]
+    angular_frequency = freq_GHz_to_angular_frequency(kwargs_dict["launch_freq_GHz"])
+    args = (field, angular_frequency, 1, density, 1e-4, 1e-4, 0.1, 0.1, 0.1)
+    args_other = (field, angular_frequency, -1, density, 1e-4, 1e-4, 0.1, 0.1, 0.1)
+
+    q_R = np.array([1.7, 1.85, 2.5])
+    q_Z = np.array([0.1, -0.05, 0.0])
+    K_R = np.array([-900.0, -600.0, 400.0])
+    K_zeta = 0.0
+    K_Z = np.array([-50.0, 20.0, 100.0])
+
+    branches = Hamiltonian(*args).mode_branches(q_R, q_Z, K_R, K_zeta, K_Z)
+    assert_allclose(branches["H"], Hamiltonian(*args)(q_R, q_Z, K_R, K_zeta, K_Z))
+    assert_allclose(
+        branches["H_other"], Hamiltonian(*args_other)(q_R, q_Z, K_R, K_zeta, K_Z)
+    )
+    assert_allclose(
+        branches["H"] - branches["H_other"],
+        -np.sqrt(branches["H_discriminant"])
+        / Hamiltonian(*args).dispersion_terms(
+            Hamiltonian(*args).spatial_terms(q_R, q_Z), q_R, K_R, K_zeta, K_Z
+        )["Booker_alpha"],
+    )
+    # Outside the plasma, both branches are the vacuum dispersion relation
+    assert branches["H_discriminant"][-1] == 0.0
+    assert branches["H"][-1] == branches["H_other"][-1]
+
+
+def test_discriminant_near_plasma_edge():
+    """The discriminant is calculated in factorised form, which should
+    agree with beta**2 - 4 * alpha * gamma, but without the
+    cancellation between the two at low density that swamps the finite
+    difference derivatives just inside the plasma"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    density = kwargs_dict["density_fit_method"]
+    angular_frequency = freq_GHz_to_angular_frequency(kwargs_dict["launch_freq_GHz"])
+    args = (field, angular_frequency, 1, density, -1e-4, 1e-4, 0.1, 0.1, 0.1)
+    H = Hamiltonian(*args)
+
+    q_R = np.array([1.7, 1.85, 1.9999, 1.99999])
+    q_Z = np.array([0.1, -0.05, 0.0, 0.0])
+    K_R = np.array([-900.0, -600.0, -1150.0, -1150.0])
+    K_zeta = np.array([80.0, 0.0, 0.0, 0.0])
+    K_Z = np.array([-50.0, 20.0, -60.0, -60.0])
+
+    spatial = H.spatial_terms(q_R, q_Z)
+    terms = H.dispersion_terms(spatial, q_R, K_R, K_zeta, K_Z)
+    epsilon = DielectricTensor(
+        spatial["electron_density"], angular_frequency, spatial["B_total"]
+    )
+    Booker_gamma = epsilon.e_bb * (epsilon.e_11**2 - epsilon.e_12**2)
+    # Well inside the plasma, where the two terms don't cancel
+    assert_allclose(
+        terms["H_discriminant"][:2],
+        (terms["Booker_beta"] ** 2 - 4 * terms["Booker_alpha"] * Booker_gamma)[:2],
+        rtol=1e-10,
+    )
+
+    # Just inside the edge, the derivatives with respect to K_zeta
+    # are small and only come from the discriminant
+    expected = Hamiltonian(*args, derivative_method="analytic").derivatives(
+        q_R, q_Z, K_R, K_zeta, K_Z
+    )
+    dH = H.derivatives(q_R, q_Z, K_R, K_zeta, K_Z)
+    assert_allclose(dH["dH_dKzeta"], expected["dH_dKzeta"], rtol=1e-4)
+
+
+@pytest.mark.parametrize("derivative_method", DERIVATIVE_METHODS)
+def test_frequency_batch(derivative_method):
+    """A batch of frequencies and modes should match separate Hamiltonians"""
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    field = create_magnetic_geometry(**kwargs_dict)
+    density = kwargs_dict["density_fit_method"]
+    spacings = (1e-4, 1e-4, 0.1, 0.1, 0.1)
+    angular_frequency = freq_GHz_to_angular_frequency(np.array([40.0, 55.0, 70.0]))
+    mode_flag = np.array([1, -1, 1])
+
+    q_R = np.array([1.7, 1.85, 1.8])
+    q_Z = np.array([0.1, -0.05, 0.2])
+    K_R = np.array([-900.0, -600.0, 400.0])
+    K_zeta = 0.0
+    K_Z = np.array([-50.0, 20.0, 100.0])
+
+    H_batch = Hamiltonian(
+        field,
+        angular_frequency,
+        mode_flag,
+        density,
+        *spacings,
+        derivative_method=derivative_method,
+    )
+    H = H_batch(q_R, q_Z, K_R, K_zeta, K_Z)
+    dH = H_batch.derivatives(q_R, q_Z, K_R, K_zeta, K_Z, second_order=True)
+    branches = H_batch.mode_branches(q_R, q_Z, K_R, K_zeta, K_Z)
+
+    for index in range(len(q_R)):
+        H_single = Hamiltonian(
+            field,
+            angular_frequency[index],
+            mode_flag[index],
+            density,
+            *spacings,
+            derivative_method=derivative_method,
+        )
+        point = (q_R[index], q_Z[index], K_R[index], K_zeta, K_Z[index])
+        assert_allclose(H[index], H_single(*point))
+        assert_allclose(
+            branches["H_other"][index], H_single.mode_branches(*point)["H_other"]
+        )
+        for name, value in H_single.derivatives(*point, second_order=True).items():
+            # Allow for rounding differences, amplified by finite differences
+            assert_allclose(dH[name][index], value, rtol=1e-6, atol=1e-8, err_msg=name)
+
+    # A single point can be evaluated at all of the frequencies
+    dH_single_point = H_batch.derivatives(1.7, 0.1, -900.0, 0.0, -50.0)
+    assert dH_single_point["dH_dR"].shape == (3,)
+    assert_allclose(dH_single_point["dH_dR"][0], dH["dH_dR"][0])
@@ -0,0 +1,237 @@
+from scotty import numba_backend
+from scotty.numba_backend import (
+    CompiledHamiltonian,
+    bispev,
+    make_hamiltonian,
+    splev,
+)
+from scotty.hamiltonian import Hamiltonian
+from scotty.geometry import (
+    CircularCrossSectionField,
+    ConstantCurrentDensityField,
+    CurvySlabField,
+    EFITField,
+    InterpolatedField,
+)
+from scotty.density_fit import (
+    PolynomialFit,
+    QuadraticFit,
+    SmoothingSplineFit,
+    StefanikovaFit,
+    TanhFit,
+)
+from scotty.fun_evolution import beam_evolution_fun, pack_beam_parameters
+from scotty.fun_general import (
+    find_Booker_alpha,
+    find_Booker_beta,
+    find_Booker_gamma,
+    find_H_numba,
+)
+
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy.interpolate import RectBivariateSpline, UnivariateSpline
+
+import pytest
+
+pytest.importorskip("numba")
+
+
+ANGULAR_FREQUENCY = 2 * np.pi * 55e9
+SPACINGS = (-1e-4, 1e-4, 0.1, 0.1, 0.1)
+
+# Points inside the plasma, near the cut-off of the circular equilibrium
+Q_R = np.array([1.85, 1.9, 1.95])
+Q_Z = np.array([0.1, -0.05, 0.0])
+K_R_VALUES = np.array([-900.0, -1100.0, -500.0])
+K_ZETA = 0.0
+K_Z_VALUES = np.array([10.0, 30.0, -50.0])
+
+
+def circular_grids():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    R = np.linspace(0.9, 2.1, 61)
+    Z = np.linspace(-0.6, 0.6, 63)
+    R_grid, Z_grid = np.meshgrid(R, Z, indexing="ij")
+    return field, R, Z, R_grid, Z_grid
+
+
+def interpolated_field():
+    field, R, Z, R_grid, Z_grid = circular_grids()
+    return InterpolatedField(
+        R,
+        Z,
+        field.B_R(R_grid, Z_grid),
+        field.B_T(R_grid, Z_grid),
+        field.B_Z(R_grid, Z_grid),
+        field.poloidal_flux(R_grid, Z_grid),
+    )
+
+
+def efit_field():
+    field, R, Z, R_grid, Z_grid = circular_grids()
+    psi = np.linspace(0, 1.5, 31)
+    return EFITField(
+        R,
+        Z,
+        rBphi=1.5 * (1.0 + 0.1 * psi),
+        psi_norm_2D=field.poloidal_flux(R_grid, Z_grid),
+        psi_unnorm_axis=0.0,
+        psi_unnorm_boundary=1.0,
+        psi_norm_1D=psi,
+        interp_order=3,
+    )
+
+
+def spline_density():
+    psi = np.linspace(0, 1.0, 50)
+    return SmoothingSplineFit(1.0, psi, 2.0 * (1 - psi**2), order=3, smoothing=0)
+
+
+def test_splines():
+    x = np.linspace(0, 1, 11)
+    y = np.linspace(-1, 2, 13)
+    data = np.sin(3 * x)[:, np.newaxis] * np.cos(y)[np.newaxis, :]
+    spline_2D = RectBivariateSpline(x, y, data, kx=3, ky=5)
+    spline_1D = UnivariateSpline(x, np.exp(x), k=3, s=0, ext=0)
+    tx, ty, c = spline_2D.tck
+    t, c_1D, k = spline_1D._eval_args
+
+    # Includes points outside the domain, where the bivariate spline
+    # is clamped and the univariate one extrapolated
+    points_x = np.linspace(-0.2, 1.3, 17)
+    points_y = np.linspace(-1.3, 2.4, 17)
+    expected_2D = spline_2D(points_x, points_y, grid=False)
+    expected_1D = spline_1D(points_x)
+    for x, y, value_2D, value_1D in zip(points_x, points_y, expected_2D, expected_1D):
+        assert np.isclose(bispev(tx, ty, c, 3, 5, x, y), value_2D, rtol=1e-12)
+        assert np.isclose(splev(t, c_1D, k, x), value_1D, rtol=1e-12)
+
+
+@pytest.mark.parametrize(
+    "field",
+    [
+        pytest.param(CircularCrossSectionField(1.0, 1.5, 0.5, 0.1), id="circular"),
+        pytest.param(ConstantCurrentDensityField(1.0, 1.5, 0.5, 0.1), id="constant"),
+        pytest.param(interpolated_field(), id="interpolated"),
+        pytest.param(efit_field(), id="efit"),
+    ],
+)
+@pytest.mark.parametrize(
+    "density_fit",
+    [
+        pytest.param(QuadraticFit(1.0, 2.0), id="quadratic"),
+        pytest.param(TanhFit(1.0, 2.0, -2.0), id="tanh"),
+        pytest.param(PolynomialFit(1.0, -3.1, 3.3, -1.55, 2.0), id="polynomial"),
+        pytest.param(spline_density(), id="spline"),
+    ],
+)
+def test_compiled_hamiltonian(field, density_fit):
+    args = (field, ANGULAR_FREQUENCY, 1, density_fit) + SPACINGS
+    compiled = CompiledHamiltonian(*args)
+    hamiltonian = Hamiltonian(*args)
+
+    coords = (Q_R, Q_Z, K_R_VALUES, K_ZETA, K_Z_VALUES)
+    assert_allclose(compiled(*coords), hamiltonian(*coords), rtol=1e-10)
+    # Scalars keep their shape
+    assert compiled(1.9, 0.0, -900.0, 0.0, 0.0).shape == ()
+
+    dH = compiled.derivatives(*coords, second_order=True)
+    expected = hamiltonian.derivatives(*coords, second_order=True)
+    assert dH.keys() == expected.keys()
+    for key, value in expected.items():
+        # Finite differences amplify the rounding differences in H,
+        # especially for the mixed (q, K) derivatives
+        atol = 1e-6 * np.max(np.abs(value)) + 1e-10
+        assert_allclose(dH[key], value, rtol=1e-4, atol=atol, err_msg=key)
+
+    required = {"dH_dR", "d2H_dKR2"}
+    assert compiled.derivatives(*coords, required=required).keys() == required
+
+    Psi = np.array(
+        [[10 + 2j, 0.1 + 0.5j, 1 - 1j], [0.1 + 0.5j, 20 + 3j, 0.2], [1 - 1j, 0.2, 30j]]
+    )
+    for q_R, q_Z, K_R, K_Z in zip(Q_R, Q_Z, K_R_VALUES, K_Z_VALUES):
+        beam_parameters = pack_beam_parameters(q_R, 0.1, q_Z, K_R, K_Z, Psi)
+        result = compiled.beam_evolution_fun(0.0, beam_parameters, K_ZETA)
+        expected = beam_evolution_fun(0.0, beam_parameters, K_ZETA, hamiltonian)
+        assert_allclose(result, expected, rtol=1e-4, atol=1e-6 * np.max(expected))
+
+
+def test_make_hamiltonian(monkeypatch):
+    args = (CircularCrossSectionField(1.0, 1.5, 0.5, 0.1), ANGULAR_FREQUENCY, 1)
+    args_quadratic = args + (QuadraticFit(1.0, 2.0),) + SPACINGS
+
+    hamiltonian = make_hamiltonian(*args_quadratic, backend="numba")
+    assert isinstance(hamiltonian, CompiledHamiltonian)
+    hamiltonian = make_hamiltonian(*args_quadratic)
+    assert type(hamiltonian) is Hamiltonian
+
+    with pytest.raises(ValueError):
+        make_hamiltonian(*args_quadratic, backend="fortran")
+
+    stefanikova = StefanikovaFit(1.0, 2.0, 1.0, 1.2, 1.0, 1.1, 0.8, 0.3, 0.9)
+    with pytest.warns(UserWarning, match="StefanikovaFit"):
+        hamiltonian = make_hamiltonian(*args, stefanikova, *SPACINGS, backend="numba")
+    assert type(hamiltonian) is Hamiltonian
+
+    with pytest.warns(UserWarning, match="CurvySlabField"):
+        make_hamiltonian(
+            CurvySlabField(1.0, 1.5),
+            ANGULAR_FREQUENCY,
+            1,
+            QuadraticFit(1.0, 2.0),
+            *SPACINGS,
+            backend="numba",
+        )
+
+    with pytest.warns(UserWarning, match="analytic"):
+        hamiltonian = make_hamiltonian(
+            *args_quadratic, derivative_method="analytic", backend="numba"
+        )
+    assert hamiltonian.derivative_method == "analytic"
+
+    with pytest.warns(UserWarning, match="single frequency"):
+        hamiltonian = make_hamiltonian(
+            args[0],
+            np.array([1.0, 2.0]) * ANGULAR_FREQUENCY,
+            1,
+            QuadraticFit(1.0, 2.0),
+            *SPACINGS,
+            backend="numba",
+        )
+    assert type(hamiltonian) is Hamiltonian
+
+    monkeypatch.setattr(numba_backend, "HAS_NUMBA", False)
+    with pytest.warns(UserWarning, match="not installed"):
+        hamiltonian = make_hamiltonian(*args_quadratic, backend="numba")
+    assert type(hamiltonian) is Hamiltonian
+
+
+def test_find_H_numba():
+    K_magnitude = np.array([1000.0, 800.0, 500.0])
+    electron_density = np.array([0.0, 1.0, 2.5])
+    B_total = np.array([0.8, 0.9, 1.0])
+    sin_theta_m_sq = np.array([0.0, 0.01, 0.2])
+
+    alpha = find_Booker_alpha(
+        electron_density, B_total, sin_theta_m_sq, ANGULAR_FREQUENCY
+    )
+    beta = find_Booker_beta(
+        electron_density, B_total, sin_theta_m_sq, ANGULAR_FREQUENCY
+    )
+    gamma = find_Booker_gamma(electron_density, B_total, ANGULAR_FREQUENCY)
+    wavenumber_K0 = ANGULAR_FREQUENCY / 299792458.0
+    expected = (K_magnitude / wavenumber_K0) ** 2 + (
+        beta + np.sqrt(np.maximum(beta**2 - 4 * alpha * gamma, 0))
+    ) / (2 * alpha)
+
+    result = find_H_numba(
+        K_magnitude,
+        electron_density,
+        B_total,
+        sin_theta_m_sq,
+        ANGULAR_FREQUENCY,
+        -1,
+    )
+    assert_allclose(result, expected, rtol=1e-10)
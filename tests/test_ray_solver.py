@@ -0,0 +1,135 @@
+from scotty.beam_me_up import beam_me_up
+from scotty.density_fit import QuadraticFit
+from scotty.geometry import CircularCrossSectionField
+from scotty.hamiltonian import Hamiltonian
+from scotty.init_bruv import get_parameters_for_Scotty
+from scotty.ray_solver import (
+    RayEvaluationCache,
+    make_solver_events,
+    propagate_ray,
+    ray_evolution_2D_fun,
+)
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+
+def test_ray_evaluation_cache():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    angular_frequency = 2 * np.pi * 55e9
+    hamiltonian = Hamiltonian(
+        field, angular_frequency, 1, QuadraticFit(1.0, 4.0), -1e-4, 1e-4, 0.1, 0.1, 0.1
+    )
+    K_zeta = 10.0
+    ray_parameters_2D = np.array([1.85, 0.1, -900.0, 10.0])
+
+    cache = RayEvaluationCache(field)
+    events = make_solver_events(1.0, angular_frequency, field, cache)
+    uncached_events = make_solver_events(1.0, angular_frequency, field)
+
+    assert_array_equal(
+        ray_evolution_2D_fun(0.0, ray_parameters_2D, K_zeta, hamiltonian, cache),
+        ray_evolution_2D_fun(0.0, ray_parameters_2D, K_zeta, hamiltonian),
+    )
+    assert cache.evaluations == 1
+
+    # The events at the same state reuse the right-hand side
+    for name, event in events.items():
+        assert_allclose(
+            event(0.0, ray_parameters_2D, K_zeta, hamiltonian),
+            uncached_events[name](0.0, ray_parameters_2D, K_zeta, hamiltonian),
+            err_msg=name,
+        )
+    assert cache.evaluations == 1
+    assert cache.poloidal_flux(ray_parameters_2D) == field.poloidal_flux(1.85, 0.1)
+
+    events["reach_K_min"](0.0, ray_parameters_2D + 1e-3, K_zeta, hamiltonian)
+    assert cache.evaluations == 2
+
+
+def test_leave_simulation_event():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    event = make_solver_events(1.0, 2 * np.pi * 55e9, field)["leave_simulation"]
+
+    # Signed distance to the bounding box, continuous across it
+    q_R = np.linspace(field.R_coord.max() - 0.1, field.R_coord.max() + 0.1, 5)
+    distance = [event(0.0, [R, 0.0, 0.0, 0.0], 0.0, None) for R in q_R]
+    assert_allclose(distance, [0.1, 0.05, 0.0, -0.05, -0.1], atol=1e-12)
+
+
+def test_max_step(tmp_path):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    kwargs_dict["detailed_analysis_flag"] = False
+    kwargs_dict["output_path"] = tmp_path
+
+    expected = beam_me_up(**kwargs_dict)
+    with np.load(tmp_path / "data_output.npz") as f:
+        expected_tau = f["tau_array"][-1]
+    relaxed = beam_me_up(**kwargs_dict, max_step=np.inf)
+    with np.load(tmp_path / "data_output.npz") as f:
+        # The last point is a fixed fraction of where the ray leaves
+        assert_allclose(f["tau_array"][-1], expected_tau, rtol=1e-3)
+    assert_allclose(relaxed.tau_cutoff, expected.tau_cutoff, rtol=1e-2)
+
+
+def test_propagate_ray_cold_cutoff(capsys):
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    angular_frequency = 2 * np.pi * 55e9
+    hamiltonian = Hamiltonian(
+        field, angular_frequency, 1, QuadraticFit(1.0, 4.0), -1e-4, 1e-4, 0.1, 0.1, 0.1
+    )
+    initial_position = np.array([1.999, 0.0, 0.05])
+    K_initial = np.array([-1150.0, 0.0, -60.0])
+
+    tau_leave, tau_points = propagate_ray(
+        1.0,
+        angular_frequency,
+        field,
+        initial_position,
+        K_initial,
+        hamiltonian,
+        1e-3,
+        1e-6,
+        False,
+        10,
+        verbose=False,
+    )
+    # Without a warm start, the cut-off is still found by solving for
+    # the ray again near it, as before warm starts were added
+    assert "cut-off finder" in capsys.readouterr().out
+    assert_allclose(tau_leave, 984.9520710760107, rtol=1e-9)
+    assert_allclose(
+        tau_points,
+        [
+            0.0,
+            109.43911900844563,
+            218.87823801689126,
+            328.3173570253369,
+            437.7564760337825,
+            492.97617975964357,
+            547.1955950422282,
+            656.6347140506738,
+            766.0738330591194,
+            875.512952067565,
+        ],
+        rtol=1e-9,
+    )
+
+    _, tau_points_events = propagate_ray(
+        1.0,
+        angular_frequency,
+        field,
+        initial_position,
+        K_initial,
+        hamiltonian,
+        1e-3,
+        1e-6,
+        False,
+        10,
+        verbose=False,
+        cutoff_from_events=True,
+    )
+    assert "cut-off finder" not in capsys.readouterr().out
+    assert_allclose(tau_points_events, tau_points, rtol=1e-3)
@@ -5,13 +5,13 @@ from scotty.beam_me_up import (
 )
 from scotty.init_bruv import get_parameters_for_Scotty
 from scotty.torbeam import Torbeam
-from scotty.geometry import CircularCrossSectionField
+from scotty.geometry import CircularCrossSectionField, MagneticField
 from scotty.fun_general import (
     freq_GHz_to_angular_frequency,
     angular_frequency_to_wavenumber,
 )
 from scotty.hamiltonian import Hamiltonian
-from scotty.launch import find_entry_point, launch_beam
+from scotty.launch import PlasmaBoundary, find_entry_point, launch_beam, launch_beams
 
 import json
 import numpy as np
@@ -221,6 +221,55 @@ def simple(path):
     return kwargs_dict
 
 
+def simple_analytic(path):
+    """Built-in synthetic diagnostic, with analytic derivatives of H"""
+    kwargs_dict = simple(path)
+    kwargs_dict["derivative_method"] = "analytic"
+    return kwargs_dict
+
+
+def simple_autodiff(path):
+    """Built-in synthetic diagnostic, with automatic differentiation of H"""
+    kwargs_dict = simple(path)
+    kwargs_dict["derivative_method"] = "autodiff"
+    return kwargs_dict
+
+
+def simple_numba(path):
+    """Built-in synthetic diagnostic, with the compiled backend"""
+    kwargs_dict = simple(path)
+    kwargs_dict["backend"] = "numba"
+    return kwargs_dict
+
+
+def simple_native_rk45(path):
+    """Built-in synthetic diagnostic, with Scotty's own RK45 integrator"""
+    kwargs_dict = simple(path)
+    kwargs_dict["integrator"] = "RK45"
+    return kwargs_dict
+
+
+def simple_dop853(path):
+    """Built-in synthetic diagnostic, integrated with DOP853"""
+    kwargs_dict = simple(path)
+    kwargs_dict["integrator"] = "DOP853"
+    return kwargs_dict
+
+
+def simple_single_pass(path):
+    """Built-in synthetic diagnostic, without a separate ray solve"""
+    kwargs_dict = simple(path)
+    kwargs_dict["single_pass"] = True
+    return kwargs_dict
+
+
+def simple_linearised(path):
+    """Built-in synthetic diagnostic, integrating Psi as P Q^-1"""
+    kwargs_dict = simple(path)
+    kwargs_dict["Psi_formulation"] = "linearised"
+    return kwargs_dict
+
+
 def ne_dat_file(path):
     """Density fit using TORBEAM file"""
     kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
@@ -422,6 +471,13 @@ def UDA_saved_MAST_U(path: pathlib.Path):
     "generator",
     [
         pytest.param(simple, id="simple"),
+        pytest.param(simple_analytic, id="simple-analytic"),
+        pytest.param(simple_autodiff, id="simple-autodiff"),
+        pytest.param(simple_numba, id="simple-numba"),
+        pytest.param(simple_native_rk45, id="simple-native-rk45"),
+        pytest.param(simple_dop853, id="simple-dop853"),
+        pytest.param(simple_single_pass, id="simple-single-pass"),
+        pytest.param(simple_linearised, id="simple-linearised"),
         pytest.param(ne_dat_file, id="density-fit-file"),
         pytest.param(torbeam_file, id="torbeam-file"),
         pytest.param(npz_file, id="test-file"),
@@ -543,6 +599,21 @@ def test_EFIT_geometry(tmp_path):
     assert total_sign[-1, -1] == -1, "Bottom right"
 
 
+def test_EFIT_derivatives(tmp_path):
+    kwargs_dict = UDA_saved(tmp_path)
+    field = create_magnetic_geometry(**kwargs_dict)
+
+    R = np.linspace(1.6, 2.0, 5)
+    Z = np.linspace(-0.2, 0.2, 5)
+    derivatives = field.derivatives(R, Z)
+    # Compare spline derivatives with finite differences of the splines
+    expected = MagneticField.derivatives(field, R, Z)
+
+    assert derivatives.keys() == expected.keys()
+    for key, value in expected.items():
+        assert_allclose(derivatives[key], value, rtol=1e-4, atol=1e-5, err_msg=key)
+
+
 @pytest.mark.parametrize(
     "generator",
     [
@@ -677,6 +748,75 @@ def test_launch_golden_answer(tmp_path, generator):
     assert_allclose(Psi_3D_lab_initial, expected_Psi_3D_lab_initial, tol, atol=0.1)
 
 
+@pytest.mark.parametrize("derivative_method", ["finite-difference", "analytic"])
+def test_launch_beams(tmp_path, derivative_method):
+    args = simple(tmp_path)
+    field = create_magnetic_geometry(**args)
+
+    toroidal_angles = np.array([0.0, -2.0, 3.0])
+    poloidal_angles = np.array([6.0, 2.0, 4.0])
+    widths = np.array([0.04, 0.05, 0.06])
+    curvatures = np.array([-0.25, -0.5, 0.0])
+    frequencies = freq_GHz_to_angular_frequency(np.array([50.0, 55.0, 60.0]))
+
+    def make_hamiltonian(frequency):
+        return Hamiltonian(
+            field,
+            frequency,
+            mode_flag=args["mode_flag"],
+            density_fit=args["density_fit_method"],
+            delta_R=-1e-4,
+            delta_Z=1e-4,
+            delta_K_R=0.1,
+            delta_K_zeta=0.1,
+            delta_K_Z=0.1,
+            derivative_method=derivative_method,
+        )
+
+    launch = launch_beams(
+        toroidal_angles,
+        poloidal_angles,
+        widths,
+        curvatures,
+        args["launch_position"],
+        frequencies,
+        field,
+        make_hamiltonian(frequencies),
+    )
+    assert launch[0].shape == (3, 3)
+    assert launch[3].shape == (3, 3, 3)
+
+    for beam in range(3):
+        expected = launch_beam(
+            toroidal_angles[beam],
+            poloidal_angles[beam],
+            widths[beam],
+            curvatures[beam],
+            args["launch_position"],
+            frequencies[beam],
+            field,
+            make_hamiltonian(frequencies[beam]),
+        )
+        # Each beam of a batch is launched exactly as on its own
+        for vector in (0, 1, 2):
+            assert_array_equal(launch[vector][:, beam], expected[vector])
+        for matrix in (3, 4, 5, 6):
+            assert_array_equal(launch[matrix][beam], expected[matrix])
+        assert_array_equal(launch[7][beam], expected[7])
+
+    with pytest.raises(RuntimeError, match=r"Beams \[1\] do not hit plasma"):
+        launch_beams(
+            toroidal_angles,
+            np.array([6.0, -60.0, 4.0]),
+            widths,
+            curvatures,
+            args["launch_position"],
+            frequencies,
+            field,
+            make_hamiltonian(frequencies),
+        )
+
+
 def launch_parameters(start_point, end_point_poloidal_coords):
     kwargs_dict = simple(None)
     rho_end, theta_end, zeta_end = end_point_poloidal_coords
@@ -696,6 +836,32 @@ def launch_parameters(start_point, end_point_poloidal_coords):
     return start_point, -phi_p, phi_t, expected_entry_cartesian
 
 
+ENTRY_POINTS = (
+    pytest.param([2.5, 0, 0], 0, 0, [2.0, 0.0, 0], id="outboard-midplane"),
+    pytest.param([0.5, 0, 0], 0, np.pi, [1.0, 0, 0], id="inboard-midplane"),
+    pytest.param([1.5, 0, 1], np.pi / 2, 0, [1.5, 0, 0.5], id="top"),
+    pytest.param([1.5, 0, -1], -np.pi / 2, 0, [1.5, 0, -0.5], id="bottom"),
+    pytest.param(
+        [2, 0, 0.5],
+        np.pi / 4,
+        0,
+        [1.5 + np.sqrt(0.5) / 2, 0, np.sqrt(0.5) / 2],
+        id="top-right",
+    ),
+    pytest.param(
+        [2, 0, -0.5],
+        -np.pi / 4,
+        0,
+        [1.5 + np.sqrt(0.5) / 2, 0, -np.sqrt(0.5) / 2],
+        id="bottom-right",
+    ),
+    pytest.param(
+        *launch_parameters((2.5, 0.0, -0.1), (1, np.pi / 4, np.pi / 8)),
+        id="steep-angle",
+    ),
+)
+
+
 @pytest.mark.parametrize(
     "generator",
     [
@@ -712,30 +878,7 @@ def launch_parameters(start_point, end_point_poloidal_coords):
         "toroidal_launch_angle",
         "expected_entry",
     ),
-    (
-        pytest.param([2.5, 0, 0], 0, 0, [2.0, 0.0, 0], id="outboard-midplane"),
-        pytest.param([0.5, 0, 0], 0, np.pi, [1.0, 0, 0], id="inboard-midplane"),
-        pytest.param([1.5, 0, 1], np.pi / 2, 0, [1.5, 0, 0.5], id="top"),
-        pytest.param([1.5, 0, -1], -np.pi / 2, 0, [1.5, 0, -0.5], id="bottom"),
-        pytest.param(
-            [2, 0, 0.5],
-            np.pi / 4,
-            0,
-            [1.5 + np.sqrt(0.5) / 2, 0, np.sqrt(0.5) / 2],
-            id="top-right",
-        ),
-        pytest.param(
-            [2, 0, -0.5],
-            -np.pi / 4,
-            0,
-            [1.5 + np.sqrt(0.5) / 2, 0, -np.sqrt(0.5) / 2],
-            id="bottom-right",
-        ),
-        pytest.param(
-            *launch_parameters((2.5, 0.0, -0.1), (1, np.pi / 4, np.pi / 8)),
-            id="steep-angle",
-        ),
-    ),
+    ENTRY_POINTS,
 )
 def test_find_entry_point(
     tmp_path,
@@ -760,6 +903,51 @@ def test_find_entry_point(
     assert_allclose(entry_position, expected_entry, 1e-6, 1e-6)
 
 
+@pytest.mark.parametrize(
+    "generator",
+    [
+        pytest.param(simple, id="simple"),
+        pytest.param(torbeam_file, id="torbeam-file"),
+    ],
+)
+def test_plasma_boundary(tmp_path, generator):
+    args = generator(tmp_path)
+    field = create_magnetic_geometry(**args)
+    boundary = PlasmaBoundary(field, args["poloidal_flux_enter"])
+
+    launch_position, poloidal_launch_angle, toroidal_launch_angle, expected_entry = (
+        np.array(values, dtype=float)
+        for values in zip(*(param.values for param in ENTRY_POINTS))
+    )
+    # Plus one that misses the plasma entirely
+    launch_position = np.vstack((launch_position, [2.5, 0, 0]))
+    poloidal_launch_angle = np.append(poloidal_launch_angle, -np.pi / 2)
+    toroidal_launch_angle = np.append(toroidal_launch_angle, 0)
+
+    entry_points = boundary.entry_points(
+        launch_position, poloidal_launch_angle, toroidal_launch_angle
+    )
+    assert entry_points.shape == (3, len(ENTRY_POINTS) + 1)
+    assert_allclose(entry_points[:, :-1].T, expected_entry, 1e-6, 1e-6)
+    assert np.all(np.isnan(entry_points[:, -1]))
+
+    # Each one is the same as launched on its own
+    for index, expected in enumerate(entry_points[:, :-1].T):
+        entry_point = find_entry_point(
+            launch_position[index],
+            poloidal_launch_angle[index],
+            toroidal_launch_angle[index],
+            args["poloidal_flux_enter"],
+            field,
+            boundary=boundary,
+        )
+        assert_array_equal(entry_point, expected)
+    with pytest.raises(RuntimeError, match="does not hit plasma"):
+        find_entry_point(
+            launch_position[-1], -np.pi / 2, 0, args["poloidal_flux_enter"], field
+        )
+
+
 @pytest.mark.parametrize(
     "generator",
     [pytest.param(simple, id="simple")],
@@ -0,0 +1,135 @@
+from scotty.beam_me_up import beam_me_up
+from scotty.density_fit import QuadraticFit
+from scotty.fun_evolution import BeamEvolution, pack_beam_parameters
+from scotty.geometry import CircularCrossSectionField
+from scotty.hamiltonian import Hamiltonian
+from scotty.init_bruv import get_parameters_for_Scotty
+from scotty.stiff import solve_switching
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from scipy.integrate import solve_ivp
+
+import pytest
+
+
+def van_der_pol(t, y, mu):
+    return np.array([y[1], mu * (1 - y[0] ** 2) * y[1] - y[0]])
+
+
+def van_der_pol_jacobian(t, y, mu):
+    return np.array([[0, 1], [-2 * mu * y[0] * y[1] - 1, mu * (1 - y[0] ** 2)]])
+
+
+def test_beam_evolution_jacobian():
+    field = CircularCrossSectionField(1.0, 1.5, 0.5, 0.1)
+    hamiltonian = Hamiltonian(
+        field,
+        2 * np.pi * 55e9,
+        -1,
+        QuadraticFit(1.0, 4.0),
+        -1e-4,
+        1e-4,
+        0.1,
+        0.1,
+        0.1,
+        derivative_method="analytic",
+    )
+    Psi = np.array(
+        [[10 + 2j, 0.1 + 0.5j, 1 - 1j], [0.1 + 0.5j, 20 + 3j, 0.2], [1 - 1j, 0.2, 30j]]
+    )
+    beam_parameters = pack_beam_parameters(1.85, 0.1, 0.05, -900.0, 10.0, Psi)
+    evolution = BeamEvolution(hamiltonian, 10.0)
+
+    jacobian = evolution.jacobian(0.0, beam_parameters)
+
+    steps = np.concatenate(([1e-5, 1e-5, 1e-5, 1e-2, 1e-2], np.full(12, 1e-2)))
+    expected = np.empty((17, 17))
+    for column, step in enumerate(steps):
+        forward = beam_parameters.copy()
+        forward[column] += step
+        backward = beam_parameters.copy()
+        backward[column] -= step
+        expected[:, column] = (evolution(0.0, forward) - evolution(0.0, backward)) / (
+            2 * step
+        )
+
+    scale = np.max(np.abs(expected), axis=1, keepdims=True)
+    # Only the dependence of Psi on the ray uses finite differences
+    structured = np.ones((17, 17), dtype=bool)
+    structured[5:, [0, 2, 3, 4]] = False
+    error = np.abs(jacobian - expected) / scale
+    assert np.max(error[structured]) < 1e-6
+    assert np.max(error) < 1e-2
+    assert_array_equal(jacobian[:5, 5:], 0.0)
+
+
+def test_solve_switching():
+    t_eval = np.linspace(0, 10, 11)
+
+    solution = solve_switching(
+        van_der_pol, [0, 10], [2.0, 0.0], t_eval, van_der_pol_jacobian, (1.0,)
+    )
+    expected = solve_ivp(van_der_pol, [0, 10], [2.0, 0.0], t_eval=t_eval, args=(1.0,))
+    assert solution.t_switch is None
+    assert solution.nfev == expected.nfev
+    assert_array_equal(solution.y, expected.y)
+
+    mu = 1000.0
+    t_eval = np.linspace(0, 300, 31)
+    solution = solve_switching(
+        van_der_pol,
+        [0, 300],
+        [2.0, 0.0],
+        t_eval,
+        van_der_pol_jacobian,
+        (mu,),
+        rtol=1e-6,
+        atol=1e-8,
+        dense_output=True,
+    )
+    expected = solve_ivp(
+        van_der_pol,
+        [0, 300],
+        [2.0, 0.0],
+        method="Radau",
+        t_eval=t_eval,
+        jac=van_der_pol_jacobian,
+        args=(mu,),
+        rtol=1e-10,
+        atol=1e-12,
+    )
+    assert solution.status == 0
+    assert solution.t_switch < 1.0
+    assert solution.nfev < 50000
+    assert_allclose(solution.y, expected.y, atol=1e-5)
+    assert_allclose(solution.sol(t_eval), solution.y)
+
+    with pytest.raises(ValueError):
+        solve_switching(van_der_pol, [0, 1], [2.0, 0.0], stiff_method="RK23")
+
+
+@pytest.mark.parametrize("integrator", ["Radau", "BDF", "LSODA", "auto"])
+def test_beam_me_up_stiff(tmp_path, integrator):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    kwargs_dict["detailed_analysis_flag"] = False
+    kwargs_dict["len_tau"] = 20
+
+    outputs = {}
+    for name in ("solve_ivp", integrator):
+        path = tmp_path / name
+        path.mkdir()
+        beam_me_up(**kwargs_dict, integrator=name, output_path=path)
+        with np.load(path / "data_output.npz") as f:
+            outputs[name] = dict(f)
+
+    expected = outputs["solve_ivp"]
+    result = outputs[integrator]
+    assert_allclose(result["tau_array"], expected["tau_array"])
+    for key in ("q_R_array", "q_Z_array", "K_R_array", "K_Z_array"):
+        assert_allclose(result[key], expected[key], rtol=1e-4, err_msg=key)
+    # Different methods with the default tolerances
+    Psi = expected["Psi_3D_output"]
+    assert_allclose(result["Psi_3D_output"], Psi, atol=2e-2 * np.max(np.abs(Psi)))
@@ -0,0 +1,117 @@
+from scotty.beam_me_up import scan_cutoffs
+from scotty.density_fit import QuadraticFit
+from scotty.geometry import CircularCrossSectionField
+from scotty.surrogate import (
+    SURROGATE_QUANTITIES,
+    CutoffSurrogate,
+    fingerprint,
+    load_or_build_surrogate,
+)
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import pytest
+
+
+LAUNCH_POSITION = np.array([2.587, 0.0, -0.0157])
+POLOIDAL_ANGLES = np.array([2.0, 4.0, 6.0])
+TOROIDAL_ANGLES = np.array([0.0])
+FREQUENCIES = np.array([50.0, 55.0, 60.0])
+
+
+@pytest.fixture
+def field():
+    return CircularCrossSectionField(
+        B_T_axis=1.0, R_axis=1.5, minor_radius_a=0.5, B_p_a=0.1
+    )
+
+
+@pytest.fixture
+def density_fit():
+    return QuadraticFit(1.0, ne_0=4.0)
+
+
+def build(filename, field, density_fit, **kwargs):
+    return load_or_build_surrogate(
+        filename,
+        POLOIDAL_ANGLES,
+        TOROIDAL_ANGLES,
+        FREQUENCIES,
+        1,
+        LAUNCH_POSITION,
+        field,
+        density_fit,
+        **kwargs,
+    )
+
+
+def test_cutoff_surrogate(tmp_path, field, density_fit):
+    surrogate = build(tmp_path / "cutoffs.npz", field, density_fit)
+
+    # Exact at the grid points
+    cutoffs = surrogate(
+        POLOIDAL_ANGLES[:, np.newaxis], TOROIDAL_ANGLES, FREQUENCIES[np.newaxis, :]
+    )
+    assert cutoffs.q_R.shape == (3, 3)
+    for name in SURROGATE_QUANTITIES:
+        assert_allclose(
+            getattr(cutoffs, name), surrogate.table[name][:, 0, :], err_msg=name
+        )
+
+    # Within the estimated error between them
+    poloidal_angle = np.array([3.0, 5.0, 3.5])
+    frequency = np.array([52.5, 57.5, 58.0])
+    estimate = surrogate(poloidal_angle, 0.0, frequency)
+    error = surrogate.error_estimate(poloidal_angle, 0.0, frequency)
+    expected = scan_cutoffs(
+        poloidal_angle,
+        0.0,
+        frequency,
+        1,
+        LAUNCH_POSITION,
+        find_B_method=field,
+        density_fit_method=density_fit,
+    )
+    for name in SURROGATE_QUANTITIES:
+        assert np.all(
+            np.abs(getattr(estimate, name) - getattr(expected, name))
+            <= 3 * getattr(error, name) + 1e-6
+        ), name
+
+    with pytest.raises(ValueError):
+        surrogate(10.0, 0.0, 50.0)
+
+
+def test_surrogate_invalidated(tmp_path, field, density_fit, capsys):
+    filename = tmp_path / "cutoffs.npz"
+    surrogate = build(filename, field, density_fit)
+    assert surrogate.matches(field, density_fit)
+    assert "Building cut-off surrogate" in capsys.readouterr().out
+
+    # Loaded from the file rather than built again
+    build(filename, field, density_fit)
+    assert "Building cut-off surrogate" not in capsys.readouterr().out
+
+    loaded = CutoffSurrogate.load(filename)
+    assert loaded.fingerprint == surrogate.fingerprint
+    assert_allclose(loaded(4.0, 0.0, 55.0).q_R, surrogate(4.0, 0.0, 55.0).q_R)
+
+    denser = QuadraticFit(1.0, ne_0=4.5)
+    assert fingerprint(field, denser) != surrogate.fingerprint
+    assert not surrogate.matches(field, denser)
+
+    rebuilt = build(filename, field, denser, verbose=False)
+    assert "Building cut-off surrogate" not in capsys.readouterr().out
+    assert rebuilt.fingerprint == fingerprint(field, denser)
+    assert not np.allclose(
+        rebuilt(4.0, 0.0, 55.0).K_norm_min, surrogate(4.0, 0.0, 55.0).K_norm_min
+    )
+    assert CutoffSurrogate.load(filename).fingerprint == rebuilt.fingerprint
+
+    # Different solver settings also need a new table
+    assert not rebuilt.matches(field, denser, rtol=1e-4)
+    loose = build(filename, field, denser, rtol=1e-4)
+    assert loose.settings != rebuilt.settings
+    assert loose.matches(field, denser, rtol=1e-4)
+    assert CutoffSurrogate.load(filename).settings == loose.settings
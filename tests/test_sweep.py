@@ -0,0 +1,54 @@
+from scotty.beam_me_up import beam_me_up
+from scotty.init_bruv import get_parameters_for_Scotty
+from scotty.sweep import SweepContinuation, WarmStart
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+def test_sweep_continuation():
+    continuation = SweepContinuation(scales=[1.0, 10.0])
+    assert continuation.nearest((0.0, 0.0)) is None
+
+    first = WarmStart(ray_first_step=1.0)
+    second = WarmStart(ray_first_step=2.0)
+    continuation.add((0.0, 50.0), first)
+    continuation.add((2.0, 55.0), second)
+    assert len(continuation) == 2
+    # Closer to the second without scaling
+    assert continuation.nearest((0.5, 53.0)) is first
+    assert continuation.nearest((1.8, 52.0)) is second
+
+
+def test_warm_start(tmp_path, capsys):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    kwargs_dict["detailed_analysis_flag"] = False
+    kwargs_dict["output_path"] = tmp_path
+
+    def run(poloidal_launch_angle, warm_start=None):
+        kwargs_dict["poloidal_launch_angle_Torbeam"] = poloidal_launch_angle
+        result = beam_me_up(**kwargs_dict, warm_start=warm_start)
+        with np.load(tmp_path / "data_output.npz") as f:
+            return result, dict(f)
+
+    warm_start, _ = run(4.0)
+    assert warm_start.ray_first_step > 0
+    assert warm_start.beam_first_step > 0
+    assert warm_start.tau_cutoff > 0
+
+    _, expected = run(4.5)
+    assert "cut-off finder" in capsys.readouterr().out
+    next_warm_start, result = run(4.5, warm_start)
+    assert "cut-off finder" not in capsys.readouterr().out
+
+    # The warm start is not modified
+    assert warm_start.tau_cutoff != next_warm_start.tau_cutoff
+    assert_allclose(next_warm_start.tau_cutoff, warm_start.tau_cutoff, rtol=0.1)
+
+    # The cut-off is found slightly differently
+    assert_allclose(result["tau_array"], expected["tau_array"], rtol=1e-3)
+    for key in ("q_R_array", "q_Z_array", "K_R_array", "K_Z_array"):
+        atol = 1e-4 * np.max(np.abs(expected[key]))
+        assert_allclose(result[key], expected[key], rtol=1e-3, atol=atol, err_msg=key)
@@ -0,0 +1,136 @@
+from scotty.beam_me_up import beam_me_up, create_magnetic_geometry
+from scotty.init_bruv import get_parameters_for_Scotty
+from scotty.trajectory import BeamTrajectory
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import pytest
+
+
+@pytest.mark.parametrize("single_pass", [False, True])
+def test_beam_trajectory(tmp_path, single_pass):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    kwargs_dict["len_tau"] = 200
+
+    beam_me_up(
+        **kwargs_dict,
+        single_pass=single_pass,
+        save_trajectory=True,
+        output_path=tmp_path,
+    )
+    with np.load(tmp_path / "data_output.npz") as f:
+        data_output = dict(f)
+    with np.load(tmp_path / "analysis_output.npz") as f:
+        distance_along_line = f["distance_along_line"]
+
+    trajectory = BeamTrajectory.load(tmp_path / "beam_trajectory.npz")
+    tau_array = data_output["tau_array"]
+    assert trajectory.tau_start <= tau_array[0]
+    assert trajectory.tau_end >= tau_array[-1]
+
+    resampled = trajectory.resample(tau_array)
+    for key, value in resampled.items():
+        assert_allclose(value, data_output[key], rtol=1e-10, atol=1e-12, err_msg=key)
+
+    # The analysis uses straight lines between the output points
+    arc_length = trajectory.arc_length(tau_array) - trajectory.arc_length(tau_array[0])
+    assert_allclose(arc_length, distance_along_line, rtol=1e-3, atol=1e-6)
+    assert_allclose(
+        trajectory.tau_at_arc_length(trajectory.arc_length(tau_array)), tau_array
+    )
+
+    field = create_magnetic_geometry(
+        "unit-tests",
+        B_T_axis=kwargs_dict["B_T_axis"],
+        B_p_a=kwargs_dict["B_p_a"],
+        R_axis=kwargs_dict["R_axis"],
+        minor_radius_a=kwargs_dict["minor_radius_a"],
+    )
+    poloidal_flux = 0.8
+    tau_crossings = trajectory.tau_at_poloidal_flux(field, poloidal_flux)
+    assert len(tau_crossings) == 2
+    q_R, _, q_Z = trajectory(tau_crossings)[:3]
+    assert_allclose(field.poloidal_flux(q_R, q_Z), poloidal_flux)
+
+
+def test_adaptive_output_sampling(tmp_path):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+
+    def cumulative_localisation(output_sampling, len_tau):
+        path = tmp_path / f"{output_sampling}_{len_tau}"
+        path.mkdir()
+        beam_me_up(
+            **kwargs_dict,
+            len_tau=len_tau,
+            output_sampling=output_sampling,
+            save_trajectory=True,
+            output_path=path,
+        )
+        with np.load(path / "analysis_output.npz") as f:
+            return f["distance_along_line"], f["cum_loc_b_r"], path
+
+    reference_distance, reference, path = cumulative_localisation("uniform", 1002)
+
+    errors = {}
+    for output_sampling in ("uniform", "adaptive"):
+        distance, cum_loc_b_r, _ = cumulative_localisation(output_sampling, 102)
+        errors[output_sampling] = np.max(
+            np.abs(np.interp(reference_distance, distance, cum_loc_b_r) - reference)
+        )
+    assert errors["adaptive"] < 0.5 * errors["uniform"]
+
+    trajectory = BeamTrajectory.load(path / "beam_trajectory.npz")
+    tau = trajectory.sample_tau(n_points=500, tolerance=1e-3)
+    assert 3 <= len(tau) < 500
+    assert np.all(np.diff(tau) > 0)
+    assert_allclose(tau[[0, -1]], [trajectory.tau_start, trajectory.tau_end])
+    assert len(trajectory.sample_tau(tolerance=1e-5)) > len(tau)
+
+    with pytest.raises(ValueError):
+        trajectory.sample_tau()
+    with pytest.raises(ValueError, match="output_sampling"):
+        beam_me_up(**kwargs_dict, output_sampling="adaptive", integrator="RK45")
+
+
+@pytest.mark.parametrize("single_pass", [False, True])
+def test_localisation_tolerance(tmp_path, capsys, single_pass):
+    kwargs_dict = get_parameters_for_Scotty("DBS_synthetic")
+    kwargs_dict["find_B_method"] = "unit-tests"
+    kwargs_dict["figure_flag"] = False
+    kwargs_dict["output_path"] = tmp_path
+
+    def run(localisation_tolerance):
+        beam_me_up(
+            **kwargs_dict,
+            single_pass=single_pass,
+            localisation_tolerance=localisation_tolerance,
+        )
+        output = capsys.readouterr().out
+        evaluations = int(
+            output.split("Number of beam evolution evaluations: ")[1].split()[0]
+        )
+        with np.load(tmp_path / "analysis_output.npz") as f:
+            cum_loc_b_r_s = f["cum_loc_b_r_s"]
+        with np.load(tmp_path / "solver_output.npz") as f:
+            tau_array = f["tau_array"]
+        return evaluations, cum_loc_b_r_s, tau_array, output
+
+    evaluations, expected, expected_tau, _ = run(None)
+    early_evaluations, cum_loc_b_r_s, tau_array, output = run(0.03)
+
+    assert "Localisation converged" in output or single_pass
+    assert len(tau_array) == len(expected_tau)
+    assert tau_array[-1] < expected_tau[-1]
+    # A single pass shares its ramp up from the first step with the
+    # full run, so saves less
+    assert early_evaluations < (0.85 if single_pass else 0.8) * evaluations
+    # Most of the localisation is still included
+    assert_allclose(np.ptp(cum_loc_b_r_s), np.ptp(expected), rtol=0.03)
+
+    with pytest.raises(ValueError, match="localisation_tolerance"):
+        beam_me_up(**kwargs_dict, localisation_tolerance=0.03, integrator="RK45")